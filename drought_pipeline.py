@@ -1,4 +1,6 @@
 from droughtpipeline.pipeline import Pipeline
+from droughtpipeline.batch import run_countries
+from droughtpipeline.context import RunContext, new_run_id
 from droughtpipeline.secrets import Secrets
 from droughtpipeline.settings import Settings
 from datetime import date, datetime, timedelta
@@ -8,16 +10,51 @@ import click
 
 @click.command()
 @click.option("--country", help="country ISO3", default="LSO")
+@click.option(
+    "--countries",
+    help="run several countries in parallel: 'all' or comma-separated ISO3 codes",
+    default=None,
+)
+@click.option(
+    "--workers",
+    help="countries (--countries) or months (--from/--to) run in parallel, default batch_max_workers or backfill_max_workers",
+    default=None,
+    type=int,
+)
 @click.option("--prepare", help="prepare ECMWF data", default=False, is_flag=True)
 @click.option("--extract", help="extract ECMWF data", default=False, is_flag=True)
 @click.option("--forecast", help="forecast drought", default=False, is_flag=True)
 @click.option("--send", help="send to IBF", default=False, is_flag=True)
 @click.option("--save", help="save to storage", default=False, is_flag=True)
+@click.option(
+    "--backtest",
+    help="backtest the trigger model on the hindcast used by the extract step, after --prepare",
+    default=False,
+    is_flag=True,
+)
 @click.option(
     "--yearmonth",
     help="year-month in ISO 8601",
     default=date.today().strftime("%Y-%m"),
 )
+@click.option(
+    "--from",
+    "yearmonth_from",
+    help="backfill: first year-month in ISO 8601, instead of --yearmonth",
+    default=None,
+)
+@click.option(
+    "--to",
+    "yearmonth_to",
+    help="backfill: last year-month in ISO 8601, default --from",
+    default=None,
+)
+@click.option(
+    "--run-id",
+    help="id of the run, used in its working directory data/runs/<country>/<yearmonth>/<run-id>;"
+    " 'default' if not given (unique for --countries and --from/--to)",
+    default=None,
+)
 @click.option(
     "--debug",
     help="debug mode: process data with mock scenario threshold",
@@ -27,13 +64,42 @@ import click
 
 
 def run_drought_pipeline(
-    country, prepare, extract, forecast, send, save, yearmonth, debug
+    country, countries, workers, prepare, extract, forecast, send, save, backtest, yearmonth, yearmonth_from, yearmonth_to, run_id, debug
 ):
     datestart = format_date(yearmonth)
+    dateend = None
+    if yearmonth_from is not None:
+        datestart = format_date(yearmonth_from)
+        dateend = format_date(yearmonth_to or yearmonth_from)
+    elif yearmonth_to is not None:
+        raise click.UsageError("--to needs --from")
+    if dateend is not None and run_id is None:
+        run_id = new_run_id()  # a backfill gets its own directories
+    if countries is not None:
+        results = run_countries(
+            countries,
+            settings_path="config/config.yaml",
+            secrets_path=".env",
+            max_workers=workers,
+            run_id=run_id,
+            datestart=datestart,
+            dateend=dateend,
+            prepare=prepare,
+            extract=extract,
+            forecast=forecast,
+            send=send,
+            save=save,
+            debug=debug,
+            backtest=backtest,
+        )
+        if any(result["status"] != "success" for result in results):
+            raise SystemExit(1)
+        return
     pipe = Pipeline(
         country=country,
         settings=Settings("config/config.yaml"),
         secrets=Secrets(".env"),
+        context=RunContext(country=country, yearmonth=datestart.strftime("%Y-%m"), run_id=run_id),
     )
     pipe.run_pipeline(
         prepare=prepare,
@@ -42,7 +108,10 @@ def run_drought_pipeline(
         send=send,
         save=save,
         debug=debug,
-        datestart=datestart
+        backtest=backtest,
+        datestart=datestart,
+        dateend=dateend,
+        max_workers=workers,
     )
 
 def format_date(yearmonth: str) -> datetime:
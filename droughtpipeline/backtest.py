@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from droughtpipeline.zonal import CoverageWeights
+
+BACKTEST_OUTCOMES = ["hit", "false_alarm", "miss", "correct_rejection"]
+
+
+def leave_one_out_quantile(values: np.ndarray, q: float) -> np.ndarray:
+    """
+    Quantile q (linear interpolation, as numpy and xarray) of the values of all years
+    but one, for each year left out, at once.
+    The values are sorted once; the k-th smallest value without the members of a year
+    is found from the sorted positions of these members, instead of sorting again per year.
+    Parameters:
+        values (np.ndarray): values with dimensions (year, member, ...)
+        q (float): quantile, between 0 and 1
+    Returns:
+        np.ndarray: quantile with dimensions (year, ...), NaN where any value is NaN
+    """
+    values = np.asarray(values, dtype=float)
+    n_years, n_members = values.shape[:2]
+    if n_years < 2:
+        raise ValueError("At least two years are needed for a leave-one-out quantile")
+    flat = values.reshape((n_years * n_members, -1))
+    order = np.argsort(flat, axis=0, kind="stable")
+    sorted_values = np.take_along_axis(flat, order, axis=0)
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(flat.shape[0])[:, None], axis=0)
+    # d: number of kept values before each left-out value, per year (nondecreasing)
+    removed = np.sort(rank.reshape((n_years, n_members, -1)), axis=1)
+    kept_before = removed - np.arange(n_members)[None, :, None]
+
+    n_kept = flat.shape[0] - n_members
+    position = q * (n_kept - 1)
+    lower = int(np.floor(position))
+    upper = min(lower + 1, n_kept - 1)
+
+    def kth_kept(k):
+        index = k + (kept_before <= k).sum(axis=1)
+        return np.take_along_axis(sorted_values, index, axis=0)
+
+    low, high = kth_kept(lower), kth_kept(upper)
+    quantile = low + (position - lower) * (high - low)
+    quantile[:, np.isnan(flat).any(axis=0)] = np.nan
+    return quantile.reshape((n_years,) + values.shape[2:])
+
+
+def stack_weights(weights: list) -> CoverageWeights:
+    """Weights of several single polygons (e.g. climate regions) on one grid, one polygon each"""
+    shapes = {w.shape for w in weights}
+    if len(shapes) != 1:
+        raise ValueError("Weights must be on the same grid")
+    return CoverageWeights(
+        polygon=np.concatenate([np.full(w.polygon.size, i, dtype=np.int64) for i, w in enumerate(weights)]),
+        cell=np.concatenate([w.cell for w in weights]),
+        fraction=np.concatenate([w.fraction for w in weights]),
+        n_polygons=len(weights),
+        shape=shapes.pop(),
+    )
+
+
+def backtest_trigger_model(
+    tprate_hindcast: xr.DataArray,
+    region_weights: CoverageWeights,
+    quantile_thr: float,
+    trigger_on_minimum_probability: float,
+    trigger_on_minimum_admin_area_in_drought_extent: float,
+) -> xr.Dataset:
+    """
+    Backtest the trigger model on the hindcast: each hindcast year is taken as the
+    forecast and compared with the lower tercile of the other years, as the extract
+    step does, for all years, forecast months and climate regions at once.
+    There is no observed rainfall in the pipeline, so the hindcast ensemble mean of
+    the year stands in for it: a drought is observed if the regional mean is below
+    the lower tercile of the regional means of the other years.
+    Parameters:
+        tprate_hindcast (xarray.DataArray): hindcast precipitation (mm), with
+            dimensions number, time, forecastMonth, latitude, longitude
+        region_weights (CoverageWeights): weights of the climate regions on the hindcast grid
+        quantile_thr (float): quantile of the lower tercile
+        trigger_on_minimum_probability (float): minimum probability of drought extent
+        trigger_on_minimum_admin_area_in_drought_extent (float): minimum share of
+            the climate region in drought extent to trigger
+    Returns:
+        xarray.Dataset: likelihood, drought_area, triggered and drought,
+            with dimensions year, forecastMonth, climate_region
+    """
+    tprate = tprate_hindcast.transpose("time", "number", "forecastMonth", "latitude", "longitude")
+    values = tprate.values
+
+    # probability below the leave-one-out lower tercile per grid cell, as compute_lower_tercile_probability
+    tercile_lower = leave_one_out_quantile(values, quantile_thr)
+    probability = (values <= tercile_lower[:, None]).sum(axis=1) / values.shape[1]
+    probability = np.where(np.isnan(tercile_lower), np.nan, probability)
+    likelihood = region_weights.median(probability)
+    drought_area = region_weights.share(
+        np.where(np.isnan(probability), np.nan, probability > trigger_on_minimum_probability)
+    )
+    triggered = drought_area > trigger_on_minimum_admin_area_in_drought_extent
+
+    region_mean = region_weights.mean(values.mean(axis=1))
+    drought = region_mean < leave_one_out_quantile(region_mean[:, None], quantile_thr)
+
+    dims = ("year", "forecastMonth", "climate_region")
+    return xr.Dataset(
+        {
+            "likelihood": (dims, likelihood),
+            "drought_area": (dims, drought_area),
+            "triggered": (dims, triggered),
+            "drought": (dims, drought),
+        },
+        coords={
+            "year": pd.to_datetime(tprate.time.values).year,
+            "forecastMonth": tprate.forecastMonth.values,
+        },
+        attrs={
+            "quantile": quantile_thr,
+            "trigger_on_minimum_probability": trigger_on_minimum_probability,
+            "trigger_on_minimum_admin_area_in_drought_extent": trigger_on_minimum_admin_area_in_drought_extent,
+        },
+    )
+
+
+def classify_outcome(triggered: np.ndarray, drought: np.ndarray) -> np.ndarray:
+    """Outcome of each trigger: hit, false_alarm, miss or correct_rejection"""
+    triggered, drought = np.asarray(triggered, dtype=bool), np.asarray(drought, dtype=bool)
+    return np.select(
+        [triggered & drought, triggered & ~drought, ~triggered & drought],
+        BACKTEST_OUTCOMES[:3],
+        default=BACKTEST_OUTCOMES[3],
+    )
+
+
+def get_backtest_scores(outcomes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Hit/false alarm table: number of each outcome, hit rate and false alarm ratio
+    per climate region and lead time
+    """
+    keys = ["climate_region_code", "climate_region_name", "lead_time"]
+    scores = (
+        outcomes.groupby(keys)["outcome"]
+        .value_counts()
+        .unstack(fill_value=0)
+        .reindex(columns=BACKTEST_OUTCOMES, fill_value=0)
+        .reset_index()
+    )
+    scores.columns.name = None
+    triggers = scores["hit"] + scores["false_alarm"]
+    droughts = scores["hit"] + scores["miss"]
+    scores["hit_rate"] = (scores["hit"] / droughts.where(droughts > 0)).round(2)
+    scores["false_alarm_ratio"] = (scores["false_alarm"] / triggers.where(triggers > 0)).round(2)
+    return scores
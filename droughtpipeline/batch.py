@@ -0,0 +1,185 @@
+from droughtpipeline.context import RunContext, new_run_id
+from droughtpipeline.load import Load
+from droughtpipeline.pipeline import Pipeline
+from droughtpipeline.secrets import Secrets, is_url
+from droughtpipeline.settings import Settings
+from droughtpipeline.utils import get_year_months
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+import multiprocessing
+import traceback
+import logging
+import json
+import time
+import os
+
+DEFAULT_BATCH_DIR = "./data/batch"
+
+
+def get_countries(settings: Settings, countries: str) -> list:
+    """Countries to run: 'all' configured countries or a comma-separated list of ISO3 codes"""
+    configured = [c["name"] for c in settings.get_setting("countries")]
+    if countries.strip().lower() == "all":
+        return configured
+    selected = [country.strip().upper() for country in countries.split(",") if country.strip()]
+    unknown = [country for country in selected if country not in configured]
+    if unknown:
+        raise ValueError(f"No config found for countries {', '.join(unknown)}")
+    return selected
+
+
+def get_batch_max_workers(settings: Settings, n_countries: int) -> int:
+    """Number of countries run in parallel: batch_max_workers, at most one per country"""
+    try:
+        max_workers = int(settings.get_setting("batch_max_workers"))
+    except ValueError:
+        max_workers = os.cpu_count() or 1
+    return max(min(max_workers, n_countries), 1)
+
+
+def prefetch_boundaries(settings: Settings, secrets: Secrets, countries: list):
+    """
+    Fetch the admin boundaries of all countries into the boundary store once,
+    so that the country runs read them from disk instead of the IBF API
+    """
+    try:
+        load = Load(settings=settings, secrets=secrets)
+    except Exception as e:  # the country runs report the error
+        logging.warning(f"could not prefetch admin boundaries: {e}")
+        return
+    for country in countries:
+        try:
+            for adm_level in settings.get_country_setting(country, "admin-levels"):
+                load.get_adm_boundaries(country, adm_level)
+            load.get_country_outline(country)
+        except Exception as e:  # the country run fetches them itself
+            logging.warning(f"could not prefetch admin boundaries of {country}: {e}")
+    if load.ibf_api_client is not None:
+        load.ibf_api_client.close()
+
+
+def prefetch_ecmwf_data(settings: Settings, secrets: Secrets, countries: list, datestart: date):
+    """
+    Download the ECMWF data of all countries into the cache, merged into as few
+    CDS domains as possible; the country runs slice their own area out of them
+    """
+    try:
+        load = Load(settings=settings, secrets=secrets)
+        domains = load.prefetch_ecmwf_forecast(countries, datestart.strftime("%Y"), datestart.strftime("%m"))
+    except Exception as e:  # the country runs download their own area
+        logging.warning(f"could not prefetch ECMWF data: {e}")
+        return
+    logging.info(f"prefetched ECMWF data of {len(countries)} countries in {len(domains)} CDS domains")
+
+
+def run_country(country: str, settings_path: str, secrets_path: str, context: RunContext, options: dict) -> dict:
+    """
+    Run the pipeline of one country in its own working directory (worker process);
+    return its status instead of raising, so that one failure does not stop the batch
+    """
+    start = time.time()
+    result = {"country": country, "status": "success", "error": None}
+    try:
+        pipe = Pipeline(
+            country=country,
+            settings=Settings(settings_path),
+            secrets=Secrets(secrets_path),
+            context=context,
+        )
+        pipe.run_pipeline(**options)
+    except Exception as e:
+        logging.error(f"pipeline of {country} failed: {e}")
+        result["status"] = "failed"
+        result["error"] = "".join(traceback.format_exception_only(type(e), e)).strip()
+        logging.debug(traceback.format_exc())
+    result["duration_s"] = round(time.time() - start, 1)
+    result["work_dir"] = context.work_dir
+    return result
+
+
+def format_summary(results: list) -> str:
+    """Summary report of a batch run, one line per country"""
+    lines = [f"{'country':<8}{'status':<10}{'duration':>10}  error"]
+    for result in sorted(results, key=lambda r: r["country"]):
+        lines.append(
+            f"{result['country']:<8}{result['status']:<10}{result['duration_s']:>9.1f}s  {result['error'] or ''}"
+        )
+    failed = [r["country"] for r in results if r["status"] != "success"]
+    lines.append(f"{len(results) - len(failed)}/{len(results)} countries succeeded")
+    return "\n".join(lines)
+
+
+def run_countries(
+    countries: str,
+    settings_path: str,
+    secrets_path: str,
+    batch_dir: str = DEFAULT_BATCH_DIR,
+    max_workers: int = None,
+    run_id: str = None,
+    datestart: date = date.today(),
+    **options,
+) -> list:
+    """
+    Run the pipeline of several countries in a process pool, each in its own
+    working directory batch_dir/<country>/<yearmonth>/<run_id>, and write a summary report.
+    Parameters:
+        countries (str): 'all' or comma-separated ISO3 codes
+        settings_path (str): path of the configuration file
+        secrets_path (str): path (or Azure Key Vault URL) of the secrets
+        batch_dir (str): directory of the country working directories and the summary
+        max_workers (int): countries run in parallel, batch_max_workers setting if None
+        run_id (str): id of the batch run, shared by all countries; unique if None
+        datestart (date): start date of the forecast, passed to all countries
+            (the first month if dateend is given in options, to backfill)
+        options: further options of Pipeline.run_pipeline (prepare, extract, ...)
+    Returns:
+        list: result (country, status, error, duration) per country
+    """
+    settings_path = os.path.abspath(settings_path)
+    if not is_url(secrets_path):
+        secrets_path = os.path.abspath(secrets_path)
+    settings = Settings(settings_path)
+    countries = get_countries(settings, countries)
+    if max_workers is None:
+        max_workers = get_batch_max_workers(settings, len(countries))
+    batch_dir = os.path.abspath(batch_dir)
+    run_id = run_id or new_run_id()
+    yearmonth = datestart.strftime("%Y-%m")
+
+    prefetch_boundaries(settings, Secrets(secrets_path), countries)
+    if options.get("prepare"):
+        for month in get_year_months(datestart, options.get("dateend") or datestart):
+            prefetch_ecmwf_data(settings, Secrets(secrets_path), countries, month)
+
+    logging.info(f"running {', '.join(countries)} with {max_workers} workers, run {run_id}")
+    options = {**options, "datestart": datestart}
+    results = []
+    # spawn: worker processes do not inherit the threads and connections of this one
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {
+            executor.submit(
+                run_country,
+                country,
+                settings_path,
+                secrets_path,
+                RunContext(country=country, yearmonth=yearmonth, run_id=run_id, base_dir=batch_dir),
+                options,
+            ): country
+            for country in countries
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:  # e.g. the worker process died
+                result = {"country": futures[future], "status": "failed", "error": str(e), "duration_s": 0.0}
+            logging.info(f"pipeline of {result['country']}: {result['status']}")
+            results.append(result)
+
+    summary = format_summary(results)
+    logging.info(f"batch run summary:\n{summary}")
+    os.makedirs(batch_dir, exist_ok=True)
+    summary_path = os.path.join(batch_dir, f"summary_{yearmonth}_{run_id}.json")
+    with open(summary_path, "w") as file:
+        json.dump(sorted(results, key=lambda r: r["country"]), file, indent=2)
+    logging.info(f"batch run summary written to {summary_path}")
+    return results
@@ -0,0 +1,96 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import geopandas as gpd
+
+BOUNDARY_DRIVER = "FlatGeobuf"
+BOUNDARY_SUFFIX = ".fgb"
+
+# boundaries already loaded in this process, shared by all stores
+_boundaries_memo = {}
+_boundaries_lock = threading.Lock()
+
+
+class BoundaryStore:
+    """
+    Local store of country and admin boundaries, persisted as FlatGeobuf files
+    on the cache directory and kept in memory once loaded
+    """
+
+    def __init__(self, cache_dir: str, fetch_adm_boundaries, ttl_days: float = 30):
+        """
+        Args:
+            cache_dir (str): cache directory
+            fetch_adm_boundaries: function (country, adm_level) -> GeoDataFrame
+                returning admin areas from the source (IBF API)
+            ttl_days (float): days after which stored boundaries are fetched again
+        """
+        self.cache_dir = os.path.join(cache_dir, "boundaries")
+        self.fetch_adm_boundaries = fetch_adm_boundaries
+        self.ttl = ttl_days * 24 * 60 * 60
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_path(self, country: str, name: str) -> str:
+        """Path of stored boundaries"""
+        return os.path.join(self.cache_dir, f"{country.upper()}_{name}{BOUNDARY_SUFFIX}")
+
+    def is_fresh(self, path: str) -> bool:
+        """Check if stored boundaries exist and are not expired"""
+        return os.path.exists(path) and time.time() - os.path.getmtime(path) < self.ttl
+
+    def read(self, path: str) -> gpd.GeoDataFrame:
+        gdf = gpd.read_file(path)
+        if gdf.crs is None:
+            gdf.set_crs(epsg=4326, inplace=True)
+        return gdf
+
+    def write(self, gdf: gpd.GeoDataFrame, path: str):
+        """Write boundaries atomically, so that parallel runs never read partial files"""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=BOUNDARY_SUFFIX)
+        os.close(fd)
+        os.remove(temp_path)  # the driver does not overwrite existing files
+        gdf.to_file(temp_path, driver=BOUNDARY_DRIVER)
+        os.replace(temp_path, path)
+
+    def _get(self, country: str, name: str, build) -> gpd.GeoDataFrame:
+        """Get boundaries from memory, then from disk, then build and store them"""
+        path = self.get_path(country, name)
+        with _boundaries_lock:
+            if path in _boundaries_memo:
+                return _boundaries_memo[path]
+        if self.is_fresh(path):
+            gdf = self.read(path)
+        else:
+            gdf = build()
+            try:
+                self.write(gdf, path)
+            except Exception as e:
+                logging.warning(f"could not store boundaries in {path}: {e}")
+        with _boundaries_lock:
+            _boundaries_memo[path] = gdf
+        return gdf
+
+    def get_country_outline(self, country: str) -> gpd.GeoDataFrame:
+        """Get admin-0 outline of a country, dissolved from its admin level 1 areas"""
+
+        def build():
+            logging.info(f"building country outline of {country} from admin level 1 boundaries")
+            adm1 = self.get_adm_boundaries(country, 1)
+            outline = adm1[["geometry"]].dissolve()
+            outline["geometry"] = outline.geometry.buffer(0)  # fix invalid geometries
+            outline["country"] = country
+            return outline.to_crs("EPSG:4326")
+
+        return self._get(country, "adm0", build)
+
+    def get_adm_boundaries(self, country: str, adm_level: int) -> gpd.GeoDataFrame:
+        """Get admin areas of a country and admin level, fetched from the source at most once per TTL"""
+
+        def build():
+            logging.info(f"fetching admin level {adm_level} boundaries of {country}")
+            return self.fetch_adm_boundaries(country, adm_level)
+
+        # a copy, so that callers cannot modify the boundaries shared by this process
+        return self._get(country, f"adm{adm_level}", build).copy()
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, fall back to unlocked access
+    fcntl = None
+
+DEFAULT_CACHE_DIR = "./data/cache"
+CACHE_DIR_ENV = "DROUGHT_CACHE_DIR"
+
+# checksums of files already read in this process, per file identity and version
+_checksum_memo = {}
+_checksum_lock = threading.Lock()
+
+
+def get_cache_key(**fields) -> str:
+    """Return a stable hash of the given key fields"""
+    key = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def get_file_checksum(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Return the sha256 checksum of a file, read in chunks"""
+    checksum = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def get_file_version(file_path: str) -> str:
+    """
+    Return the sha256 checksum of a file, read once per process as long as the
+    file (or a hard link to it) is not modified
+    """
+    stat = os.stat(file_path)
+    memo_key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _checksum_lock:
+        if memo_key in _checksum_memo:
+            return _checksum_memo[memo_key]
+    checksum = get_file_checksum(file_path)
+    with _checksum_lock:
+        _checksum_memo[memo_key] = checksum
+    return checksum
+
+
+def area_contains(outer: list, inner: list) -> bool:
+    """Check if an area (North, West, South, East) contains another one"""
+    return (
+        float(outer[0]) >= float(inner[0])
+        and float(outer[1]) <= float(inner[1])
+        and float(outer[2]) <= float(inner[2])
+        and float(outer[3]) >= float(inner[3])
+    )
+
+
+def covers_request(cached_request: dict, request: dict) -> bool:
+    """Check if a cached CDS request is the same as a request, except for a larger area"""
+    if not cached_request or "area" not in cached_request:
+        return False
+    fields = set(cached_request) | set(request)
+    return all(
+        cached_request.get(field) == request.get(field) for field in fields if field != "area"
+    ) and area_contains(cached_request["area"], request["area"])
+
+
+def get_cache_dir(settings=None) -> str:
+    """Return the cache directory: environment variable, then settings, then default"""
+    cache_dir = os.getenv(CACHE_DIR_ENV)
+    if cache_dir is None and settings is not None:
+        try:
+            cache_dir = settings.get_setting("cache_dir")
+        except ValueError:
+            pass
+    return cache_dir or DEFAULT_CACHE_DIR
+
+
+def get_cache_max_size(settings, setting: str) -> int:
+    """Maximum size (bytes) of a cache from a setting in GB, None (unbounded) if not set"""
+    if settings is None:
+        return None
+    try:
+        return int(float(settings.get_setting(setting)) * 1024**3)
+    except ValueError:
+        return None
+
+
+class FileCache:
+    """
+    Content-addressed file cache on a (mountable) directory,
+    with integrity checks and size-bounded LRU eviction
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = None, suffix: str = ""):
+        self.cache_dir = cache_dir
+        self.max_size = max_size  # bytes, unbounded if None
+        self.suffix = suffix
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_path(self, key: str) -> str:
+        """Return path of the cached file for a key"""
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    @contextmanager
+    def _lock(self):
+        """Lock the cache index across processes"""
+        with open(os.path.join(self.cache_dir, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_index(self) -> dict:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (ValueError, OSError):
+            logging.warning(f"cache index {self.index_path} is corrupt, resetting it")
+            return {}
+
+    def _write_index(self, index: dict):
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w") as file:
+            json.dump(index, file, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def contains(self, key: str) -> bool:
+        """Check if a key is in the cache, without validating it"""
+        with self._lock():
+            return key in self._read_index() and os.path.exists(self.get_path(key))
+
+    def get(self, key: str, target: str = None, validate: bool = True) -> str:
+        """
+        Return the path of the cached file for a key, or None on a miss.
+        If target is given, copy the cached file there and return target.
+        Entries failing the integrity check are evicted and reported as a miss.
+        """
+        with self._lock():
+            index = self._read_index()
+            entry = index.get(key)
+            path = self.get_path(key)
+            if entry is None:
+                return None
+            if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+                logging.warning(f"cache entry {key} is missing or incomplete, evicting it")
+                self._remove(index, key)
+                self._write_index(index)
+                return None
+            if validate and get_file_checksum(path) != entry["sha256"]:
+                logging.warning(f"cache entry {key} failed integrity check, evicting it")
+                self._remove(index, key)
+                self._write_index(index)
+                return None
+            entry["last_access"] = time.time()
+            self._write_index(index)
+            if target is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+                shutil.copyfile(path, target)
+                return target
+            return path
+
+    def put(self, key: str, source: str, metadata: dict = None) -> str:
+        """Copy a file into the cache under a key and return the cached path"""
+        path = self.get_path(key)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        os.close(fd)
+        shutil.copyfile(source, temp_path)
+        entry = {
+            "sha256": get_file_checksum(temp_path),
+            "size": os.path.getsize(temp_path),
+            "last_access": time.time(),
+            "metadata": metadata or {},
+        }
+        with self._lock():
+            os.replace(temp_path, path)
+            index = self._read_index()
+            index[key] = entry
+            self._evict_lru(index, keep=key)
+            self._write_index(index)
+        return path
+
+    def find(self, match) -> str:
+        """Key of the first entry whose metadata satisfies match(metadata), None if there is none"""
+        with self._lock():
+            index = self._read_index()
+        for key, entry in index.items():
+            if match(entry.get("metadata") or {}):
+                return key
+        return None
+
+    def evict(self, key: str):
+        """Remove a key from the cache"""
+        with self._lock():
+            index = self._read_index()
+            self._remove(index, key)
+            self._write_index(index)
+
+    def _remove(self, index: dict, key: str):
+        index.pop(key, None)
+        if os.path.exists(self.get_path(key)):
+            os.remove(self.get_path(key))
+
+    def _evict_lru(self, index: dict, keep: str = None):
+        """Evict least recently used entries until the cache fits in max_size"""
+        if self.max_size is None:
+            return
+        total_size = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_access"]):
+            if total_size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            total_size -= index[key]["size"]
+            logging.info(f"evicting cache entry {key} from {self.cache_dir}")
+            self._remove(index, key)
+
+
+class HindcastCache(FileCache):
+    """Cache of ECMWF SEAS5 hindcast GRIB files, which never change for a given request"""
+
+    def __init__(self, cache_dir: str, max_size: int = None):
+        super().__init__(os.path.join(cache_dir, "hindcast"), max_size=max_size, suffix=".grib")
+
+    @staticmethod
+    def get_key(system: str, month, leadtime_months: list, area: list) -> str:
+        """Cache key of a hindcast: system, start month, lead months and area bbox"""
+        return get_cache_key(
+            system=str(system),
+            month=f"{int(month):02}",
+            leadtime_months=sorted(int(x) for x in leadtime_months),
+            area=[float(x) for x in area],
+        )
+
+    @staticmethod
+    def get_key_from_request(request: dict) -> str:
+        """Cache key of a CDS hindcast request"""
+        return HindcastCache.get_key(
+            system=request["system"],
+            month=request["month"][0],
+            leadtime_months=request["leadtime_month"],
+            area=request["area"],
+        )
+
+
+class ForecastCache(FileCache):
+    """Cache of ECMWF SEAS5 forecast GRIB files, per CDS request (start year, month and area)"""
+
+    def __init__(self, cache_dir: str, max_size: int = None):
+        super().__init__(os.path.join(cache_dir, "forecast"), max_size=max_size, suffix=".grib")
+
+    @staticmethod
+    def get_key_from_request(request: dict) -> str:
+        """Cache key of a CDS forecast request"""
+        return get_cache_key(**request)
@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import base64
+import logging
+import threading
+import requests
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import azure.cosmos.cosmos_client as cosmos_client
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+COSMOS_USER_AGENT = "ibf-drought-pipeline"
+COSMOS_MAX_BATCH_SIZE = 100  # maximum number of operations in a Cosmos DB transactional batch
+
+# Cosmos DB clients of this process, per account URL
+_cosmos_clients = {}
+_cosmos_clients_lock = threading.Lock()
+
+# locks of the files being downloaded by fetch_file in this process, per path
+_fetch_locks = defaultdict(threading.Lock)
+_fetch_locks_lock = threading.Lock()
+
+
+def get_token_expiry(token: str) -> float:
+    """Expiry time (unix seconds) of a JWT, None if it cannot be read"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class IBFAPIClient:
+    """
+    Client of the IBF API: logs in once, keeps the token until it expires
+    (or the API rejects it) and reuses a pooled keep-alive session for all requests
+    """
+
+    def __init__(self, url: str, user: str, password: str, pool_maxsize: int = 10, expiry_margin: float = 60):
+        """
+        Args:
+            url (str): IBF API URL, ending with a slash
+            user (str): IBF API user (email)
+            password (str): IBF API password
+            pool_maxsize (int): maximum number of connections kept open
+            expiry_margin (float): seconds before expiry after which the token is renewed
+        """
+        self.url = url
+        self.user = user
+        self.password = password
+        self.expiry_margin = expiry_margin
+        self.token = None
+        self.token_expiry = None
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        retry = Retry(connect=3, backoff_factor=0.5)
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def authenticate(self) -> str:
+        """Log in to the IBF API and return a new token"""
+        no_attempts, attempt, login_response = 5, 0, None
+        while attempt < no_attempts:
+            try:
+                login_response = self.session.post(
+                    self.url + "user/login",
+                    data=[
+                        ("email", self.user),
+                        ("password", self.password),
+                    ],
+                )
+                break
+            except requests.exceptions.ConnectionError:
+                attempt += 1
+                logging.warning(
+                    "IBF API currently not available, trying again in 1 minute"
+                )
+                time.sleep(60)
+        if not login_response:
+            raise ConnectionError("IBF API not available")
+        return login_response.json()["user"]["token"]
+
+    def get_token(self, renew: bool = False) -> str:
+        """Return the cached token, logging in again if it is missing, expired or renew is set"""
+        with self.lock:
+            expired = self.token_expiry is not None and time.time() > self.token_expiry - self.expiry_margin
+            if renew or self.token is None or expired:
+                self.token = self.authenticate()
+                self.token_expiry = get_token_expiry(self.token)
+            return self.token
+
+    def invalidate_token(self, token: str):
+        """Drop the cached token if it is the given (rejected) one"""
+        with self.lock:
+            if self.token == token:
+                self.token = None
+
+    def request(self, method: str, path: str, headers: dict = None, **kwargs) -> requests.Response:
+        """Send an authenticated request; on 401, log in again and retry once"""
+        for attempt in range(2):
+            token = self.get_token()
+            r = self.session.request(
+                method,
+                self.url + path,
+                headers={**(headers or {}), "Authorization": "Bearer " + token},
+                **kwargs,
+            )
+            if r.status_code != 401 or attempt > 0:
+                return r
+            logging.info("IBF API token rejected, logging in again")
+            self.invalidate_token(token)
+        return r
+
+    def post(self, path: str, body: dict = None, files: dict = None) -> requests.Response:
+        if body is not None:
+            headers = {
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            }
+        elif files is not None:
+            headers = {}
+        else:
+            raise ValueError("No body or files provided")
+        return self.request("POST", path, headers=headers, json=body, files=files)
+
+    def get(self, path: str, parameters: dict = None) -> requests.Response:
+        return self.request("GET", path, headers={"Accept": "*/*"}, params=parameters)
+
+    def close(self):
+        self.session.close()
+
+
+class UploadPool:
+    """
+    Bounded pool of concurrent IBF API uploads, with an optional
+    concurrency limit per endpoint
+    """
+
+    def __init__(self, post, max_workers: int = 8, endpoint_limits: dict = None):
+        """
+        Args:
+            post: function (path, body=None, files=None) sending one request
+            max_workers (int): maximum number of concurrent uploads
+            endpoint_limits (dict): endpoint path -> maximum number of concurrent uploads
+        """
+        self.post = post
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ibf-upload")
+        self.endpoint_limits = {
+            path: threading.BoundedSemaphore(limit) for path, limit in (endpoint_limits or {}).items()
+        }
+        self.futures = []
+
+    def _post(self, path: str, kwargs: dict):
+        limit = self.endpoint_limits.get(path)
+        if limit is None:
+            return self.post(path, **kwargs)
+        with limit:
+            return self.post(path, **kwargs)
+
+    def submit(self, path: str, **kwargs):
+        """Queue an upload to an endpoint"""
+        self.futures.append(self.executor.submit(self._post, path, kwargs))
+
+    def wait(self):
+        """Wait for all queued uploads to finish, raise the first error if any failed"""
+        futures, self.futures = self.futures, []
+        wait(futures)
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+
+    def cancel(self):
+        """Cancel the queued uploads that have not started yet"""
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.cancel()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None:
+            self.cancel()
+        self.close()
+
+
+def get_cosmos_client(url: str, key: str) -> cosmos_client.CosmosClient:
+    """Cosmos DB client shared by the whole process, with its connection pool"""
+    with _cosmos_clients_lock:
+        if url not in _cosmos_clients:
+            _cosmos_clients[url] = cosmos_client.CosmosClient(
+                url,
+                {"masterKey": key},
+                user_agent=COSMOS_USER_AGENT,
+                user_agent_overwrite=True,
+            )
+        return _cosmos_clients[url]
+
+
+def execute_cosmos_batches(container, operations: list, partition_key: str, max_workers: int = 1):
+    """
+    Execute item operations, e.g. ("upsert", (record,)) or ("delete", (id,)),
+    as transactional batches of at most COSMOS_MAX_BATCH_SIZE operations
+    on one partition, max_workers batches at a time
+    """
+    batches = [
+        operations[i : i + COSMOS_MAX_BATCH_SIZE] for i in range(0, len(operations), COSMOS_MAX_BATCH_SIZE)
+    ]
+
+    def execute(batch):
+        return container.execute_item_batch(batch_operations=batch, partition_key=partition_key)
+
+    if max_workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            execute(batch)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cosmos-batch") as executor:
+            list(executor.map(execute, batches))
+
+
+@contextmanager
+def lock_path(path: str):
+    """Lock a file path across the threads of this process and across processes"""
+    path = os.path.abspath(path)
+    with _fetch_locks_lock:
+        thread_lock = _fetch_locks[path]
+    with thread_lock:
+        with open(path + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def fetch_file(url: str, path: str, chunk_size: int = 1024 * 1024, timeout: float = 60) -> str:
+    """
+    Download a file to path, streaming it to disk in chunks. The validators of the
+    download (ETag, Last-Modified) are kept next to the file, so that an unchanged
+    file is not downloaded again and an interrupted download is resumed.
+    Concurrent downloads to the same path (e.g. the months of a backfill) wait for
+    each other. Returns path.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with lock_path(path):
+        return _fetch_file(url, path, chunk_size=chunk_size, timeout=timeout)
+
+
+def _fetch_file(url: str, path: str, chunk_size: int, timeout: float) -> str:
+    metadata_path, partial_path = path + ".json", path + ".part"
+    metadata = {}
+    if os.path.exists(metadata_path):
+        try:
+            with open(metadata_path, "r") as file:
+                metadata = json.load(file)
+        except ValueError:
+            metadata = {}
+    if metadata.get("url") != url:
+        metadata = {"url": url}
+
+    headers = {}
+    complete = metadata.get("complete") and os.path.exists(path)
+    if complete:
+        # conditional request: skip the download if the file did not change
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+    elif os.path.exists(partial_path) and (metadata.get("etag") or metadata.get("last_modified")):
+        # resume an interrupted download, if the file did not change in the meantime
+        headers["Range"] = f"bytes={os.path.getsize(partial_path)}-"
+        headers["If-Range"] = metadata.get("etag") or metadata.get("last_modified")
+
+    try:
+        r = requests.get(url, headers=headers, stream=True, timeout=timeout)
+    except requests.exceptions.ConnectionError:
+        if complete:
+            logging.warning(f"{url} not available, using the downloaded file {path}")
+            return path
+        raise
+    with r:
+        if r.status_code == 304:
+            logging.info(f"{url} not modified, using the downloaded file {path}")
+            return path
+        if r.status_code == 404:
+            raise FileNotFoundError(f"{url} not found")
+        if r.status_code == 416 and os.path.exists(partial_path):  # partial download is complete or invalid, start again
+            os.remove(partial_path)
+            return _fetch_file(url, path, chunk_size=chunk_size, timeout=timeout)
+        r.raise_for_status()
+
+        resume = r.status_code == 206
+        if resume:
+            logging.info(f"resuming download of {url} from byte {os.path.getsize(partial_path)}")
+        metadata.update(
+            {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "complete": False,
+            }
+        )
+        with open(metadata_path, "w") as file:
+            json.dump(metadata, file)
+        with open(partial_path, "ab" if resume else "wb") as file:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+
+    os.replace(partial_path, path)
+    metadata["complete"] = True
+    with open(metadata_path, "w") as file:
+        json.dump(metadata, file)
+    return path
@@ -0,0 +1,152 @@
+import os
+import logging
+import tempfile
+import threading
+from collections import defaultdict
+import numpy as np
+import xarray as xr
+from droughtpipeline.cache import FileCache, get_cache_key
+
+# climatologies already loaded in this process, and locks so that each is computed once
+_climatology_memo = {}
+_climatology_locks = defaultdict(threading.Lock)
+_climatology_lock = threading.Lock()
+
+CLIMATOLOGY_AGGREGATIONS = {
+    "seasonal_rainfall_forecast": "1m",
+    "seasonal_rainfall_forecast_3m": "3m",
+}
+
+
+def subset_region(ds, region, latname='latitude', lonname='longitude'):
+    """Subset dataset to region (North, West, South, East)"""
+    lon1 = region[1] % 360
+    lon2 = region[3] % 360
+    if lon2 >= lon1:
+        mask_lon = (ds[lonname] <= lon2) & (ds[lonname] >= lon1)
+    else:
+        mask_lon = (ds[lonname] <= lon2) | (ds[lonname] >= lon1)
+
+    mask = (ds[latname] <= region[0]) & (ds[latname] >= region[2]) & mask_lon
+    subset = ds.where(mask, drop=True)
+
+    if lon2 < lon1:
+        subset[lonname] = (subset[lonname] + 180) % 360 - 180
+        subset = subset.sortby(subset[lonname])
+
+    return subset
+
+
+def rolling_3m_sum(ds):
+    """Sum each forecast month with the two following ones"""
+    return (
+        ds.shift(forecastMonth=-2)  # Shift data by 2 steps forward
+        .rolling(forecastMonth=3, min_periods=1)  # Apply rolling
+        .sum()  # Calculate sum for the rolling window
+    )
+
+
+def regional_mean(da: xr.DataArray) -> xr.DataArray:
+    """Latitude-weighted mean over the spatial dimensions"""
+    weights = np.cos(np.deg2rad(da.latitude))
+    return da.weighted(weights).mean(['latitude', 'longitude'])
+
+
+def compute_climatology(
+    tprate_hindcast: xr.DataArray,
+    quantile_thr: float,
+    regions: dict = None,
+) -> xr.Dataset:
+    """
+    Compute hindcast statistics needed to evaluate a forecast:
+    per grid cell lower tercile and mean, and per climate region
+    the P0/P33/P66/P100 thresholds of the regional mean anomaly.
+
+    Parameters:
+        tprate_hindcast (xarray.DataArray): hindcast precipitation (mm),
+            with dimensions number, time, forecastMonth, latitude, longitude
+        quantile_thr (float): quantile of the lower tercile
+        regions (dict): climate region code -> region (North, West, South, East)
+    Returns:
+        xarray.Dataset: climatology, with dimension forecastMonth
+    """
+    spatial_coords = ['forecastMonth', 'latitude', 'longitude']
+    tercile_lower = tprate_hindcast.quantile(quantile_thr, dim=["time", "number"])
+    hindcast_mean = tprate_hindcast.mean(["time", "number"])
+    climatology = xr.Dataset({
+        "tercile_lower": tercile_lower.reset_coords(
+            [c for c in tercile_lower.coords if c not in spatial_coords], drop=True),
+        "hindcast_mean": hindcast_mean.reset_coords(
+            [c for c in hindcast_mean.coords if c not in spatial_coords], drop=True),
+    })
+    if "numdays" in tprate_hindcast.coords:
+        climatology["numdays"] = ("forecastMonth", tprate_hindcast.numdays.values)
+
+    if regions:
+        codes = list(regions.keys())
+        thresholds = {"region_mean": [], "region_p0": [], "region_p33": [], "region_p66": [], "region_p100": []}
+        for code in codes:
+            hindcast_mean_region = regional_mean(subset_region(tprate_hindcast, regions[code]))
+            climate_mean = hindcast_mean_region.mean(['number', 'time'])
+            hindcast_anomalies = hindcast_mean_region - climate_mean
+            thresholds["region_mean"].append(climate_mean.values)
+            thresholds["region_p0"].append(hindcast_anomalies.min(['number', 'time']).values)
+            thresholds["region_p33"].append(hindcast_anomalies.quantile(1 / 3., ['number', 'time']).values)
+            thresholds["region_p66"].append(hindcast_anomalies.quantile(2 / 3., ['number', 'time']).values)
+            thresholds["region_p100"].append(hindcast_anomalies.max(['number', 'time']).values)
+        climatology = climatology.assign_coords(climate_region=codes)
+        for name, values in thresholds.items():
+            climatology[name] = (("climate_region", "forecastMonth"), np.stack(values))
+
+    climatology.attrs["quantile"] = quantile_thr
+    return climatology
+
+
+class ClimatologyStore(FileCache):
+    """Persistent store of hindcast climatologies (compact NetCDF files)"""
+
+    def __init__(self, cache_dir: str, max_size: int = None):
+        super().__init__(os.path.join(cache_dir, "climatology"), max_size=max_size, suffix=".nc")
+
+    @staticmethod
+    def get_key(hindcast_key: str, aggregation: str, quantile_thr: float, regions: dict = None) -> str:
+        """Cache key of a climatology: hindcast (start month and area), aggregation,
+        tercile quantile and climate region extents"""
+        return get_cache_key(
+            hindcast=hindcast_key,
+            aggregation=aggregation,
+            quantile=float(quantile_thr),
+            regions={str(k): [round(float(x), 6) for x in v] for k, v in (regions or {}).items()},
+        )
+
+    def lock(self, key: str) -> threading.Lock:
+        """Lock of a climatology, held while it is computed by one thread of this process"""
+        with _climatology_lock:
+            return _climatology_locks[self.get_path(key)]
+
+    def load(self, key: str) -> xr.Dataset:
+        """Load a climatology, return None if not in the store"""
+        with _climatology_lock:
+            if self.get_path(key) in _climatology_memo:
+                return _climatology_memo[self.get_path(key)]
+        path = self.get(key)
+        if path is None:
+            return None
+        with xr.open_dataset(path) as ds:
+            climatology = ds.load()
+        with _climatology_lock:
+            _climatology_memo[self.get_path(key)] = climatology
+        return climatology
+
+    def save(self, key: str, climatology: xr.Dataset):
+        """Save a climatology to the store"""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".nc")
+        os.close(fd)
+        try:
+            climatology.to_netcdf(temp_path)
+            self.put(key, temp_path, metadata={"variables": list(climatology.data_vars)})
+        finally:
+            os.remove(temp_path)
+        with _climatology_lock:
+            _climatology_memo[self.get_path(key)] = climatology
+        logging.info(f"saved hindcast climatology {key} to {self.cache_dir}")
@@ -0,0 +1,67 @@
+import os
+import uuid
+from datetime import datetime
+
+DEFAULT_RUNS_DIR = "./data/runs"
+DEFAULT_RUN_ID = "default"  # the stages of a (country, year-month) can run as separate commands
+
+
+def new_run_id() -> str:
+    """Unique, sortable id of a pipeline run"""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class RunContext:
+    """
+    Working directories of one pipeline run: the input, output and log files of a
+    (country, year-month, run id) are kept apart, so that runs of several countries
+    or months can go in parallel in one process or node
+    """
+
+    def __init__(
+        self,
+        country: str = None,
+        yearmonth: str = None,
+        run_id: str = None,
+        base_dir: str = DEFAULT_RUNS_DIR,
+        work_dir: str = None,
+    ):
+        """
+        Args:
+            country (str): country ISO3
+            yearmonth (str): year-month of the forecast, in ISO 8601
+            run_id (str): id of the run, DEFAULT_RUN_ID if None
+            base_dir (str): directory of all runs
+            work_dir (str): working directory of the run, base_dir/country/yearmonth/run_id if None
+        """
+        self.country = country
+        self.yearmonth = yearmonth
+        self.run_id = run_id or DEFAULT_RUN_ID
+        self.base_dir = base_dir
+        if work_dir is None:
+            if country is None or yearmonth is None:
+                raise ValueError("Country and year-month are needed to create a run working directory")
+            work_dir = os.path.join(base_dir, country.upper(), yearmonth, self.run_id)
+        self.work_dir = work_dir
+        self.input_dir = os.path.join(work_dir, "input")
+        self.output_dir = os.path.join(work_dir, "output")
+        self.log_dir = os.path.join(work_dir, "logs")
+
+    @classmethod
+    def legacy(cls) -> "RunContext":
+        """Shared directories of single runs: data/input, data/output and logs"""
+        context = cls(run_id=DEFAULT_RUN_ID, work_dir="./data")
+        context.log_dir = "logs"
+        return context
+
+    def for_month(self, country: str, yearmonth: str) -> "RunContext":
+        """Context of one month of a backfill, in the same base directory and run"""
+        return RunContext(country=country, yearmonth=yearmonth, run_id=self.run_id, base_dir=self.base_dir)
+
+    def makedirs(self):
+        """Create the working directories"""
+        for path in [self.input_dir, self.output_dir, self.log_dir]:
+            os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return f"RunContext(country={self.country}, yearmonth={self.yearmonth}, run_id={self.run_id}, work_dir={self.work_dir})"
@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import List, TypedDict, Dict
 from droughtpipeline.settings import Settings
 from droughtpipeline.secrets import Secrets
+from droughtpipeline.raster import RasterStore
 import numpy as np
 
 class AdminDataUnit:
@@ -132,6 +133,78 @@ class ForecastDataUnit(AdminDataUnit):
 
 
 
+_MISSING = object()
+
+
+class DataUnitIndex:
+    """
+    Secondary indexes of the data units of a dataset: position of the first unit
+    per key and per (key, lead time), and positions per lead time and per admin level
+    """
+
+    def __init__(self, keys: tuple):
+        self.keys = keys
+        self.clear()
+
+    def clear(self):
+        self.by_key = {key: {} for key in self.keys}
+        self.by_key_lead_time = {key: {} for key in self.keys}
+        self.by_lead_time = {}
+        self.by_adm_level = {}
+
+    def rebuild(self, data_units: list):
+        self.clear()
+        for position, data_unit in enumerate(data_units or []):
+            self.add(position, data_unit)
+
+    def add(self, position: int, data_unit):
+        lead_time = getattr(data_unit, "lead_time", _MISSING)
+        for key in self.keys:
+            value = getattr(data_unit, key, _MISSING)
+            if value is _MISSING:
+                continue
+            self.by_key[key].setdefault(value, position)
+            if lead_time is not _MISSING:
+                self.by_key_lead_time[key].setdefault((value, lead_time), position)
+        if lead_time is not _MISSING:
+            self.by_lead_time.setdefault(lead_time, set()).add(position)
+        self.by_adm_level.setdefault(getattr(data_unit, "adm_level", None), set()).add(position)
+
+    def replace(self, position: int, old_data_unit, data_unit, data_units: list):
+        """Update the indexes after the unit at position is replaced"""
+        if getattr(old_data_unit, "lead_time", _MISSING) != getattr(data_unit, "lead_time", _MISSING) or any(
+            getattr(old_data_unit, key, _MISSING) != getattr(data_unit, key, _MISSING) for key in self.keys
+        ):
+            self.rebuild(data_units)
+            return
+        if hasattr(old_data_unit, "lead_time"):
+            self.by_lead_time[old_data_unit.lead_time].discard(position)
+        self.by_adm_level[getattr(old_data_unit, "adm_level", None)].discard(position)
+        self.add(position, data_unit)
+
+    def get_position(self, key: str, value, lead_time=None) -> int:
+        """Position of the first unit with the given key value (and lead time), None if not found"""
+        if lead_time is not None:
+            return self.by_key_lead_time[key].get((value, lead_time))
+        return self.by_key[key].get(value)
+
+    def find(self, key: str, data_unit) -> int:
+        """Position of the first unit with the same key value (and lead time) as data_unit"""
+        if hasattr(data_unit, "lead_time"):
+            return self.by_key_lead_time[key].get((getattr(data_unit, key), data_unit.lead_time))
+        return self.by_key[key].get(getattr(data_unit, key))
+
+    def get_positions(self, lead_time=None, adm_level=None) -> list:
+        """Positions of the units with the given lead time and/or admin level, in order"""
+        positions = None
+        if lead_time is not None:
+            positions = self.by_lead_time.get(lead_time, set())
+        if adm_level is not None:
+            adm_level_positions = self.by_adm_level.get(adm_level, set())
+            positions = adm_level_positions if positions is None else positions & adm_level_positions
+        return sorted(positions)
+
+
 class AdminDataSet:
     """Base class for admin data sets"""
 
@@ -145,121 +218,83 @@ class AdminDataSet:
         self.country = country
         self.timestamp = timestamp
         self.adm_levels = adm_levels
+        self.index = DataUnitIndex(keys=("pcode", "climate_region_code"))
         self.data_units = data_units
 
+    @property
+    def data_units(self) -> List[AdminDataUnit]:
+        return self._data_units
+
+    @data_units.setter
+    def data_units(self, data_units: List[AdminDataUnit]):
+        self._data_units = data_units
+        self.index.rebuild(data_units)
+
     def get_pcodes(self, adm_level: int = None):
         """Return list of unique pcodes, optionally filtered by adm_level"""
         if not adm_level:
-            return list(set([x.pcode for x in self.data_units]))
+            return list(self.index.by_key["pcode"].keys())
         else:
             return list(
-                set([x.pcode for x in self.data_units if x.adm_level == adm_level])
+                set([self.data_units[i].pcode for i in self.index.get_positions(adm_level=adm_level)])
             )
             
     def get_climate_region_codes(self):
         """Return list of unique climate_region_code """
-        return list(
-                set([x.climate_region_code for x in self.data_units if hasattr(x, "climate_region_code")])
-        )
+        return list(self.index.by_key["climate_region_code"].keys())
 
     def get_lead_times(self):
         """Return list of unique lead times"""
-        return list(
-            set([x.lead_time for x in self.data_units if hasattr(x, "lead_time")])
-        )
+        return list(self.index.by_lead_time.keys())
 
     def get_data_units(self, lead_time: int = None, adm_level: int = None):
         """Return list of data units filtered by lead time and/or admin level"""
         if not self.data_units:
             raise ValueError("Data units not found")
-        if lead_time is not None and adm_level is not None:
-            return list(
-                filter(
-                    lambda x: x.lead_time == lead_time and x.adm_level == adm_level,
-                    self.data_units,
-                )
-            )
-        elif lead_time is not None:
-            return list(filter(lambda x: x.lead_time == lead_time, self.data_units))
-        elif adm_level is not None:
-            return list(filter(lambda x: x.adm_level == adm_level, self.data_units))
-        else:
+        if lead_time is None and adm_level is None:
             return self.data_units
+        return [
+            self.data_units[i]
+            for i in self.index.get_positions(lead_time=lead_time, adm_level=adm_level)
+        ]
 
     def get_data_unit(self, pcode: str, lead_time: int = None) -> AdminDataUnit:
         """Get data unit by pcode and optionally by lead time"""
         if not self.data_units:
             raise ValueError("Data units not found")
-        if lead_time is not None:
-            bdu = next(
-                filter(
-                    lambda x: x.pcode == pcode and x.lead_time == lead_time,
-                    self.data_units,
-                ),
-                None,
-            )
-        else:
-            bdu = next(
-                filter(lambda x: x.pcode == pcode, self.data_units),
-                None,
-            )
-        if not bdu:
+        position = self.index.get_position("pcode", pcode, lead_time)
+        if position is None:
             raise ValueError(
                 f"Data unit with pcode {pcode} and lead_time {lead_time} not found"
             )
         else:
-            return bdu
+            return self.data_units[position]
             
     def get_data_unit_climate_region(self, climate_region_code: str, lead_time: int = None) -> AdminDataUnit:
         """Get data unit by pcode and optionally by lead time"""
         if not self.data_units:
             raise ValueError("Data units not found")
-        if lead_time is not None:
-            bdu = next(
-                filter(
-                    lambda x: x.climate_region_code == climate_region_code and x.lead_time == lead_time,
-                    self.data_units,
-                ),
-                None,
-            )
-        else:
-            bdu = next(
-                filter(lambda x: x.climate_region_code == climate_region_code, self.data_units),
-                None,
-            )
-        if not bdu:
+        position = self.index.get_position("climate_region_code", climate_region_code, lead_time)
+        if position is None:
             raise ValueError(
                 f"Data unit with pcode {climate_region_code} and lead_time {lead_time} not found"
             )
         else:
-            return bdu
+            return self.data_units[position]
             
 
     def upsert_data_unit(self, data_unit: AdminDataUnit):
         """Add data unit; if it already exists, update it"""
         if not self.data_units:
-            self.data_units = [data_unit]
-        if hasattr(data_unit, "lead_time"):
-            bdu = next(
-                filter(
-                    lambda x: x[1].pcode == data_unit.pcode
-                    and x[1].lead_time == data_unit.lead_time,
-                    enumerate(self.data_units),
-                ),
-                None,
-            )
-        else:
-            bdu = next(
-                filter(
-                    lambda x: x[1].pcode == data_unit.pcode,
-                    enumerate(self.data_units),
-                ),
-                None,
-            )
-        if not bdu:
+            self.data_units = []
+        position = self.index.find("pcode", data_unit)
+        if position is None:
             self.data_units.append(data_unit)
+            self.index.add(len(self.data_units) - 1, data_unit)
         else:
-            self.data_units[bdu[0]] = data_unit
+            old_data_unit = self.data_units[position]
+            self.data_units[position] = data_unit
+            self.index.replace(position, old_data_unit, data_unit, self.data_units)
 
     def is_any_triggered(self):
         """Check if any data unit is triggered"""
@@ -281,106 +316,371 @@ class ClimateRegionDataSet:
     ):
         self.country = country
         self.timestamp = timestamp
+        self.index = DataUnitIndex(keys=("climate_region_code",))
         self.data_units = data_units
 
+    @property
+    def data_units(self) -> List["ClimateRegionDataUnit"]:
+        return self._data_units
+
+    @data_units.setter
+    def data_units(self, data_units: List["ClimateRegionDataUnit"]):
+        self._data_units = data_units
+        self.index.rebuild(data_units)
+
     def get_data_unit(self, climate_region_code: str) -> "ClimateRegionDataUnit":
         """Get data unit by climate_region_code"""
         if not self.data_units:
             raise ValueError("Data units not found")
 
-        bdu = next(
-            filter(lambda x: x.climate_region_code == climate_region_code, self.data_units),
-            None,
-        )
+        position = self.index.get_position("climate_region_code", climate_region_code)
 
-        if not bdu:
+        if position is None:
             raise ValueError(f"Data unit with climate_region_code {climate_region_code} not found")
-        return bdu
+        return self.data_units[position]
         
         
     def get_climate_region_data_unit(self, climate_region_code: str, lead_time: int = None) -> AdminDataUnit:
         """Get data unit by climate_region_code and optionally by lead time"""
         if not self.data_units:
             raise ValueError("Data units not found")
-        if lead_time is not None:
-            bdu = next(
-                filter(
-                    lambda x: x.climate_region_code == climate_region_code and x.lead_time == lead_time,
-                    self.data_units,
-                ),
-                None,
-            )
-        else:
-            bdu = next(
-                filter(lambda x: x.climate_region_code == climate_region_code, self.data_units),
-                None,
-            )
-        if not bdu:
+        position = self.index.get_position("climate_region_code", climate_region_code, lead_time)
+        if position is None:
             raise ValueError(
                 f"Data unit with climate_region_code {climate_region_code} and lead_time {lead_time} not found"
             )
         else:
-            return bdu
+            return self.data_units[position]
 
     def get_data_units(self, lead_time: int = None, adm_level: int = None):
         """Return list of data units filtered by lead time and/or admin level"""
         if not self.data_units:
             raise ValueError("Data units not found")
-        if lead_time is not None and adm_level is not None:
-            return list(
-                filter(
-                    lambda x: x.lead_time == lead_time and x.adm_level == adm_level,
-                    self.data_units,
-                )
-            )
-        elif lead_time is not None:
-            return list(filter(lambda x: x.lead_time == lead_time, self.data_units))
-        elif adm_level is not None:
-            return list(filter(lambda x: x.adm_level == adm_level, self.data_units))
-        else:
+        if lead_time is None and adm_level is None:
             return self.data_units
+        return [
+            self.data_units[i]
+            for i in self.index.get_positions(lead_time=lead_time, adm_level=adm_level)
+        ]
         
     def upsert_data_unit(self, data_unit: ClimateRegionDataUnit):
         """Add data unit; if it already exists, update it"""
         if not self.data_units:
-            self.data_units = [data_unit]
-        if hasattr(data_unit, "lead_time"):
-            bdu = next(
-                filter(
-                    lambda x: x[1].climate_region_code == data_unit.climate_region_code
-                    and x[1].lead_time == data_unit.lead_time,
-                    enumerate(self.data_units),
-                ),
-                None,
-            )
-        else:
-            bdu = next(
-                filter(
-                    lambda x: x[1].climate_region_code == data_unit.climate_region_code,
-                    enumerate(self.data_units),
-                ),
-                None,
-            )
-        if not bdu:
+            self.data_units = []
+        position = self.index.find("climate_region_code", data_unit)
+        if position is None:
             self.data_units.append(data_unit)
+            self.index.add(len(self.data_units) - 1, data_unit)
         else:
-            self.data_units[bdu[0]] = data_unit
+            old_data_unit = self.data_units[position]
+            self.data_units[position] = data_unit
+            self.index.replace(position, old_data_unit, data_unit, self.data_units)
 
     def get_lead_times(self):
         """Return list of unique lead times"""
-        return list(
-            set([x.lead_time for x in self.data_units if hasattr(x, "lead_time")])
-        )
+        return list(self.index.by_lead_time.keys())
 
     def get_climate_region_codes(self):
         """Return list of unique station codes"""
-        return list(
-            set([x.climate_region_code for x in self.data_units if hasattr(x, "climate_region_code")])
-        )       
+        return list(self.index.by_key["climate_region_code"].keys())
         
 
 
 
+# columns of forecast datasets: name -> kind ('int' and 'float' are stored in
+# NumPy arrays, 'str' and 'object' in object arrays; None is stored as missing)
+FORECAST_COLUMNS = {
+    "adm_level": "int",
+    "pcode": "str",
+    "lead_time": "int",
+    "tercile_lower": "float",
+    "tercile_upper": "float",
+    "forecast": "object",
+    "season": "str",
+    "climate_region_code": "str",
+    "climate_region_name": "str",
+    "pop_affected": "int",
+    "pop_affected_perc": "float",
+    "triggered": "int",
+    "likelihood": "float",
+    "return_period": "float",
+    "alert_class": "str",
+}
+FORECAST_DEFAULTS = {"pop_affected": 0, "pop_affected_perc": 0.0}
+FORECAST_INDEX_COLUMNS = ("pcode", "climate_region_code", "lead_time", "adm_level")
+
+
+def object_array(values) -> np.ndarray:
+    """1-d object array of the values, also if they are sequences themselves"""
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+class ForecastDataRow:
+    """View of one row of a ForecastDataSet, with the attributes of a ForecastDataUnit"""
+
+    __slots__ = ("dataset", "position")
+
+    def __init__(self, dataset: "ForecastDataSet", position: int):
+        self.dataset = dataset
+        self.position = position
+
+    def to_data_unit(self) -> ForecastDataUnit:
+        return ForecastDataUnit(**self.dataset.to_records([self.position])[0])
+
+    def __repr__(self):
+        return f"ForecastDataRow({self.dataset.to_records([self.position])[0]})"
+
+
+def _column_property(name: str) -> property:
+    def get(row):
+        return row.dataset.get_value(name, row.position)
+
+    def set(row, value):
+        row.dataset.update([row.position], **{name: value})
+
+    return property(get, set)
+
+
+for _name in FORECAST_COLUMNS:
+    setattr(ForecastDataRow, _name, _column_property(_name))
+
+
+class ForecastDataSet:
+    """
+    Forecast data set stored by column; same interface as AdminDataSet,
+    with data units returned as row views, plus vectorized filter, update and serialization
+    """
+
+    def __init__(
+        self,
+        country: str = None,
+        timestamp: datetime = datetime.now(),
+        adm_levels: List[int] = None,
+        data_units: List[ForecastDataUnit] = None,
+    ):
+        self.country = country
+        self.timestamp = timestamp
+        self.adm_levels = adm_levels
+        self.index = DataUnitIndex(keys=("pcode", "climate_region_code"))
+        self.data_units = data_units
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def data_units(self) -> List[ForecastDataRow]:
+        return [ForecastDataRow(self, i) for i in range(self.size)]
+
+    @data_units.setter
+    def data_units(self, data_units: List[ForecastDataUnit]):
+        self.size = 0
+        self.columns = {name: self._empty(kind, 0) for name, kind in FORECAST_COLUMNS.items()}
+        self.valid = {name: np.zeros(0, dtype=bool) for name, kind in FORECAST_COLUMNS.items() if kind == "int"}
+        self.index.clear()
+        if data_units:
+            records = [
+                data_unit.dataset.to_records([data_unit.position])[0]
+                if isinstance(data_unit, ForecastDataRow) else vars(data_unit)
+                for data_unit in data_units
+            ]
+            self.append({name: object_array([record.get(name) for record in records]) for name in FORECAST_COLUMNS})
+            self.index.rebuild(self.data_units)
+
+    @staticmethod
+    def _empty(kind: str, size: int) -> np.ndarray:
+        if kind == "int":
+            return np.zeros(size, dtype=np.int64)
+        if kind == "float":
+            return np.full(size, np.nan)
+        return np.full(size, None, dtype=object)
+
+    def _reserve(self, size: int):
+        """Grow the columns, by doubling, to hold at least size rows"""
+        capacity = len(self.columns["pcode"])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 16)
+        for name, kind in FORECAST_COLUMNS.items():
+            column = self._empty(kind, capacity)
+            column[: self.size] = self.columns[name][: self.size]
+            self.columns[name] = column
+            if kind == "int":
+                valid = np.zeros(capacity, dtype=bool)
+                valid[: self.size] = self.valid[name][: self.size]
+                self.valid[name] = valid
+
+    def _set(self, name: str, positions: np.ndarray, values):
+        """Set values of a column; values of 'object' columns are given per row
+        as an object array, any other non-sequence value is repeated"""
+        kind = FORECAST_COLUMNS[name]
+        per_row = isinstance(values, np.ndarray) if kind == "object" else isinstance(values, (list, tuple, np.ndarray))
+        if not per_row:
+            values = [values] * len(positions)
+        if kind == "int":
+            self.columns[name][positions] = [int(value) if value is not None else 0 for value in values]
+            self.valid[name][positions] = [value is not None for value in values]
+        elif kind == "float":
+            self.columns[name][positions] = [float(value) if value is not None else np.nan for value in values]
+        else:
+            self.columns[name][positions] = object_array(values)
+
+    def append(self, columns: dict) -> np.ndarray:
+        """Append rows given as columns, return their positions"""
+        positions = np.arange(self.size, self.size + len(columns["pcode"]))
+        self._reserve(self.size + len(positions))
+        self.size += len(positions)
+        for name in FORECAST_COLUMNS:
+            self._set(name, positions, columns.get(name, FORECAST_DEFAULTS.get(name)))
+        return positions
+
+    def get_value(self, name: str, position: int):
+        """Value of a cell, as a Python object (None if missing)"""
+        if position >= self.size:
+            raise IndexError(f"Row {position} not found")
+        kind = FORECAST_COLUMNS[name]
+        value = self.columns[name][position]
+        if kind == "int":
+            return int(value) if self.valid[name][position] else None
+        if kind == "float":
+            return None if np.isnan(value) else float(value)
+        return value
+
+    def get_column(self, name: str, positions=None) -> np.ndarray:
+        """Values of a column (NaN for missing numbers)"""
+        positions = slice(0, self.size) if positions is None else positions
+        column = self.columns[name][positions]
+        if FORECAST_COLUMNS[name] == "int":
+            return np.where(self.valid[name][positions], column, np.nan)
+        return column
+
+    def filter(self, **conditions) -> np.ndarray:
+        """Positions of the rows whose columns equal the given values"""
+        mask = np.ones(self.size, dtype=bool)
+        for name, value in conditions.items():
+            column = self.columns[name][: self.size]
+            if FORECAST_COLUMNS[name] == "int":
+                mask &= self.valid[name][: self.size] & (column == value)
+            else:
+                mask &= column == value
+        return np.nonzero(mask)[0]
+
+    def update(self, positions, **values):
+        """Set columns of the rows at the given positions, broadcasting scalars"""
+        positions = np.asarray(positions, dtype=np.int64)
+        for name, column_values in values.items():
+            if name not in FORECAST_COLUMNS:
+                raise ValueError(f"Column {name} not found")
+            self._set(name, positions, column_values)
+        if any(name in FORECAST_INDEX_COLUMNS for name in values):
+            self.index.rebuild(self.data_units)
+
+    def upsert(self, **columns):
+        """
+        Add rows given as columns (see update), with at least a pcode column;
+        rows with the same pcode and lead time as an existing row replace it
+        """
+        pcodes = list(columns["pcode"])
+        lead_times = columns.get("lead_time")
+        if not isinstance(lead_times, (list, tuple, np.ndarray)):
+            lead_times = [lead_times] * len(pcodes)
+        positions, new_rows = np.empty(len(pcodes), dtype=np.int64), {}
+        for i, key in enumerate(zip(pcodes, lead_times)):
+            position = self.index.by_key_lead_time["pcode"].get(key)
+            if position is None:
+                position = new_rows.setdefault(key, self.size + len(new_rows))
+            positions[i] = position
+        old_size = self.size
+        replaced = np.unique(positions[positions < old_size])
+        old_keys = self._get_index_keys(replaced)
+        self._reserve(self.size + len(new_rows))
+        self.size += len(new_rows)
+        for name in FORECAST_COLUMNS:
+            self._set(name, positions, columns.get(name, FORECAST_DEFAULTS.get(name)))
+        if self._get_index_keys(replaced) != old_keys:
+            self.index.rebuild(self.data_units)
+        else:
+            for position in range(old_size, self.size):
+                self.index.add(position, ForecastDataRow(self, position))
+
+    def _get_index_keys(self, positions) -> list:
+        return [tuple(self.get_value(name, p) for name in FORECAST_INDEX_COLUMNS) for p in positions]
+
+    def upsert_data_unit(self, data_unit: ForecastDataUnit):
+        """Add data unit; if it already exists, update it"""
+        self.upsert(**{name: object_array([getattr(data_unit, name, None)]) for name in FORECAST_COLUMNS})
+
+    def to_records(self, positions=None) -> List[dict]:
+        """Rows as dictionaries of Python objects, as vars() of the data units"""
+        positions = np.arange(self.size) if positions is None else np.asarray(positions, dtype=np.int64)
+        columns = {}
+        for name, kind in FORECAST_COLUMNS.items():
+            values = self.columns[name][positions].tolist()
+            if kind == "int":
+                valid = self.valid[name][positions].tolist()
+                values = [value if is_valid else None for value, is_valid in zip(values, valid)]
+            elif kind == "float":
+                values = [None if value != value else value for value in values]
+            columns[name] = values
+        return [dict(zip(columns.keys(), row)) for row in zip(*columns.values())]
+
+    def get_pcodes(self, adm_level: int = None):
+        """Return list of unique pcodes, optionally filtered by adm_level"""
+        if not adm_level:
+            return list(self.index.by_key["pcode"].keys())
+        return list(set(self.columns["pcode"][self.filter(adm_level=adm_level)]))
+
+    def get_climate_region_codes(self):
+        """Return list of unique climate_region_code """
+        return list(self.index.by_key["climate_region_code"].keys())
+
+    def get_lead_times(self):
+        """Return list of unique lead times"""
+        return list(self.index.by_lead_time.keys())
+
+    def get_data_units(self, lead_time: int = None, adm_level: int = None) -> List[ForecastDataRow]:
+        """Return list of data units filtered by lead time and/or admin level"""
+        if self.size == 0:
+            raise ValueError("Data units not found")
+        if lead_time is None and adm_level is None:
+            return self.data_units
+        return [
+            ForecastDataRow(self, i)
+            for i in self.index.get_positions(lead_time=lead_time, adm_level=adm_level)
+        ]
+
+    def get_data_unit(self, pcode: str, lead_time: int = None) -> ForecastDataRow:
+        """Get data unit by pcode and optionally by lead time"""
+        if self.size == 0:
+            raise ValueError("Data units not found")
+        position = self.index.get_position("pcode", pcode, lead_time)
+        if position is None:
+            raise ValueError(
+                f"Data unit with pcode {pcode} and lead_time {lead_time} not found"
+            )
+        return ForecastDataRow(self, position)
+
+    def get_data_unit_climate_region(self, climate_region_code: str, lead_time: int = None) -> ForecastDataRow:
+        """Get data unit by climate region code and optionally by lead time"""
+        if self.size == 0:
+            raise ValueError("Data units not found")
+        position = self.index.get_position("climate_region_code", climate_region_code, lead_time)
+        if position is None:
+            raise ValueError(
+                f"Data unit with pcode {climate_region_code} and lead_time {lead_time} not found"
+            )
+        return ForecastDataRow(self, position)
+
+    def is_any_triggered(self):
+        """Check if any data unit is triggered"""
+        if self.size == 0:
+            raise ValueError("Data units not found")
+        triggered = self.columns["triggered"][: self.size]
+        return bool(np.any(self.valid["triggered"][: self.size] & (triggered != 0)))
+
+
 class PipelineDataSets:
     """Collection of datasets used by the pipeline"""
 
@@ -397,7 +697,7 @@ class PipelineDataSets:
             timestamp=datetime
         )        
 
-        self.forecast_admin = AdminDataSet(
+        self.forecast_admin = ForecastDataSet(
             country=self.country,
             timestamp=datetime,
             adm_levels=settings.get_country_setting(country, "admin-levels"),
@@ -407,5 +707,12 @@ class PipelineDataSets:
             country=self.country, 
             timestamp=datetime
         )
+
+        # probability of rainfall below the lower tercile and drought extent
+        # per forecast month, on the native forecast grid (xarray.Dataset)
+        self.lower_tercile_probability = None
+
+        # rasters handed over between stages, written to disk at the end of the run
+        self.rasters = RasterStore()
   
 
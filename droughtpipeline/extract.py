@@ -6,8 +6,20 @@ from droughtpipeline.data import (
     RainfallDataUnit,
     RainfallClimateRegionDataUnit,
 )
-from droughtpipeline.load import Load
+from droughtpipeline.load import Load, get_ecmwf_hindcast_request, read_seas5_domain_link
+from droughtpipeline.cache import HindcastCache, get_cache_dir, get_cache_max_size
+from droughtpipeline.context import RunContext
+from droughtpipeline.backtest import backtest_trigger_model, classify_outcome, get_backtest_scores, stack_weights
+from droughtpipeline.climatology import (
+    CLIMATOLOGY_AGGREGATIONS,
+    ClimatologyStore,
+    compute_climatology,
+    rolling_3m_sum,
+    subset_region,
+)
 from droughtpipeline.utils import replace_year_month
+from droughtpipeline.zonal import get_admin_zonal_index
+from droughtpipeline.raster import Raster
 import os
 from datetime import datetime
 import geopandas as gpd
@@ -30,43 +42,111 @@ warnings.simplefilter("ignore", category=RuntimeWarning)
 supported_sources = ["ECMWF"]
 
 
-def slice_netcdf_file(nc_file: xr.Dataset, country_bounds: list):
+def slice_netcdf_file(nc_file: xr.Dataset, country_bounds: list, latname: str = 'lat', lonname: str = 'lon'):
     """Slice the netcdf file to the bounding box"""
     min_lon = country_bounds[0]  # Minimum longitude
     max_lon = country_bounds[2]  # Maximum longitude
     min_lat = country_bounds[1]  # Minimum latitude
     max_lat = country_bounds[3]  # Maximum latitude
-    var_data = nc_file.sel(lon=slice(min_lon, max_lon), lat=slice(max_lat, min_lat))
+    var_data = nc_file.sel({lonname: slice(min_lon, max_lon), latname: slice(max_lat, min_lat)})
     return var_data
 
 
+def open_seas5_monthly(file_path: str) -> xr.Dataset:
+    """Open ECMWF SEAS5 monthly GRIB file"""
+    return xr.open_dataset(file_path, engine='cfgrib', backend_kwargs={'time_dims': ('forecastMonth', 'time')})
+
+
+def open_seas5_country(file_path: str) -> xr.Dataset:
+    """
+    Open the ECMWF SEAS5 monthly GRIB file of a country; if it is linked to a
+    domain downloaded for several countries, slice the country area out of it
+    """
+    link = read_seas5_domain_link(file_path)
+    if link is None:
+        return open_seas5_monthly(file_path)
+    north, west, south, east = link["area"]
+    logging.info(f"slicing {os.path.basename(file_path)} out of {link['path']}")
+    return slice_netcdf_file(
+        open_seas5_monthly(link["path"]), [west, south, east, north], latname='latitude', lonname='longitude'
+    )
+
+
+def get_days_in_month(ds: xr.Dataset) -> list:
+    """Number of days in each forecast month, starting from the first initialization time"""
+    # Get the month and year from the dataset
+    month = ds.time.dt.month.values[0]
+    year = ds.time.dt.year.values[0]
+    return [monthrange(year, ((month + fcmonth - 1) - 1) % 12 + 1)[1] for fcmonth in ds.forecastMonth.values]
+
+
+def to_mm_per_month(ds: xr.Dataset, days_in_month: list) -> xr.Dataset:
+    """Convert the precipitation rate from m/s to mm/month"""
+    # Assign the number of days as a coordinate to the dataset
+    ds = ds.assign_coords(numdays=('forecastMonth', list(days_in_month)))
+    return ds * ds.numdays * 24 * 60 * 60 * 1000
+
+
 def convert_to_mm_per_month(hindcast, forecast):
     """
     Reads a file and returns the raster dataset converted to mm/month from m/s.
     """
     # Load hindcast dataset
-    ds_hindcast = xr.open_dataset(hindcast, engine='cfgrib', backend_kwargs={'time_dims': ('forecastMonth', 'time')})
-    ds_forecast = xr.open_dataset(forecast, engine='cfgrib', backend_kwargs={'time_dims': ('forecastMonth', 'time')})
-    
-      
-    # Get the month and year from the dataset
-    month = ds_hindcast.time.dt.month.values[0]
-    year = ds_hindcast.time.dt.year.values[0]
-    
+    ds_hindcast = open_seas5_country(hindcast)
+    ds_forecast = open_seas5_country(forecast)
+
     # Calculate the number of days in each forecast month
-    #days_in_month = [monthrange(year, month + fcmonth - 1)[1] for fcmonth in ds_hindcast.forecastMonth.values]
+    days_in_month = get_days_in_month(ds_hindcast)
+    return to_mm_per_month(ds_hindcast, days_in_month), to_mm_per_month(ds_forecast, days_in_month)
 
-    days_in_month = [monthrange(year, ((month + fcmonth - 1) - 1) % 12 + 1)[1] for fcmonth in ds_hindcast.forecastMonth.values]
-    
-    # Assign the number of days as a coordinate to the dataset
-    ds = ds_hindcast.assign_coords(numdays=('forecastMonth', days_in_month))
-    ds2 = ds_forecast.assign_coords(numdays=('forecastMonth', days_in_month))
-    
-    # Convert the precipitation rate from m/s to mm/month
-    ds = ds * ds.numdays * 24 * 60 * 60 * 1000
-    ds2 = ds2 * ds2.numdays * 24 * 60 * 60 * 1000
-    
-    return ds,ds2
+
+def compute_lower_tercile_probability(
+    tercile_lower: xr.DataArray,
+    tprate_forecast: xr.DataArray,
+    trigger_on_minimum_probability: float,
+) -> xr.Dataset:
+    """
+    Compute for all forecast months and grid cells at once the probability
+    that the forecast is below the lower tercile, and the binary drought extent.
+    Parameters:
+        tercile_lower (xarray.DataArray): lower tercile per forecast month and grid cell
+        tprate_forecast (xarray.DataArray): forecast ensemble per forecast month and grid cell
+        trigger_on_minimum_probability (float): minimum probability of drought extent
+    Returns:
+        xarray.Dataset: probability and drought extent, with dimension forecastMonth
+    """
+    probability = (tprate_forecast <= tercile_lower).sum(dim="number") / tprate_forecast.sizes["number"]
+    probability = probability.transpose("forecastMonth", "latitude", "longitude")
+    probability = probability.drop_vars(
+        [coord for coord in probability.coords if coord not in ['forecastMonth', 'latitude', 'longitude']]
+    )
+    probability = probability.rio.write_crs("EPSG:4326")
+    drought_extent = (probability > trigger_on_minimum_probability).astype(int)
+    return xr.Dataset(
+        {
+            "probability": probability,
+            "drought_extent": drought_extent,
+        },
+        attrs={"trigger_on_minimum_probability": trigger_on_minimum_probability},
+    )
+
+
+def upsample_lower_tercile_probability(lower_tercile_ds: xr.Dataset, upsample: int = 10) -> xr.Dataset:
+    """Upsample probability (nearest neighbour) and drought extent, for display in the IBF portal"""
+    probability = lower_tercile_ds['probability']
+    new_lat = np.linspace(probability.latitude.values.min(), probability.latitude.values.max(), probability.latitude.size * upsample)
+    new_lon = np.linspace(probability.longitude.values.min(), probability.longitude.values.max(), probability.longitude.size * upsample)
+    probability = probability.interp(latitude=new_lat, longitude=new_lon, method="nearest")
+    probability = probability.rio.write_crs("EPSG:4326")
+    trigger_on_minimum_probability = lower_tercile_ds.attrs["trigger_on_minimum_probability"]
+    drought_extent = (probability > trigger_on_minimum_probability).astype(int)
+    return xr.Dataset(
+        {
+            "probability": probability,
+            "drought_extent": drought_extent,
+        },
+        attrs=lower_tercile_ds.attrs,
+    )
 
 
 class Extract:
@@ -77,15 +157,17 @@ class Extract:
         settings: Settings = None,
         secrets: Secrets = None,
         data: PipelineDataSets = None,
+        context: RunContext = None,
     ):
         self.source = None
         self.country = None
         self.secrets = None
         self.settings = None
-        self.inputPathGrid = "./data/input"
-        self.outputPathGrid = "./data/output"
+        self.context = context if context is not None else RunContext.legacy()
+        self.inputPathGrid = self.context.input_dir
+        self.outputPathGrid = self.context.output_dir
         self.confgPath = "./config"
-        self.load = Load()
+        self.load = Load(context=self.context)
         if not os.path.exists(self.inputPathGrid):
             os.makedirs(self.inputPathGrid)
         if not os.path.exists(self.outputPathGrid):
@@ -162,6 +244,7 @@ class Extract:
                 self.inputPathGrid,
                 current_year, 
                 current_month,
+                asynchronous=True,
             )
         except FileNotFoundError:
             logging.warning(
@@ -234,21 +317,74 @@ class Extract:
 
 
     def subset_region(self,ds, region, latname='latitude', lonname='longitude'):
-        lon1 = region[1] % 360
-        lon2 = region[3] % 360
-        if lon2 >= lon1:
-            mask_lon = (ds[lonname] <= lon2) & (ds[lonname] >= lon1)
-        else:
-            mask_lon = (ds[lonname] <= lon2) | (ds[lonname] >= lon1)
+        return subset_region(ds, region, latname=latname, lonname=lonname)
 
-        mask = (ds[latname] <= region[0]) & (ds[latname] >= region[2]) & mask_lon
-        subset = ds.where(mask, drop=True)
+    def get_climate_regions(self, country: str) -> dict:
+        """Admin areas, extent and admin level of each climate region, by climate region code"""
+        climate_regions = {}
+        for climateRegion in self.data.threshold_climateregion.get_climate_region_codes():
+            climate_region_unit = self.data.threshold_climateregion.get_data_unit(
+                climate_region_code=climateRegion)
+            admin_level_ = climate_region_unit.adm_level
+            geofile=self.load.get_adm_boundaries(country,admin_level_)
+            climateRegionPcodes=climate_region_unit.pcodes[f'{admin_level_}']
+            filtered_gdf = geofile[geofile[f'adm{admin_level_}_pcode'].isin(climateRegionPcodes)]
+            filtered_gdf['placeCode']= filtered_gdf[f'adm{admin_level_}_pcode']          
+            
+            if filtered_gdf.empty:
+                raise ValueError(f"No data matching {climateRegion} found in the geofile.")  
+            
+            # Get the extent of the filtered geofile    
+            try:
+                lon_min, lat_min, lon_max, lat_max = filtered_gdf.total_bounds  # [minx, miny, maxx, maxy]
+            except ValueError as e:
+                logging.error(f"Error in extracting extent of the filtered geofile: {e}")
 
-        if lon2 < lon1:
-            subset[lonname] = (subset[lonname] + 180) % 360 - 180
-            subset = subset.sortby(subset[lonname])
+            climate_regions[climateRegion] = {
+                'name': climate_region_unit.climate_region_name,
+                'gdf': filtered_gdf,
+                'sub_region': (lat_max, lon_min, lat_min, lon_max),
+                'adm_level': admin_level_,
+            }
+        return climate_regions
+
+    def get_hindcast(self, aggregation: str) -> xr.Dataset:
+        """Hindcast of the run in mm per month, summed over 3 months for the '3m' aggregation"""
+        ds_hindcast = open_seas5_country(f'{self.inputPathGrid}/ecmwf_seas5_hindcast_monthly_tp.grib')
+        ds_hindcast = to_mm_per_month(ds_hindcast, get_days_in_month(ds_hindcast))
+        if aggregation == "3m":
+            ds_hindcast = rolling_3m_sum(ds_hindcast)
+        return ds_hindcast
 
-        return subset
+    def get_climatology(self, country: str, aggregation: str, regions: dict = None) -> xr.Dataset:
+        """
+        Get hindcast climatology (lower tercile and mean per grid cell, thresholds per climate region)
+        from the climatology store; compute it from the hindcast and save it if missing
+        """
+        quantile_thr = self.settings.get_country_setting(country,"trigger_model")["tercile_treshold"]
+        hindcast_request = get_ecmwf_hindcast_request(self.load.get_ecmwf_area(country))
+        key = ClimatologyStore.get_key(
+            HindcastCache.get_key_from_request(hindcast_request),
+            aggregation,
+            quantile_thr,
+            regions,
+        )
+        store = ClimatologyStore(
+            get_cache_dir(self.settings),
+            max_size=get_cache_max_size(self.settings, "climatology_cache_max_size_gb"),
+        )
+        # parallel runs (e.g. the months of a backfill) wait for the one computing it
+        with store.lock(key):
+            climatology = store.load(key)
+            if climatology is not None:
+                logging.info(f"loaded hindcast climatology from {store.cache_dir}")
+                return climatology
+
+            logging.info("computing hindcast climatology")
+            ds_hindcast = self.get_hindcast(aggregation)
+            climatology = compute_climatology(ds_hindcast['tprate'], quantile_thr, regions)
+            store.save(key, climatology)
+            return climatology
    
     def extract_ecmwf_data(self, country: str = None, debug: bool = False, datestart: datetime = None):
         """
@@ -269,6 +405,7 @@ class Extract:
             country, "trigger_model")['trigger-on-minimum-probability']
         trigger_on_minimum_admin_area_in_drought_extent = self.settings.get_country_setting(
             country, "trigger_model")['trigger-on-minimum-admin-area-in-drought-extent']     
+        zonal_method = self.settings.get_country_setting(country, "trigger_model").get('zonal-method', 'coverage')
         
         if debug:
             scenario = os.getenv("SCENARIO", "Forecast") # TODO: pull scenario debug to a proper scenario script
@@ -279,98 +416,52 @@ class Extract:
                 trigger_on_minimum_probability = 0.3
         
         logging.info("Extract seasonal forecast for each climate region") 
-        ds_hindcast,ds_forecast=convert_to_mm_per_month(f'{self.inputPathGrid}/ecmwf_seas5_hindcast_monthly_tp.grib', 
-                                                f'{self.inputPathGrid}/ecmwf_seas5_forecast_monthly_tp.grib')
-        '''  
-        ds_hindcast = xr.open_dataset(
-            f'{self.inputPathGrid}/ecmwf_seas5_hindcast_monthly_tp.grib',
-            engine='cfgrib',
-            backend_kwargs={'time_dims': ('forecastMonth', 'time')}
-        )
+        if triggermodel not in CLIMATOLOGY_AGGREGATIONS:
+            raise ValueError(f"Trigger model {triggermodel} not supported")
+        aggregation = CLIMATOLOGY_AGGREGATIONS[triggermodel]
 
-        ds_hindcast['tprate'] = ds_hindcast['tprate'] * 86400 * 1000
-          
-        # Load forecast data
-        ds_forecast = xr.open_dataset(
-            f'{self.inputPathGrid}/ecmwf_seas5_forecast_monthly_tp.grib',
-            engine='cfgrib',
-            backend_kwargs={'time_dims': ('forecastMonth', 'time')}
-        )
+        climate_regions = self.get_climate_regions(country)
 
-        # Convert tprate from m/s to mm/day
-        ds_forecast['tprate'] = ds_forecast['tprate'] * 86400 * 1000
-        tprate = ds_forecast['tprate'] 
-   
-        numdays = [monthrange(dd.year, dd.month)[1] for dd in valid_time]
-        #ds_forecast['tprate'].attrs['units'] = 'mm/day'
-        '''
-
-        ########## for 3 month rolling mean
-        seas5_forecast_3m = (
-            ds_forecast.shift(forecastMonth=-2)  # Shift data by 2 steps forward
-            .rolling(forecastMonth=3, min_periods=1)  # Apply rolling
-            .sum()  # Calculate mean for the rolling window
-        )
-        ds_hindcast_3m = (
-            ds_hindcast.shift(forecastMonth=-2)  # Shift data by 2 steps forward
-            .rolling(forecastMonth=3, min_periods=1)  # Apply rolling
-            .sum()  # Calculate mean for the rolling window
+        # hindcast statistics are computed once per start month and area
+        climatology = self.get_climatology(
+            country,
+            aggregation,
+            {code: region['sub_region'] for code, region in climate_regions.items()},
         )
-        
-        if triggermodel=='seasonal_rainfall_forecast':
-            trigger_df= self.compare_forecast_to_historical_lower_tercile(
-                country,
-                ds_hindcast, 
-                ds_forecast,
-                trigger_on_minimum_probability)
-            tprate_forecast = ds_forecast['tprate'] 
-            tprate_hindcast = ds_hindcast['tprate']  
-            tprate_hindcast_mean = ds_hindcast.mean(['number','time'])
-            
-            # Convert lead time into valid dates
-            valid_time = [
-                pd.to_datetime(tprate_forecast.time.values) + relativedelta(months=fcmonth - 1)
-                for fcmonth in tprate_forecast.forecastMonth
-            ]
-            anomalies = ds_forecast['tprate'] - tprate_hindcast_mean
-
-            # Convert precipitation rates to accumulation
+        ds_forecast = open_seas5_country(f'{self.inputPathGrid}/ecmwf_seas5_forecast_monthly_tp.grib')
+        ds_forecast = to_mm_per_month(ds_forecast, climatology['numdays'].values)
+        if aggregation == "3m":
+            ########## for 3 month rolling sum
+            ds_forecast = rolling_3m_sum(ds_forecast)
+
+        lower_tercile_ds = self.compare_forecast_to_historical_lower_tercile(
+            country,
+            climatology['tercile_lower'],
+            ds_forecast,
+            trigger_on_minimum_probability)
+        self.data.lower_tercile_probability = lower_tercile_ds
+        tprate_forecast = ds_forecast['tprate']
+        anomalies = (tprate_forecast - climatology['hindcast_mean']).rename('tprate')
+
+        # Convert lead time into valid dates
+        valid_time = [
+            pd.to_datetime(tprate_forecast.time.values) + relativedelta(months=fcmonth - 1)
+            for fcmonth in tprate_forecast.forecastMonth
+        ]
+        if aggregation == "1m":
             numdays = [monthrange(dd.year, dd.month)[1] for dd in valid_time]
-            anomalies = anomalies.assign_coords(valid_time=('forecastMonth', valid_time))
-            anomalies = anomalies.assign_coords(numdays=('forecastMonth', numdays))
-            anomalies_tp = anomalies #* anomalies.numdays * 24 * 60 * 60 * 1000
-            anomalies_tp.attrs['units'] = 'mm'
-            anomalies_tp.attrs['long_name'] = 'Total precipitation anomaly'
-
-        elif triggermodel=='seasonal_rainfall_forecast_3m':
-            trigger_df= self.compare_forecast_to_historical_lower_tercile(
-                country,
-                ds_hindcast_3m, 
-                seas5_forecast_3m,
-                trigger_on_minimum_probability)
-            tprate_forecast = seas5_forecast_3m['tprate']
-            tprate_hindcast = ds_hindcast_3m['tprate']  
-            tprate_hindcast_mean = ds_hindcast_3m.mean(['number','time'])
-            anomalies = seas5_forecast_3m.tprate - tprate_hindcast_mean.tprate  
-            
+            long_name = 'Total precipitation anomaly'
+        else:
             # Calculate number of days for each forecast month and add it as coordinate information to the data array
             vt = [ pd.to_datetime(tprate_forecast.time.values) + relativedelta(months=fcmonth+1) for fcmonth in tprate_forecast.forecastMonth]
             vts = [[thisvt+relativedelta(months=-mm) for mm in range(3)] for thisvt in vt]
             numdays = [np.sum([monthrange(dd.year,dd.month)[1] for dd in d3]) for d3 in vts]
-            
-            # Convert lead time into valid dates
-            valid_time = [
-                pd.to_datetime(tprate_forecast.time.values) + relativedelta(months=fcmonth - 1)
-                for fcmonth in tprate_forecast.forecastMonth
-            ]
-            anomalies = anomalies.assign_coords(numdays=('forecastMonth',numdays))                
-            anomalies = anomalies.assign_coords(valid_time=('forecastMonth',valid_time))  
-            anomalies_tp = anomalies #* anomalies.numdays * 24 * 60 * 60 * 1000
-            anomalies_tp.attrs['units'] = 'mm'
-            anomalies_tp.attrs['long_name'] = 'SEAS5 3-monthly total precipitation ensemble mean anomaly for 6 lead-time months'            
-
-        else:
-            raise ValueError(f"Trigger model {triggermodel} not supported")
+            long_name = 'SEAS5 3-monthly total precipitation ensemble mean anomaly for 6 lead-time months'
+        anomalies = anomalies.assign_coords(valid_time=('forecastMonth', valid_time))
+        anomalies = anomalies.assign_coords(numdays=('forecastMonth', numdays))
+        anomalies_tp = anomalies
+        anomalies_tp.attrs['units'] = 'mm'
+        anomalies_tp.attrs['long_name'] = long_name
 
         ########################### for rainfall layer in IBF portal
         
@@ -379,28 +470,10 @@ class Extract:
         tprate_forecast_mean = tprate_forecast_mean.assign_coords(numdays=('forecastMonth', numdays))
         tprate_forecast_mean.attrs['units'] = 'mm'
 
-        for climateRegion in self.data.threshold_climateregion.get_climate_region_codes():
-            pcodes=self.data.threshold_climateregion.get_data_unit(
-                climate_region_code=climateRegion).pcodes
-            admin_level_=self.data.threshold_climateregion.get_data_unit(
-                climate_region_code=climateRegion).adm_level
-            climateRegionName= self.data.threshold_climateregion.get_data_unit(
-                climate_region_code=climateRegion).climate_region_name
-            geofile=self.load.get_adm_boundaries(country,admin_level_)
-            climateRegionPcodes=pcodes[f'{admin_level_}']
-            filtered_gdf = geofile[geofile[f'adm{admin_level_}_pcode'].isin(climateRegionPcodes)]
-            filtered_gdf['placeCode']= filtered_gdf[f'adm{admin_level_}_pcode']          
-            
-            if filtered_gdf.empty:
-                raise ValueError(f"No data matching {climateRegion} found in the geofile.")  
-            
-            # Get the extent of the filtered geofile    
-            try:
-                lon_min, lat_min, lon_max, lat_max = filtered_gdf.total_bounds  # [minx, miny, maxx, maxy]
-            except ValueError as e:
-                logging.error(f"Error in extracting extent of the filtered geofile: {e}")
-           
-            sub_region = (lat_max, lon_min, lat_min, lon_max)      
+        for climateRegion, climate_region in climate_regions.items():
+            climateRegionName = climate_region['name']
+            filtered_gdf = climate_region['gdf']
+            sub_region = climate_region['sub_region']
             
             # extract annomalies for a specific region 
             sub_anomalies = self.subset_region(anomalies_tp, sub_region)
@@ -410,22 +483,19 @@ class Extract:
             regional_mean = sub_anomalies.weighted(weights).mean(['latitude', 'longitude'])
 
             # Create dataframe for anomalies
-            anomalies_df = regional_mean.drop_vars(['time', 'surface', 'numdays']).to_dataframe()
+            anomalies_df = regional_mean.drop_vars(['time', 'surface', 'numdays'], errors='ignore').to_dataframe()
             anomalies_df = anomalies_df.rename(columns={'tprate': 'anomaly'})
             anomalies_df = anomalies_df.reset_index().drop('forecastMonth', axis=1).set_index(['valid_time', 'number']).unstack()
             anomalies_df = anomalies_df.reset_index()
             anomalies_df['valid_time'] = anomalies_df['valid_time'].dt.strftime('%b, %Y')
 
-            # Calculate thresholds
-            hindcast_sub = self.subset_region(tprate_hindcast, sub_region)
-            hindcast_mean = hindcast_sub.weighted(weights).mean(['latitude', 'longitude'])
-            hindcast_anomalies = hindcast_mean - hindcast_mean.mean(['number', 'time'])
-            hindcast_anomalies_tp = hindcast_anomalies # * hindcast_anomalies.numdays * 24 * 60 * 60 * 1000   
+            # Thresholds from the hindcast climatology
+            region_climatology = climatology.sel(climate_region=climateRegion, drop=True)
             thresholds = {
-                'P0': hindcast_anomalies_tp.min(['number', 'time']),
-                'P33': hindcast_anomalies_tp.quantile(1 / 3., ['number', 'time']),
-                'P66': hindcast_anomalies_tp.quantile(2 / 3., ['number', 'time']),
-                'P100': hindcast_anomalies_tp.max(['number', 'time'])
+                'P0': region_climatology['region_p0'],
+                'P33': region_climatology['region_p33'],
+                'P66': region_climatology['region_p66'],
+                'P100': region_climatology['region_p100'],
             }
 
             # Calculate trigger status
@@ -434,11 +504,11 @@ class Extract:
             forecastQ=dftemp.to_dict(orient='index')
             forecastData={
                 'çlimateRegion':climateRegion,
-                'tercile_lower':thresholds['P33'].drop_vars(['quantile']).to_series().to_dict(),
-                'tercile_upper':thresholds['P66'].drop_vars(['quantile']).to_series().to_dict(),
+                'tercile_lower':thresholds['P33'].to_series().to_dict(),
+                'tercile_upper':thresholds['P66'].to_series().to_dict(),
                 'forecast':forecastQ
                 }
-            tercile_seasonal_prc_df = thresholds['P33'].drop_vars(['quantile']).to_dataframe(name='p33')        
+            tercile_seasonal_prc_df = thresholds['P33'].to_dataframe(name='p33')        
             tercile_seasonal_prc_df = tercile_seasonal_prc_df.reset_index().drop('forecastMonth', axis=1)
             dftemp=anomalies_df.anomaly 
             tercile_seasonal_prc_df['triggerForecast'] = (dftemp.iloc[:, :51].lt(tercile_seasonal_prc_df.iloc[:, 0], axis=0).sum(axis=1) / 51) 
@@ -446,20 +516,26 @@ class Extract:
             tercile_seasonal_prc_df.index = range(1, len(tercile_seasonal_prc_df)+1 )
             data_dict = tercile_seasonal_prc_df[['triggerForecast','triggerStatus']].to_dict(orient="index")  
 
+            # likelihood and share of the region in drought extent, on the native grid
+            region_weights = get_admin_zonal_index(
+                country,
+                climate_region['adm_level'],
+                self.load.get_adm_boundaries(country, climate_region['adm_level']),
+                lower_tercile_ds.latitude.values,
+                lower_tercile_ds.longitude.values,
+                method=zonal_method,
+            ).union(filtered_gdf['placeCode'].values)
+            probability = lower_tercile_ds['probability']
+            region_likelihood = region_weights.median(probability.values)[:, 0]
+            region_drought_area = region_weights.share(
+                np.where(np.isnan(probability.values), np.nan, probability.values > trigger_on_minimum_probability)
+            )[:, 0]
+            forecast_months = list(probability.forecastMonth.values)
+
             for month in forecastData['tercile_lower'].keys():
                 lead_time=month-1
-                lower_tercile_file = f"{self.outputPathGrid}/rlower_tercile_probability_{lead_time}-month_{country}.tif"   
-
-                # Open the TIF file as an xarray object
-                rlower_tercile_probability = rioxarray.open_rasterio(lower_tercile_file)
-                gdf1 = filtered_gdf
-                clipped_regional_mean = rlower_tercile_probability.rio.clip(gdf1.geometry, gdf1.crs, drop=True, all_touched=True)
-                likelihood = round(np.nanmedian(clipped_regional_mean.values),2)
-                binary_clipped_regional_mean = (
-                    clipped_regional_mean > trigger_on_minimum_probability
-                    ).astype(int)
-                anomalies_df = binary_clipped_regional_mean.to_dataframe(name='anomaly')
-                percentage_greater_than_zero = (anomalies_df.anomaly.values > 0).sum() / anomalies_df.anomaly.values.size  
+                likelihood = round(float(region_likelihood[forecast_months.index(month)]), 2)
+                percentage_greater_than_zero = region_drought_area[forecast_months.index(month)]
 
                 if percentage_greater_than_zero > trigger_on_minimum_admin_area_in_drought_extent:
                     triggered=1
@@ -483,131 +559,114 @@ class Extract:
             logging.info(f"finished extraction of rainfall forecast for climate region{climateRegion}")
 
 
-    def compare_forecast_to_historical_lower_tercile(self,country,ds_hindcast, ds_forecast,trigger_on_minimum_probability):
+    def backtest_ecmwf_data(self, country: str = None, datestart: datetime = None) -> pd.DataFrame:
+        """
+        Backtest the trigger model on the hindcast of the run, the one the climatology
+        is computed from: trigger outcome of each hindcast year, climate region and
+        lead time, with leave-one-out terciles. Writes the outcomes and the hit/false
+        alarm table to the output directory, labelled with the initialization month
+        of the hindcast (not of datestart), and returns the table.
+        """
+        if country is None:
+            country = self.country
+        trigger_model = self.settings.get_country_setting(country, "trigger_model")
+        if trigger_model['model'] not in CLIMATOLOGY_AGGREGATIONS:
+            raise ValueError(f"Trigger model {trigger_model['model']} not supported")
+        zonal_method = trigger_model.get('zonal-method', 'coverage')
+        logging.info(f"backtest trigger model {trigger_model['model']} of {country} on the hindcast")
+
+        tprate_hindcast = self.get_hindcast(CLIMATOLOGY_AGGREGATIONS[trigger_model['model']])['tprate']
+        climate_regions = self.get_climate_regions(country)
+        region_weights = stack_weights([
+            get_admin_zonal_index(
+                country,
+                climate_region['adm_level'],
+                self.load.get_adm_boundaries(country, climate_region['adm_level']),
+                tprate_hindcast.latitude.values,
+                tprate_hindcast.longitude.values,
+                method=zonal_method,
+            ).union(climate_region['gdf']['placeCode'].values)
+            for climate_region in climate_regions.values()
+        ])
+        backtest = backtest_trigger_model(
+            tprate_hindcast,
+            region_weights,
+            trigger_model['tercile_treshold'],
+            trigger_model['trigger-on-minimum-probability'],
+            trigger_model['trigger-on-minimum-admin-area-in-drought-extent'],
+        ).assign_coords(climate_region=list(climate_regions.keys()))
+
+        outcomes = backtest.to_dataframe().reset_index()
+        outcomes['lead_time'] = outcomes['forecastMonth'] - 1
+        outcomes['climate_region_code'] = outcomes['climate_region']
+        outcomes['climate_region_name'] = outcomes['climate_region'].map(
+            {code: region['name'] for code, region in climate_regions.items()})
+        outcomes['outcome'] = classify_outcome(outcomes['triggered'], outcomes['drought'])
+        outcomes[['likelihood', 'drought_area']] = outcomes[['likelihood', 'drought_area']].round(2)
+        outcomes = outcomes[[
+            'climate_region_code', 'climate_region_name', 'lead_time', 'year',
+            'likelihood', 'drought_area', 'triggered', 'drought', 'outcome',
+        ]].sort_values(['climate_region_code', 'lead_time', 'year'])
+        scores = get_backtest_scores(outcomes)
+
+        init_month = pd.to_datetime(tprate_hindcast.time.values[0]).strftime("%m")
+        outcomes.to_csv(f"{self.outputPathGrid}/backtest_outcomes_{country}_{init_month}.csv", index=False)
+        scores_path = f"{self.outputPathGrid}/backtest_{country}_{init_month}.csv"
+        scores.to_csv(scores_path, index=False)
+        logging.info(
+            f"backtest of {len(backtest.year)} years: {int(outcomes['triggered'].sum())} triggers,"
+            f" {int((outcomes['outcome'] == 'hit').sum())} hits, written to {scores_path}"
+        )
+        return scores
+
+    def compare_forecast_to_historical_lower_tercile(self,country,tercile_lower, ds_forecast,trigger_on_minimum_probability):
         """
-        Compare the forecast data against the historical lower tercile (33rd percentile).    
+        Compare the forecast data against the historical lower tercile (33rd percentile)
+        and save the probability and drought extent rasters.
         Parameters:
-            ds_hindcast (xarray.Dataset): Historical hindcast dataset containing 'tprate'.
+            tercile_lower (xarray.DataArray): Lower tercile of the hindcast per forecast month and grid cell.
             ds_forecast (xarray.Dataset): Forecast dataset containing 'tprate'.        
         Returns:
-            xarray.Dataset: A dataset containing the 33rd percentile (lower tercile) 
-                            and probability of forecast being below this threshold.
+            xarray.Dataset: A dataset containing the probability of forecast being below 
+                            the lower tercile and the drought extent, per forecast month,
+                            on the native grid of the forecast.
         """
-        
-        probability_maps = []
-        drought_extent_maps = []
-        quantile_thr= self.settings.get_country_setting(country,"trigger_model")["tercile_treshold"]    
-
-        raster_files={}
-
-        # Iterate over each forecast month
-        for month in ds_hindcast.forecastMonth.values:
-            lead_time=month-1
+        output_ds = compute_lower_tercile_probability(
+            tercile_lower,
+            ds_forecast['tprate'],
+            trigger_on_minimum_probability,
+        )
+        self.save_lower_tercile_rasters(upsample_lower_tercile_probability(output_ds), country)
+        output_ds.to_netcdf(f"{self.outputPathGrid}/lower_tercile_probability_{country}.nc")
+        return output_ds
 
-            # Extract data for the current forecast month
-            data_month = ds_hindcast['tprate'].sel(forecastMonth=month)
-            data_month2 = ds_forecast['tprate'].sel(forecastMonth=month) 
-            quantile_33 = data_month.quantile(quantile_thr, dim=["time", "number"])
-            probability = (data_month2 <= quantile_33).sum(dim="number") / data_month2.sizes["number"]
-            new_lat = np.linspace(probability.latitude.values.min(), probability.latitude.values.max(), probability.latitude.size * 10)
-            new_lon = np.linspace(probability.longitude.values.min(), probability.longitude.values.max(), probability.longitude.size * 10)
-            regional_mean = probability.rio.write_crs("EPSG:4326")
-            resampled_regional_mean = regional_mean.interp(latitude=new_lat, longitude=new_lon, method="nearest")
-            
-            # Ensure the resampled DataArray has spatial dimensions
-            resampled_regional_mean = resampled_regional_mean.rio.write_crs("EPSG:4326")
-            resampled_regional_mean = resampled_regional_mean.drop_vars([coord for coord in resampled_regional_mean.coords if coord not in ['latitude', 'longitude']])      
-            binary_clipped_regional_mean = (resampled_regional_mean > trigger_on_minimum_probability).astype(int)
-            raster_files[month]=binary_clipped_regional_mean
-
-            # Store results
-            probability_maps.append(resampled_regional_mean)
-            drought_extent_maps.append(binary_clipped_regional_mean)
-            latitudes = resampled_regional_mean.latitude.values
-            longitudes = resampled_regional_mean.longitude.values
-
-            # Define the transform
-            transform = from_origin(longitudes[0], latitudes[0], longitudes[1] - longitudes[0], latitudes[0] - latitudes[1])
-            prefix='rlower_tercile_probability'
-            temp_output = f"{self.outputPathGrid}/temp_{prefix}.tif"
-            output_file = f"{self.outputPathGrid}/{prefix}_{lead_time}-month_{country}.tif"
-            data = resampled_regional_mean.values
+    def save_lower_tercile_rasters(self, output_ds: xr.Dataset, country: str):
+        """
+        Put probability and drought extent of each forecast month,
+        clipped to the country, in the in-memory raster store.
+        """
+        # country outline from the local boundary store
+        admin_gdf = self.load.get_country_outline(country)
 
-            with rasterio.open(
-                temp_output,
-                'w',
-                driver='GTiff',
-                height=data.shape[0],
-                width=data.shape[1],
-                count=1,
-                dtype=data.dtype,
-                crs='EPSG:4326',
-                transform=transform,
-            ) as dst:
-                dst.write(data, 1)
+        latitudes = output_ds.latitude.values
+        longitudes = output_ds.longitude.values
 
-            # Download admin boundaries from  Natural Earth
-            url = "https://naturalearth.s3.amazonaws.com/110m_cultural/ne_110m_admin_0_countries.zip" #TODO: pull country shapefile from IBF API instead
-            admin0 = gpd.read_file(url)
-            admin_gdf=admin0.query("ADM0_A3 == @country")
-            admin_gdf = admin_gdf.to_crs('EPSG:4326')  # Ensure CRS matches raster
-
-            # Clip using rasterio.mask
-            with rasterio.open(temp_output) as src:
-                clipped_image, clipped_transform = mask(src, admin_gdf.geometry, crop=True)
-                clipped_meta = src.meta.copy()
-
-            # Update metadata
-            clipped_meta.update({
-                "height": clipped_image.shape[1],
-                "width": clipped_image.shape[2],
-                "transform": clipped_transform
-            })
-
-            # Save clipped raster
-            with rasterio.open(output_file, 'w', **clipped_meta) as dst:
-                dst.write(clipped_image)
-            prefix='drought_extent' #'drought_extent'    
-            output_file = f"{self.outputPathGrid}/{prefix}_{lead_time}-month_{country}.tif"
-            temp_output = f"{self.outputPathGrid}/temp_{prefix}.tif"
-            data = binary_clipped_regional_mean.values
-            with rasterio.open(
-                temp_output,
-                'w',
-                driver='GTiff',
-                height=data.shape[0],
-                width=data.shape[1],
-                count=1,
-                dtype=data.dtype,
-                crs='+proj=latlong',
-                transform=transform,
-            ) as dst:
-                dst.write(data, 1)
+        # Define the transform
+        transform = from_origin(longitudes[0], latitudes[0], longitudes[1] - longitudes[0], latitudes[0] - latitudes[1])
 
-            # Clip using rasterio.mask
-            with rasterio.open(temp_output) as src:
-                clipped_image, clipped_transform = mask(src, admin_gdf.geometry, crop=True)
-                clipped_meta = src.meta.copy()
-
-            # Update metadata
-            clipped_meta.update({
-                "height": clipped_image.shape[1],
-                "width": clipped_image.shape[2],
-                "transform": clipped_transform
-            })
-
-            # Save clipped raster
-            with rasterio.open(output_file, 'w', **clipped_meta) as dst:
-                dst.write(clipped_image)
-                
-        # Combine results into new DataArrays
-        quantile_ds = xr.concat(drought_extent_maps, dim="forecastMonth")
-        probability_ds = xr.concat(probability_maps, dim="forecastMonth")
-        
-        # Save results to a new dataset
-        output_ds = xr.Dataset({
-            "quantile_33": quantile_ds,
-            "probability": probability_ds,
-          
-        })
-        return raster_files
\ No newline at end of file
+        for month in output_ds.forecastMonth.values:
+            lead_time=month-1
+            for prefix, variable, crs in [
+                ('rlower_tercile_probability', 'probability', 'EPSG:4326'),
+                ('drought_extent', 'drought_extent', '+proj=latlong'),
+            ]:
+                raster = Raster(
+                    output_ds[variable].sel(forecastMonth=month).values,
+                    transform,
+                    crs=crs,
+                )
+                # Clip to the country
+                self.data.rasters.put(
+                    f"{prefix}_{lead_time}-month_{country}.tif",
+                    raster.mask(admin_gdf.geometry, crop=True),
+                )
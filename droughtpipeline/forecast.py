@@ -2,64 +2,37 @@ from droughtpipeline.secrets import Secrets
 from droughtpipeline.settings import Settings
 from droughtpipeline.data import (
     PipelineDataSets,
-    ForecastDataUnit
+    ForecastDataUnit,
+    object_array,
 )
 from droughtpipeline.load import Load
 from droughtpipeline.utils import replace_year_month
+from droughtpipeline.zonal import AdminHierarchy, get_admin_zonal_index, get_zone_sums
+from droughtpipeline.population import (
+    POPULATION_RESOLUTIONS,
+    PopulationPyramid,
+    PopulationStore,
+    get_affected_population,
+    get_affected_population_on_grid,
+    get_boundaries_version,
+    get_population_window,
+    get_total_population,
+    get_zonal_population,
+)
+from droughtpipeline.raster import Raster
+from droughtpipeline.cache import get_cache_dir, get_file_version
+from droughtpipeline.context import RunContext
 from datetime import datetime, date, timedelta
-from typing import List
-from shapely import Polygon
-from shapely.geometry import shape
 import pandas as pd
-from rasterstats import zonal_stats
 import os
+import logging
 import numpy as np
-import rasterio
-from rasterio.merge import merge
-from rasterio.mask import mask
-from rasterio.features import shapes
 import rioxarray
+import xarray as xr
 import warnings
 warnings.simplefilter("ignore", category=RuntimeWarning)
 
 
-def merge_rasters(raster_filepaths: list) -> tuple:
-    """Merge rasters into a single one, return the merged raster and its metadata"""
-    if len(raster_filepaths) > 0:
-        with rasterio.open(raster_filepaths[0]) as src:
-            out_meta = src.meta.copy()
-    mosaic, out_trans = merge(raster_filepaths)
-    out_meta.update(
-        {
-            "driver": "GTiff",
-            "height": mosaic.shape[1],
-            "width": mosaic.shape[2],
-            "transform": out_trans,
-        }
-    )
-    return mosaic, out_meta
-
-
-def clip_raster(
-    raster_filepath: str, shapes: List[Polygon], invert: bool = False
-) -> tuple:
-    """Clip raster with a list of polygons, return the clipped raster and its metadata"""
-    crop = True if not invert else False
-    with rasterio.open(raster_filepath) as src:
-        outImage, out_transform = mask(src, shapes, crop=crop, invert=invert)
-        outMeta = src.meta.copy()
-    outMeta.update(
-        {
-            "driver": "GTiff",
-            "height": outImage.shape[1],
-            "width": outImage.shape[2],
-            "transform": out_transform,
-            "compress": "lzw",
-        }
-    )
-    return outImage, outMeta
-
-
 def classify_alert(
     triggered: str,
     likelihood,
@@ -120,17 +93,20 @@ class Forecast:
         settings: Settings = None,
         secrets: Secrets = None,
         data: PipelineDataSets = None,
+        context: RunContext = None,
     ):
         self.secrets = None
         self.settings = None
         self.set_settings(settings)
         self.set_secrets(secrets)
-        self.load = Load(settings=self.settings, secrets=self.secrets)
-        self.input_data_path: str = "data/input"
-        self.output_data_path: str = "data/output"
+        self.context = context if context is not None else RunContext.legacy()
+        self.load = Load(settings=self.settings, secrets=self.secrets, context=self.context)
+        self.input_data_path: str = self.context.input_dir
+        self.output_data_path: str = self.context.output_dir
         self.drought_extent_raster: str = self.output_data_path + "/rainfall_forecast.tif" # 'rainfall_forecast_0-month changed to drought_extent_raster     
         self.pop_raster: str = self.input_data_path + "/population_density.tif"
         self.aff_pop_raster: str = self.output_data_path + "/affected_population.tif"
+        self.population_on_grid: Raster = None  # population summed on the drought extent grid
         self.data = data
 
     def set_settings(self, settings):
@@ -188,6 +164,7 @@ class Forecast:
             elif scenario == "NoWarning":
                 trigger_on_minimum_probability = 0.99
 
+        zonal_method = self.settings.get_country_setting(country, "trigger_model").get('zonal-method', 'coverage')
         classify_alert_on = self.settings.get_country_setting(country, "classify-alert-on")
         alert_on_minimum_probability = self.settings.get_country_setting(
             country, "alert-on-minimum-probability"
@@ -210,16 +187,43 @@ class Forecast:
                     raise ValueError("climate region not defined in config file ") 
         '''  
 
+        lower_tercile_ds = self.get_lower_tercile_probability(country)
+        probability = lower_tercile_ds['probability']
+        forecast_months = list(probability.forecastMonth.values)
+        drought_extent = np.where(
+            np.isnan(probability.values), np.nan, probability.values > trigger_on_minimum_probability
+        )
+
+        # likelihood and share in drought extent of all admin areas, for all lead times at once
+        admin_indexes, admin_likelihoods, admin_drought_areas = {}, {}, {}
+        for adm_level in admin_levels:
+            admin_indexes[adm_level] = get_admin_zonal_index(
+                country,
+                adm_level,
+                self.load.get_adm_boundaries(country, adm_level),
+                probability.latitude.values,
+                probability.longitude.values,
+                method=zonal_method,
+            )
+            admin_weights = admin_indexes[adm_level].weights
+            admin_likelihoods[adm_level] = admin_weights.median(probability.values)
+            admin_drought_areas[adm_level] = admin_weights.share(drought_extent)
+
         for climateregion in self.data.threshold_climateregion.get_climate_region_codes():
-            for lead_time in range(0, 6):   
-                pcodes=self.data.threshold_climateregion.get_data_unit(climate_region_code=climateregion).pcodes
-                output_file = f"{self.output_data_path}/rlower_tercile_probability_{lead_time}-month_{country}.tif"   
-
-                # Open the TIF file as an xarray object
-                rlower_tercile_probability = rioxarray.open_rasterio(output_file)
-                for adm_level in admin_levels:
-                    climateRegionPcodes=pcodes[f'{adm_level}']
-                    admin_boundary=self.load.get_adm_boundaries(country,adm_level) 
+            pcodes=self.data.threshold_climateregion.get_data_unit(climate_region_code=climateregion).pcodes
+            for adm_level in admin_levels:
+                climateRegionPcodes=pcodes[f'{adm_level}']
+                positions = admin_indexes[adm_level].get_positions(climateRegionPcodes)
+                found = positions >= 0
+                admin_likelihood = np.full((len(forecast_months), len(climateRegionPcodes)), np.nan)
+                admin_drought_area = np.full((len(forecast_months), len(climateRegionPcodes)), np.nan)
+                admin_likelihood[:, found] = admin_likelihoods[adm_level][:, positions[found]]
+                admin_drought_area[:, found] = admin_drought_areas[adm_level][:, positions[found]]
+                admin_triggered = (admin_drought_area > trigger_on_minimum_admin_area_in_drought_extent).astype(int)
+                admin_likelihood = np.round(admin_likelihood, 2)
+
+                for lead_time in range(0, 6):   
+                    month_index = forecast_months.index(lead_time + 1)
                     climate_data_unit = self.data.rainfall_climateregion.get_climate_region_data_unit(climateregion, lead_time)
                     tercile_lower=climate_data_unit.tercile_lower
                     likelihood=climate_data_unit.likelihood
@@ -251,76 +255,164 @@ class Forecast:
                             )
                         )
                     
-                    for pcode in climateRegionPcodes: 
-                        gdf1 = admin_boundary.query(f'adm{adm_level}_pcode == @pcode')
-                        clipped_regional_mean = rlower_tercile_probability.rio.clip(gdf1.geometry, gdf1.crs, drop=True, all_touched=True)
-                        likelihood = round(np.nanmedian(clipped_regional_mean.values),2)
-                        binary_clipped_regional_mean = (
-                            clipped_regional_mean > trigger_on_minimum_probability
-                            ).astype(int)
-                        anomalies_df = binary_clipped_regional_mean.to_dataframe(name='anomaly')
-                        percentage_greater_than_zero = (anomalies_df.anomaly.values > 0).sum() / anomalies_df.anomaly.values.size  
-
-                        if percentage_greater_than_zero > trigger_on_minimum_admin_area_in_drought_extent:
-                            triggered=1
-                        else:
-                            triggered=0
-
-                        alert_class_admin = classify_alert(
-                            triggered,
-                            likelihood,
+                    # all admin areas of the climate region at once
+                    alert_class_admin = object_array([
+                        classify_alert(
+                            int(triggered_admin),
+                            float(likelihood_admin),
                             classify_alert_on,
                             alert_on_minimum_probability,
                         )
-                        self.data.forecast_admin.timestamp = data_timestamp
-                        self.data.forecast_admin.upsert_data_unit(
-                            ForecastDataUnit(
-                            pcode=pcode,
-                            adm_level=adm_level, 
-                            lead_time=lead_time,        ########## check this         
-                            triggered=triggered,
-                            alert_class=alert_class_admin,
-                            #likelihood=likelihood,
-                            #tercile_lower=tercile_lower,
-                            forecast=forecast,
-                            #tercile_upper=tercile_upper,
-                        ))
+                        for triggered_admin, likelihood_admin in zip(
+                            admin_triggered[month_index], admin_likelihood[month_index]
+                        )
+                    ])
+                    self.data.forecast_admin.timestamp = data_timestamp
+                    self.data.forecast_admin.upsert(
+                        pcode=climateRegionPcodes,
+                        adm_level=adm_level,
+                        lead_time=lead_time,        ########## check this
+                        triggered=admin_triggered[month_index],
+                        alert_class=alert_class_admin,
+                        forecast=forecast,
+                    )
+
+    def get_lower_tercile_probability(self, country: str) -> xr.Dataset:
+        """Get probability of rainfall below the lower tercile on the native forecast grid,
+        from the extract step of this run or from its output file"""
+        if self.data.lower_tercile_probability is None:
+            with xr.open_dataset(
+                f"{self.output_data_path}/lower_tercile_probability_{country}.nc"
+            ) as lower_tercile_ds:
+                self.data.lower_tercile_probability = lower_tercile_ds.load()
+        return self.data.lower_tercile_probability
                         
+    def get_population_resolution(self) -> str:
+        """
+        Resolution of the affected population: 'worldpop' (full resolution) or
+        'forecast_grid' (population pyramid level matching the drought extent grid)
+        """
+        try:
+            resolution = self.settings.get_setting("population_resolution")
+        except ValueError:
+            return "worldpop"
+        if resolution not in POPULATION_RESOLUTIONS:
+            raise ValueError(
+                f"Population resolution {resolution} is not supported, use one of {', '.join(POPULATION_RESOLUTIONS)}"
+            )
+        return resolution
+
+    def get_population_on_grid(self, drought_extent: Raster) -> Raster:
+        """Population summed on the grid of the drought extent, from the population pyramid"""
+        if self.population_on_grid is None or self.population_on_grid.transform != drought_extent.transform:
+            # the pyramid level is read once and shared by all lead times
+            pyramid = PopulationPyramid(get_cache_dir(self.settings))
+            level = pyramid.get_level(
+                self.pop_raster, get_file_version(self.pop_raster), drought_extent.transform
+            )
+            shape = drought_extent.read(1).shape
+            self.population_on_grid = Raster(
+                get_population_window(level, drought_extent.transform, shape),
+                drought_extent.transform,
+                crs=level.crs,
+                nodata=None,
+            )
+        return self.population_on_grid
+
     def __compute_affected_pop_raster(self):
         """Compute affected population raster given a flood extent"""
         country = self.data.forecast_admin.country
+        population_resolution = self.get_population_resolution()
+        self.population_on_grid = None
 
         # get population density raster
         self.load.get_population_density(country, self.pop_raster)
-        flood_shapes = []
 
         for lead_time in self.data.forecast_admin.get_lead_times():
-            flood_raster_lead_time = self.output_data_path + f"/drought_extent_{lead_time}-month_{country}.tif" 
-            aff_pop_raster_lead_time = self.aff_pop_raster.replace(
-                ".tif", f"_{lead_time}_{country}.tif"
+            drought_extent = self.data.rasters.get(
+                f"drought_extent_{lead_time}-month_{country}.tif",
+                fallback_dir=self.output_data_path,
             )
-            if os.path.exists(aff_pop_raster_lead_time):
-                os.remove(aff_pop_raster_lead_time)
-
-            with rasterio.open(flood_raster_lead_time) as dataset:
-                # Read the dataset's valid data mask as a ndarray.
-                image = dataset.read(1).astype(np.float32)
-                image[image >= 0.5]=1# self.settings.get_setting("minimum_for_drought_extent")] = 1
-                rasterio_shapes = shapes(
-                    image, transform=dataset.transform
-                )  # convert flood extent raster to vector (list of shapes)
-                for geom, val in rasterio_shapes:
-                    if val >= 0.5:#self.settings.get_setting("minimum_for_drought_extent"):
-                        flood_shapes.append(shape(geom))
-            # clip population density raster with flood shapes and save the result
-            if len(flood_shapes) > 0:
-                affected_pop_raster, affected_pop_meta = clip_raster(
-                    self.pop_raster, flood_shapes
+            # population in drought extent, kept in memory
+            if population_resolution == "forecast_grid":
+                affected_pop_raster = get_affected_population_on_grid(
+                    self.get_population_on_grid(drought_extent), drought_extent, threshold=0.5
+                )
+            else:
+                affected_pop_raster = get_affected_population(
+                    self.pop_raster, drought_extent, threshold=0.5  # self.settings.get_setting("minimum_for_drought_extent")
+                )
+            if affected_pop_raster is not None:
+                self.data.rasters.put(
+                    self.get_affected_pop_raster_name(lead_time, country),
+                    affected_pop_raster,
                 )
-                with rasterio.open(
-                    aff_pop_raster_lead_time, "w", **affected_pop_meta
-                ) as dest:
-                    dest.write(affected_pop_raster)
+
+    def get_total_population(self, country: str, hierarchy: AdminHierarchy, boundaries_version: str) -> dict:
+        """
+        Get total population per pcode of each admin level of the hierarchy from the
+        population store; if missing, compute it for the finest admin level, roll it up
+        and save it
+        """
+        if self.population_on_grid is not None:
+            # same grid and weights as the affected population
+            sums = get_zonal_population([self.population_on_grid], country, hierarchy)[0]
+            return {level: hierarchy.rollup(sums, level) for level in hierarchy.pcodes}
+        population_version = get_file_version(self.pop_raster)
+        keys = {
+            level: PopulationStore.get_key(country, level, population_version, boundaries_version)
+            for level in hierarchy.pcodes
+        }
+        store = PopulationStore(get_cache_dir(self.settings))
+        pop = {level: store.load(key) for level, key in keys.items()}
+        if all(level_pop is not None for level_pop in pop.values()):
+            logging.info(f"loaded population per pcode of admin levels {list(pop)} from {store.cache_dir}")
+            return pop
+        logging.info(f"computing population per pcode of admin level {hierarchy.adm_level}")
+        sums = get_total_population(self.pop_raster, hierarchy.geometries)
+        for level, key in keys.items():
+            pop[level] = hierarchy.rollup(sums, level)
+            store.save(key, pop[level])
+        return pop
+
+    def get_admin_hierarchies(self, country: str, adm_levels: list) -> list:
+        """
+        Admin hierarchies to compute zonal sums with: the finest admin level, rolled up to
+        the coarser levels; levels which cannot be rolled up get their own hierarchy.
+        Returns a list of (hierarchy, boundaries version).
+        """
+        hierarchies = []
+        for adm_lvl in sorted(adm_levels, reverse=True):
+            if any(hierarchy.has_level(adm_lvl) for hierarchy, _ in hierarchies):
+                continue
+            if hierarchies:
+                logging.warning(
+                    f"admin level {hierarchies[0][0].adm_level} boundaries of {country} have no "
+                    f"adm{adm_lvl}_pcode, computing admin level {adm_lvl} separately"
+                )
+            gdf_adm = self.load.get_adm_boundaries(country, adm_lvl)
+            hierarchies.append(
+                (
+                    AdminHierarchy(gdf_adm, adm_lvl, adm_levels),
+                    get_boundaries_version(gdf_adm, f"adm{adm_lvl}_pcode"),
+                )
+            )
+        return hierarchies
+
+    def get_zonal_sums(self, country: str, hierarchy: AdminHierarchy, rasters: list) -> np.ndarray:
+        """Sums of rasters per finest admin area of the hierarchy, all rasters at once"""
+        if not rasters:
+            return np.zeros((0, hierarchy.n_zones))
+        if self.population_on_grid is not None:
+            # coverage-weighted sums on the drought extent grid
+            return get_zonal_population(rasters, country, hierarchy)
+        return get_zone_sums(hierarchy.geometries, rasters)
+
+    def get_affected_pop_raster_name(self, lead_time: int, country: str) -> str:
+        """File name of the affected population raster of a lead time"""
+        return os.path.basename(self.aff_pop_raster).replace(
+            ".tif", f"_{lead_time}_{country}.tif"
+        )
 
     def __compute_affected_pop(self):
         """Compute affected population given a flood extent"""
@@ -328,85 +420,41 @@ class Forecast:
         # calculate affected population raster
         self.__compute_affected_pop_raster()
         country = self.data.threshold_climateregion.country
-
-        #this have to be calculated per admin level
-        # calculate affected population per admin division
-        for adm_lvl in self.settings.get_country_setting(country, "admin-levels"):
-        
-            # get adm boundaries
-            gdf_adm = self.load.get_adm_boundaries(
-                self.data.forecast_admin.country, adm_lvl
+        forecast_admin = self.data.forecast_admin
+        adm_levels = self.settings.get_country_setting(country, "admin-levels")
+
+        # calculate affected population per admin division: zonal sums of all lead times
+        # at once for the finest admin level, rolled up to the coarser levels
+        for hierarchy, boundaries_version in self.get_admin_hierarchies(country, adm_levels):
+            aff_pop_rasters = {}
+            for lead_time in forecast_admin.get_lead_times():
+                aff_pop_raster_lead_time = self.get_affected_pop_raster_name(lead_time, country)
+                if self.data.rasters.exists(aff_pop_raster_lead_time):
+                    aff_pop_rasters[lead_time] = self.data.rasters.get(aff_pop_raster_lead_time)
+            aff_sums = dict(
+                zip(aff_pop_rasters, self.get_zonal_sums(country, hierarchy, list(aff_pop_rasters.values())))
             )
-            gdf_aff_pop, gdf_pop = pd.DataFrame(), pd.DataFrame()
-            ''' 
-            for climateRegion in climateRegions:#merged_data['Climate_Region_code'].unique().tolist():
-                pcodes=self.data.threshold_climateregion.get_data_unit(climate_region_code=climateRegion).pcodes           
-
-                climateRegionPcodes=pcodes[f'{adm_lvl}']
-                filtered_gdf = gdf_adm[gdf_adm[f'adm{adm_lvl}_pcode'].isin(climateRegionPcodes)]
-                filtered_gdf['placeCode']= filtered_gdf[f'adm{adm_lvl}_pcode']               
-            '''
-
-            for lead_time in self.data.forecast_admin.get_lead_times():
-                aff_pop_raster_lead_time = self.aff_pop_raster.replace(
-                    ".tif", f"_{lead_time}_{country}.tif"
-                )
-                if os.path.exists(aff_pop_raster_lead_time):
-                    # perform zonal statistics on affected population raster
-                    with rasterio.open(aff_pop_raster_lead_time) as src:
-                        raster_array = src.read(1)
-                        raster_array[raster_array < 0.0] = 0.0
-                        transform = src.transform
-
-                    stats = zonal_stats(
-                        gdf_adm,
-                        raster_array,
-                        affine=transform,
-                        stats=["sum"],
-                        all_touched=True,
-                        nodata=0.0,
-                    )
-                    gdf_aff_pop = pd.concat([gdf_adm, pd.DataFrame(stats)], axis=1)
-                    gdf_aff_pop.index = gdf_aff_pop[f"adm{adm_lvl}_pcode"]
-
-                    # perform zonal statistics on population density raster (to compute % aff pop)
-                    with rasterio.open(self.pop_raster) as src:
-                        raster_array = src.read(1)
-                        raster_array[raster_array < 0.0] = 0.0
-                        transform = src.transform
-                    stats = zonal_stats(
-                        gdf_adm,
-                        raster_array,
-                        affine=transform,
-                        stats=["sum"],
-                        all_touched=True,
-                        nodata=0.0,
+            # total population per pcode (to compute % aff pop), the same for all lead times
+            pop = self.get_total_population(country, hierarchy, boundaries_version) if aff_pop_rasters else {}
+
+            for adm_lvl in adm_levels:
+                if not hierarchy.has_level(adm_lvl):
+                    continue
+                total_pop = pop.get(adm_lvl, pd.Series(dtype=float))
+                for lead_time in forecast_admin.get_lead_times():
+                    # add affected population to the triggered admin areas
+                    positions = forecast_admin.filter(lead_time=lead_time, adm_level=adm_lvl)
+                    positions = positions[np.nan_to_num(forecast_admin.get_column("triggered", positions)) != 0]
+                    pcodes = forecast_admin.get_column("pcode", positions)
+                    # admin areas without statistics get no affected population
+                    if lead_time in aff_sums:
+                        aff_pop = hierarchy.rollup(aff_sums[lead_time], adm_lvl)
+                    else:
+                        aff_pop = pd.Series(dtype=float)
+                    pop_affected = aff_pop.reindex(pcodes).fillna(0).values.astype(np.int64)
+                    pcode_pop = total_pop.reindex(pcodes).values.astype(float)
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        pop_affected_perc = np.where(np.isnan(pcode_pop), 0.0, pop_affected / pcode_pop * 100.0)
+                    forecast_admin.update(
+                        positions, pop_affected=pop_affected, pop_affected_perc=pop_affected_perc
                     )
-                    gdf_pop = pd.concat([gdf_adm, pd.DataFrame(stats)], axis=1)
-                    gdf_pop.index = gdf_pop[f"adm{adm_lvl}_pcode"] 
-   
-
-                # add affected population to forecast data units
-            
-                for forecast_data_unit in self.data.forecast_admin.get_data_units(
-                    lead_time=lead_time,adm_level=adm_lvl
-                    ):
-                    if forecast_data_unit.triggered:
-                        try:
-                            pop_affected = int(
-                                gdf_aff_pop.loc[forecast_data_unit.pcode, "sum"]
-                            )
-                        except (ValueError, TypeError, KeyError):
-                            pop_affected = 0
-                        forecast_data_unit.pop_affected = pop_affected
-                        try:
-                            forecast_data_unit.pop_affected_perc = (
-                                float(
-                                    pop_affected
-                                    / gdf_pop.loc[forecast_data_unit.pcode, "sum"]
-                                )
-                                * 100.0
-                            )
-
-                        except (ValueError, TypeError, KeyError):
-                            forecast_data_unit.pop_affected_perc = 0.0
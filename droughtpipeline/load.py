@@ -1,16 +1,28 @@
 from __future__ import annotations
 
 import os.path
-import copy
 import time
 import os
 import json
+import threading
 import cdsapi  
 from droughtpipeline.secrets import Secrets
 from droughtpipeline.settings import Settings
+from droughtpipeline.cache import ForecastCache, HindcastCache, covers_request, get_cache_dir, get_cache_max_size
+from droughtpipeline.boundaries import BoundaryStore
+from droughtpipeline.context import RunContext
+from droughtpipeline.raster import RasterStore
+from droughtpipeline.clients import (
+    IBFAPIClient,
+    UploadPool,
+    execute_cosmos_batches,
+    fetch_file,
+    get_cosmos_client,
+)
 from droughtpipeline.data import (
     AdminDataSet,
     AdminDataUnit,
+    ForecastDataSet,
     ForecastDataUnit,
     ClimateRegionDataSet,  
     ClimateRegionDataUnit
@@ -18,17 +30,24 @@ from droughtpipeline.data import (
 from urllib.error import HTTPError
 import urllib.request, json
 from datetime import datetime, timedelta, date
-import azure.cosmos.cosmos_client as cosmos_client
 import logging
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import requests
 import geopandas as gpd
 import shutil
+import tempfile
 from itertools import product
 from azure.storage.blob import BlobServiceClient
 from azure.core.exceptions import ResourceNotFoundError
 
+CDS_API_URL = 'https://cds.climate.copernicus.eu/api'
+CDS_SEASONAL_DATASET = 'seasonal-monthly-single-levels'
+ECMWF_SYSTEM = "51"
+ECMWF_LEADTIME_MONTHS = ["1", "2", "3", "4", "5", "6"]
+ECMWF_HINDCAST_YEARS = [str(year) for year in range(1991, 2021)]
+
+IBF_API_EXPOSURE_ENDPOINT = "admin-area-dynamic-data/exposure"
+IBF_API_RASTER_ENDPOINT = "admin-area-dynamic-data/raster/drought"
+IBF_API_LOG_LOCK = threading.Lock()  # uploads append to the same log files
+
 COSMOS_DATA_TYPES = [
     "climate-region",
     "seasonal-rainfall-forecast",
@@ -44,26 +63,148 @@ def get_cosmos_query(
     climate_region_code=None,
     pcode=None,
     lead_time=None,
+    fields=None,
 ):
-    query = "SELECT * FROM c WHERE "
-    if start_date is not None:
-        query += f'c.timestamp >= "{start_date.strftime("%Y-%m-%dT%H:%M:%S")}" '
-    if end_date is not None:
-        query += f'AND c.timestamp <= "{end_date.strftime("%Y-%m-%dT%H:%M:%S")}" '
-    if country is not None:
-        query += f'AND c.country = "{country}" '
-    if adm_level is not None:    
-        query += f'AND c.adm_level = "{adm_level}" '
-    if climate_region_code is not None:    
-        query += f'AND c.climate_region_code = "{climate_region_code}" '
-    if pcode is not None:
-        query += f'AND c.adm_level = "{pcode}" '
-    if lead_time is not None:
-        query += f'AND c.adm_level = "{lead_time}" '
-    if query.endswith("WHERE "):
-        query = query.replace("WHERE ", "")
-    query = query.replace("WHERE AND", "WHERE")
-    return query
+    """Build a parameterized Cosmos DB query, return the query and its parameters"""
+    select = "*" if not fields else ", ".join(f"c.{field}" for field in fields)
+    filters = [
+        ("c.timestamp >= @start_date", "@start_date",
+         start_date.strftime("%Y-%m-%dT%H:%M:%S") if start_date is not None else None),
+        ("c.timestamp <= @end_date", "@end_date",
+         end_date.strftime("%Y-%m-%dT%H:%M:%S") if end_date is not None else None),
+        ("c.country = @country", "@country", country),
+        ("c.adm_level = @adm_level", "@adm_level", adm_level),
+        ("c.climate_region_code = @climate_region_code", "@climate_region_code", climate_region_code),
+        ("c.pcode = @pcode", "@pcode", pcode),
+        ("c.lead_time = @lead_time", "@lead_time", lead_time),
+    ]
+    conditions, parameters = [], []
+    for condition, name, value in filters:
+        if value is not None:
+            conditions.append(condition)
+            parameters.append({"name": name, "value": value})
+    query = f"SELECT {select} FROM c"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, parameters
+
+
+def get_data_unit_from_record(data_type: str, record: dict):
+    """Build the data unit of a Cosmos DB record"""
+    if data_type in ["seasonal-rainfall-forecast", "seasonal-rainfall-forecast-climate-region"]:
+        return ForecastDataUnit(
+            adm_level=record["adm_level"],
+            pcode=record["pcode"],
+            climate_region_code=record["climate_region_code"],
+            lead_time=record["lead_time"],
+            triggered=record["triggered"],
+            tercile_upper=record["tercile_upper"],
+            tercile_lower=record["tercile_lower"],
+            likelihood=record["likelihood"],
+            pop_affected=record["pop_affected"],
+            pop_affected_perc=record["pop_affected_perc"],
+            alert_class=record["alert_class"],
+        )
+    elif data_type == "climate-region":
+        return ClimateRegionDataUnit(
+            adm_level=record["adm_level"],
+            climate_region_code=record["climate_region_code"],
+            climate_region_name=record["climate_region_name"],
+            pcodes=record["pcodes"],
+        )
+    else:
+        raise ValueError(f"Invalid data type {data_type}")
+
+
+def get_ecmwf_seasonal_request(years: list, month, area: list) -> dict:
+    """Build CDS request for ECMWF SEAS5 monthly mean total precipitation"""
+    return {
+        "originating_centre": "ecmwf",
+        "system": ECMWF_SYSTEM,
+        "variable": ["total_precipitation"],
+        "product_type": ["monthly_mean"],
+        "year": [str(year) for year in years],
+        "month": [f"{int(month):02}"],
+        "leadtime_month": ECMWF_LEADTIME_MONTHS,
+        "data_format": "grib",
+        "area": area, # North, West, South, East
+    }
+
+
+def get_ecmwf_hindcast_request(area: list) -> dict:
+    """Build CDS request for the ECMWF SEAS5 hindcast (1991-2020)"""
+    return get_ecmwf_seasonal_request(
+        years=ECMWF_HINDCAST_YEARS,
+        month="03",
+        area=area,
+    )
+
+
+def get_area_size(area: list) -> float:
+    """Size (square degrees) of an area (North, West, South, East)"""
+    return max(area[0] - area[2], 0) * max(area[3] - area[1], 0)
+
+
+def get_ecmwf_domains(areas: dict, slack: float = 0.5) -> list:
+    """
+    Merge the request areas of several countries into as few CDS domains as possible:
+    two domains are merged while their bounding box is at most (1 + slack) times
+    the area they cover. Returns a list of (area, countries).
+    """
+    domains = [(list(area), [country]) for country, area in areas.items()]
+    while len(domains) > 1:
+        best = None
+        for i in range(len(domains)):
+            for j in range(i + 1, len(domains)):
+                (a, _), (b, _) = domains[i], domains[j]
+                merged = [max(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])]
+                overlap = [min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3])]
+                covered = get_area_size(a) + get_area_size(b) - get_area_size(overlap)
+                ratio = get_area_size(merged) / covered if covered > 0 else float("inf")
+                if ratio <= 1 + slack and (best is None or ratio < best[0]):
+                    best = (ratio, i, j, merged)
+        if best is None:
+            break
+        _, i, j, merged = best
+        domains[i] = (merged, domains[i][1] + domains[j][1])
+        del domains[j]
+    return domains
+
+
+def get_seas5_domain_link_path(target: str) -> str:
+    """Path of the link from a SEAS5 file of a country to the domain file covering it"""
+    return os.path.splitext(target)[0] + "_domain.json"
+
+
+def get_seas5_domain_file_path(target: str) -> str:
+    """Path of the domain file covering a SEAS5 file of a country, in the run input directory"""
+    root, ext = os.path.splitext(target)
+    return root + "_domain" + ext
+
+
+def read_seas5_domain_link(target: str) -> dict:
+    """Domain file (path) and area of the country of a SEAS5 file, None if it is not linked"""
+    link_path = get_seas5_domain_link_path(target)
+    if not os.path.exists(link_path):
+        return None
+    with open(link_path, "r") as file:
+        return json.load(file)
+
+
+def is_cds_job_ready(job) -> bool:
+    """Check if a submitted CDS request is ready for download,
+    raise RuntimeError if it failed"""
+    if hasattr(job, "results_ready"):
+        # CDS API client (ecmwf-datastores), raises if the request failed
+        return job.results_ready
+    # legacy cdsapi client
+    job.update()
+    state = job.reply["state"]
+    if state == "completed":
+        return True
+    elif state in ("queued", "accepted", "running"):
+        return False
+    raise RuntimeError(f"CDS request failed with state {state}: {job.reply.get('error')}")
 
 
 def get_data_unit_id(data_unit: AdminDataUnit, dataset: AdminDataSet):
@@ -101,14 +242,19 @@ def forecast_trigger_status(triggered: bool, trigger_class: str):
 class Load:
     """Download/upload data from/to a data storage"""
 
-    def __init__(self, settings: Settings = None, secrets: Secrets = None):
+    def __init__(self, settings: Settings = None, secrets: Secrets = None, context: RunContext = None):
         self.secrets = None
         self.settings = None
+        self.context = context if context is not None else RunContext.legacy()
         if settings is not None:
             self.set_settings(settings)
         if secrets is not None:
             self.set_secrets(secrets)
         self.rasters_sent = []
+        self.hindcast_cache = None
+        self.forecast_cache = None
+        self.boundary_store = None
+        self.ibf_api_client = None
 
     def set_settings(self, settings):
         """Set settings"""
@@ -135,20 +281,35 @@ class Load:
             ]
         )
         self.secrets = secrets
+        self.ibf_api_client = None  # log in again with the new secrets
 
     def get_population_density(self, country: str, file_path: str):
-        """Get population density data from worldpop and save to file_path"""
-        r = requests.get(            
-             f"{self.settings.get_setting('worldpop_url')}/{country.upper()}/{country.lower()}_ppp_2020_UNadj_constrained.tif" #f"{self.settings.get_setting('worldpop_url')}/{country.upper()}/{country.lower()}_ppp_2022_1km_UNadj_constrained.tif" 
-        )
-        if "404 Not Found" in str(r.content):
+        """Get population density data from worldpop and save to file_path;
+        the download is kept in the cache directory and only repeated if the file changed"""
+        file_name = f"{country.lower()}_ppp_2020_UNadj_constrained.tif"
+        url = f"{self.settings.get_setting('worldpop_url')}/{country.upper()}/{file_name}" #f"{self.settings.get_setting('worldpop_url')}/{country.upper()}/{country.lower()}_ppp_2022_1km_UNadj_constrained.tif" 
+        cache_path = os.path.join(get_cache_dir(self.settings), "worldpop", file_name)
+        try:
+            fetch_file(url, cache_path)
+        except FileNotFoundError:
             raise FileNotFoundError(
                 f"Population density data not found for country {country}"
             )
-        with open(file_path, "wb") as file:
-            file.write(r.content)
+        if os.path.abspath(cache_path) == os.path.abspath(file_path):
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        try:
+            os.link(cache_path, file_path)
+        except OSError:  # e.g. cache on another file system
+            shutil.copyfile(cache_path, file_path)
 
     def get_adm_boundaries(self, country: str, adm_level: int) -> gpd.GeoDataFrame:
+        """Get admin areas from the local boundary store, fetched from IBF API if missing or expired"""
+        return self.get_boundary_store().get_adm_boundaries(country, adm_level)
+
+    def fetch_adm_boundaries(self, country: str, adm_level: int) -> gpd.GeoDataFrame:
         """Get admin areas from IBF API"""
         try:
             adm_boundaries = self.ibf_api_get_request(
@@ -165,88 +326,88 @@ class Load:
             )
         return gdf_adm_boundaries
 
-    def __ibf_api_authenticate(self):
-        no_attempts, attempt, login_response = 5, 0, None
-        while attempt < no_attempts:
-            try:
-                login_response = requests.post(
-                    self.secrets.get_secret("IBF_API_URL") + "user/login",
-                    data=[
-                        ("email", self.secrets.get_secret("IBF_API_USER")),
-                        ("password", self.secrets.get_secret("IBF_API_PASSWORD")),
-                    ],
-                )
-                break
-            except requests.exceptions.ConnectionError:
-                attempt += 1
-                logging.warning(
-                    "IBF API currently not available, trying again in 1 minute"
-                )
-                time.sleep(60)
-        if not login_response:
-            raise ConnectionError("IBF API not available")
-        return login_response.json()["user"]["token"]
+    def get_boundary_store(self) -> BoundaryStore:
+        """Get local store of country boundaries"""
+        if self.boundary_store is None:
+            ttl_days = 30
+            if self.settings is not None:
+                try:
+                    ttl_days = float(self.settings.get_setting("boundaries_ttl_days"))
+                except ValueError:
+                    pass
+            self.boundary_store = BoundaryStore(
+                get_cache_dir(self.settings),
+                fetch_adm_boundaries=self.fetch_adm_boundaries,
+                ttl_days=ttl_days,
+            )
+        return self.boundary_store
 
-    def ibf_api_post_request(self, path, body=None, files=None):
-        token = self.__ibf_api_authenticate()
-        if body is not None:
-            headers = {
-                "Authorization": "Bearer " + token,
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-            }
-        elif files is not None:
-            headers = {"Authorization": "Bearer " + token}
-        else:
-            raise ValueError("No body or files provided")
-        session = requests.Session()
-        retry = Retry(connect=3, backoff_factor=0.5)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        r = session.post(
-            self.secrets.get_secret("IBF_API_URL") + path,
-            json=body,
-            files=files,
-            headers=headers,
+    def get_country_outline(self, country: str) -> gpd.GeoDataFrame:
+        """Get admin-0 outline of a country, to clip rasters with"""
+        return self.get_boundary_store().get_country_outline(country)
+
+    def get_ibf_api_client(self) -> IBFAPIClient:
+        """Get the IBF API client, shared by all requests of this run"""
+        if self.ibf_api_client is None:
+            self.ibf_api_client = IBFAPIClient(
+                self.secrets.get_secret("IBF_API_URL"),
+                self.secrets.get_secret("IBF_API_USER"),
+                self.secrets.get_secret("IBF_API_PASSWORD"),
+                pool_maxsize=self.get_ibf_api_max_workers(),
+            )
+        return self.ibf_api_client
+
+    def get_ibf_api_max_workers(self) -> int:
+        """Number of concurrent IBF API uploads (1 to upload sequentially)"""
+        try:
+            return max(int(self.settings.get_setting("ibf_api_max_workers")), 1)
+        except (AttributeError, ValueError):
+            return 1
+
+    def get_upload_pool(self) -> UploadPool:
+        """Pool of concurrent uploads to the IBF API, with raster uploads limited separately"""
+        endpoint_limits = {}
+        try:
+            endpoint_limits[IBF_API_RASTER_ENDPOINT] = int(self.settings.get_setting("ibf_api_max_raster_uploads"))
+        except ValueError:
+            pass
+        return UploadPool(
+            self.ibf_api_post_request,
+            max_workers=self.get_ibf_api_max_workers(),
+            endpoint_limits=endpoint_limits,
         )
+
+    def ibf_api_post_request(self, path, body=None, files=None):
+        r = self.get_ibf_api_client().post(path, body=body, files=files)
         if r.status_code >= 400:
             raise ValueError(
                 f"Error in IBF API POST request: {r.status_code}, {r.text}"
             )
-        if not os.path.exists("logs"):
-            os.makedirs("logs")
+        log_dir = self.context.log_dir
+        os.makedirs(log_dir, exist_ok=True)
         if body:
             filename = body["date"]
             filename = "".join(x for x in filename if x.isalnum())
             filename = filename + ".json"
-            filename = os.path.join("logs", filename)
+            filename = os.path.join(log_dir, filename)
             logs = {"endpoint": path, "payload": body}
-            with open(filename, "a") as file:
+            with IBF_API_LOG_LOCK, open(filename, "a") as file:
                 file.write(str(logs) + "\n")
         elif files:
             filename = datetime.today().strftime("%Y%m%d") + ".json"
-            filename = os.path.join("logs", filename)
-            logs = {"endpoint": path, "payload": files}
-            with open(filename, "a") as file:
+            filename = os.path.join(log_dir, filename)
+            logs = {
+                "endpoint": path,
+                "payload": {
+                    key: value[0] if isinstance(value, tuple) else value
+                    for key, value in files.items()
+                },
+            }
+            with IBF_API_LOG_LOCK, open(filename, "a") as file:
                 file.write(str(logs) + "\n")
 
     def ibf_api_get_request(self, path, parameters=None):
-        token = self.__ibf_api_authenticate()
-        headers = {
-            "Authorization": "Bearer " + token,
-            "Accept": "*/*",
-        }
-        session = requests.Session()
-        retry = Retry(connect=3, backoff_factor=0.5)
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        r = session.get(
-            self.secrets.get_secret("IBF_API_URL") + path,
-            headers=headers,
-            params=parameters,
-        )
+        r = self.get_ibf_api_client().get(path, parameters=parameters)
         if r.status_code >= 400:
             raise ValueError(f"Error in IBF API GET request: {r.status_code}, {r.text}")
         return r.json()
@@ -254,11 +415,12 @@ class Load:
 
     def send_to_ibf_api(
         self,
-        forecast_data: AdminDataSet,
+        forecast_data: ForecastDataSet,
         threshold_climateregion: ClimateRegionDataSet,
         forecast_climateregion: ClimateRegionDataSet,
         drought_extent: str = None,
         upload_time: datetime = datetime.now(),
+        rasters: RasterStore = None,
     ):
         """Send drought forecast data to IBF API"""
 
@@ -279,157 +441,169 @@ class Load:
 
         processed_pcodes = []
 
-        current_year = upload_time.year
-        current_month = upload_time.month
-        current_month_abb = upload_time.strftime('%b')
-        upload_time = datetime.today().strftime(f"{current_year}-{current_month:02}-%dT%H:%M:%SZ")
-
-        for climate_region_code in forecast_climateregion.get_climate_region_codes():
-            pcodes = threshold_climateregion.get_data_unit(
-                climate_region_code=climate_region_code).pcodes
-            possible_events = self.settings.get_leadtime_for_climate_region_code(
-                country, climate_region_code, current_month_abb)
-            lead_times_list=[]
-            expected_events = {}
-
-            for entry in possible_events:
-                for key, value in entry.items():
-                    season_name=key
-                    lead_time = int(value.split('-')[0])
-                    expected_events[lead_time] = season_name
-                    lead_times_list.append(lead_time)
-
-            # current events
-            events = self.__list_events_from_climateregion(
-                forecast_climateregion, 
-                climate_region_code)
-
-            climate_region_name = self.settings.get_climate_region_name_by_code(
-                country,climate_region_code)  
-
-            for lead_time_event in range(0, 4):
-                # NOTE: here we are assuming we will not expect two events in a climate region  with the same lead time
-                if lead_time_event in list(expected_events.keys()):
-                    season_name = expected_events[lead_time_event]
-                    if climate_region_name.lower().split('_')[0] == 'national':
-                        event_name = f"{season_name}_National"
-                    else:
-                        event_name = (f"{climate_region_name} {season_name}_{climate_region_name}")
-                    # NOTE: exposure data is updated with new data during pre-season and not updated during the season
-                    preseason_event, forecast_data_to_send = self.__fetch_or_fallback(
-                        climate_region_code,
-                        lead_time_event, 
-                        current_year,
-                        current_month,
-                        country,
-                        season_name,
-                        forecast_data, 
-                    )
-                    if (preseason_event is False) or (
-                        (lead_time_event not in events) and (preseason_event is None)):
-                        # NOTE: this is to skip to upload empty exposure when no events and no data fetched
-                        continue
+        # exposure and raster uploads run concurrently, the notification is sent after all of them;
+        # if preparing them fails, the uploads not started yet are cancelled
+        with self.get_upload_pool() as uploads:
+            current_year = upload_time.year
+            current_month = upload_time.month
+            current_month_abb = upload_time.strftime('%b')
+            upload_time = datetime.today().strftime(f"{current_year}-{current_month:02}-%dT%H:%M:%SZ")
+
+            for climate_region_code in forecast_climateregion.get_climate_region_codes():
+                pcodes = threshold_climateregion.get_data_unit(
+                    climate_region_code=climate_region_code).pcodes
+                possible_events = self.settings.get_leadtime_for_climate_region_code(
+                    country, climate_region_code, current_month_abb)
+                lead_times_list=[]
+                expected_events = {}
+
+                for entry in possible_events:
+                    for key, value in entry.items():
+                        season_name=key
+                        lead_time = int(value.split('-')[0])
+                        expected_events[lead_time] = season_name
+                        lead_times_list.append(lead_time)
+
+                # current events
+                events = self.__list_events_from_climateregion(
+                    forecast_climateregion, 
+                    climate_region_code)
+
+                climate_region_name = self.settings.get_climate_region_name_by_code(
+                    country,climate_region_code)  
+
+                for lead_time_event in range(0, 4):
+                    # NOTE: here we are assuming we will not expect two events in a climate region  with the same lead time
+                    if lead_time_event in list(expected_events.keys()):
+                        season_name = expected_events[lead_time_event]
+                        if climate_region_name.lower().split('_')[0] == 'national':
+                            event_name = f"{season_name}_National"
+                        else:
+                            event_name = (f"{climate_region_name} {season_name}_{climate_region_name}")
+                        # NOTE: exposure data is updated with new data during pre-season and not updated during the season
+                        preseason_event, forecast_data_to_send = self.__fetch_or_fallback(
+                            climate_region_code,
+                            lead_time_event, 
+                            current_year,
+                            current_month,
+                            country,
+                            season_name,
+                            forecast_data, 
+                        )
+                        if (preseason_event is False) or (
+                            (lead_time_event not in events) and (preseason_event is None)):
+                            # NOTE: this is to skip to upload empty exposure when no events and no data fetched
+                            continue
+                        for indicator in indicators:
+                            for adm_level in admin_levels:
+                                exposure_pcodes = []
+                                for pcode in pcodes[f'{adm_level}']:
+                                    forecast_admin = forecast_data_to_send.get_data_unit(
+                                        pcode=pcode,
+                                        lead_time=lead_time
+                                    )
+                                    amount = None
+                                    if indicator == "population_affected":
+                                        amount = forecast_admin.pop_affected
+                                    elif indicator == "population_affected_percentage":
+                                        amount = forecast_admin.pop_affected_perc
+                                    elif indicator == "forecast_severity":
+                                        amount = forecast_admin.triggered 
+                                    elif indicator == "forecast_trigger":
+                                        amount = forecast_trigger_status(
+                                            triggered=(forecast_admin.triggered >= 0),
+                                            trigger_class=pipeline_will_trigger_portal,
+                                        )
+                                    exposure_pcodes.append({
+                                        "placeCode": pcode, 
+                                        "amount": amount
+                                    })
+                                    processed_pcodes.append(pcode)
+
+                                body = {
+                                    "countryCodeISO3": country,
+                                    "leadTime": f"{lead_time_event}-month",
+                                    "dynamicIndicator": indicator,
+                                    "adminLevel": int(adm_level),
+                                    "exposurePlaceCodes": exposure_pcodes,
+                                    "disasterType": disasterType,
+                                    "eventName": event_name,
+                                    "date": upload_time,
+                                }
+                                statsPath=drought_extent.replace(".tif", f"_{event_name}_{lead_time_event}-month_{country}_{adm_level}.json" )
+                                statsPath=statsPath.replace("rainfall_forecast", f"{indicator}")
+
+                                with open(statsPath, 'w') as fp:
+                                        json.dump(body, fp)
+
+                                uploads.submit(IBF_API_EXPOSURE_ENDPOINT, body=body)
+                        processed_pcodes = list(set(processed_pcodes))
+                    
+            # END OF EVENT LOOP
+            ###############################################################################################################
+
+            # drought extent raster: admin-area-dynamic-data/raster/droughts
+            self.rasters_sent = []
+
+            if rasters is None:
+                rasters = RasterStore()
+
+            for lead_time in range(0,4):
+                # NOTE: new drought extent raster is updated during the season
+                drought_extent_new = drought_extent.replace(".tif", f"_{lead_time}-month_{country}.tif" )            
+
+                # to accompdate file name requirement in IBF portal 
+                rainf_extent=drought_extent_new.replace("rainfall_forecast", "rlower_tercile_probability")
+                rain_rp = drought_extent_new.replace("rainfall_forecast", "rain_rp")
+                raster = rasters.get(
+                    os.path.basename(rainf_extent),
+                    fallback_dir=os.path.dirname(rainf_extent),
+                )
+                rasters.put(os.path.basename(rain_rp), raster)
+                self.rasters_sent.append(rain_rp)
+                files = {"file": (os.path.basename(rain_rp), raster.to_bytes())}
+                uploads.submit(IBF_API_RASTER_ENDPOINT, files=files)
+
+            # send empty exposure data
+            if len(processed_pcodes) == 0:
+                logging.info(f"send empty exposure data")
+                for lead_time in set(lead_times_list):
                     for indicator in indicators:
                         for adm_level in admin_levels:
                             exposure_pcodes = []
-                            for pcode in pcodes[f'{adm_level}']:
-                                forecast_admin = forecast_data_to_send.get_data_unit(
-                                    pcode=pcode,
-                                    lead_time=lead_time
-                                )
-                                amount = None
-                                if indicator == "population_affected":
-                                    amount = forecast_admin.pop_affected
-                                elif indicator == "population_affected_percentage":
-                                    amount = forecast_admin.pop_affected_perc
-                                elif indicator == "forecast_severity":
-                                    amount = forecast_admin.triggered 
-                                elif indicator == "forecast_trigger":
-                                    amount = forecast_trigger_status(
-                                        triggered=(forecast_admin.triggered >= 0),
-                                        trigger_class=pipeline_will_trigger_portal,
+                            for pcode in forecast_data.get_pcodes(adm_level=adm_level):
+                                if pcode not in processed_pcodes:
+                                    amount = None
+                                    if indicator == "population_affected":
+                                        amount = 0
+                                    elif indicator == "population_affected_percentage":
+                                        amount = 0.0
+                                    elif indicator == "forecast_trigger":
+                                        amount = 0
+                                    elif indicator == "forecast_severity":
+                                        amount = 0
+                                    exposure_pcodes.append(
+                                        {"placeCode": pcode, "amount": amount}
                                     )
-                                exposure_pcodes.append({
-                                    "placeCode": pcode, 
-                                    "amount": amount
-                                })
-                                processed_pcodes.append(pcode)
-
                             body = {
                                 "countryCodeISO3": country,
-                                "leadTime": f"{lead_time_event}-month",
+                                "leadTime": f"{lead_time}-month",#  "1-day",  # this is a specific check IBF uses to establish no-trigger
                                 "dynamicIndicator": indicator,
-                                "adminLevel": int(adm_level),
+                                "adminLevel": adm_level,
                                 "exposurePlaceCodes": exposure_pcodes,
                                 "disasterType": disasterType,
-                                "eventName": event_name,
+                                "eventName": None,  # this is a specific check IBF uses to establish no-trigger
                                 "date": upload_time,
                             }
-                            statsPath=drought_extent.replace(".tif", f"_{event_name}_{lead_time_event}-month_{country}_{adm_level}.json" )
+                            uploads.submit(IBF_API_EXPOSURE_ENDPOINT, body=body)
+
+                            statsPath=drought_extent.replace(".tif", f"_null_{lead_time}-month_{country}_{adm_level}.json" )
                             statsPath=statsPath.replace("rainfall_forecast", f"{indicator}")
 
                             with open(statsPath, 'w') as fp:
-                                    json.dump(body, fp)
+                                json.dump(body, fp)
 
-                            self.ibf_api_post_request("admin-area-dynamic-data/exposure", body=body )
-                    processed_pcodes = list(set(processed_pcodes))
-                    
-        # END OF EVENT LOOP
-        ###############################################################################################################
-
-        # drought extent raster: admin-area-dynamic-data/raster/droughts
-        self.rasters_sent = []
-
-        for lead_time in range(0,4):
-            # NOTE: new drought extent raster is updated during the season
-            drought_extent_new = drought_extent.replace(".tif", f"_{lead_time}-month_{country}.tif" )            
-
-            # to accompdate file name requirement in IBF portal 
-            rainf_extent=drought_extent_new.replace("rainfall_forecast", "rlower_tercile_probability")
-            rain_rp = drought_extent_new.replace("rainfall_forecast", "rain_rp")
-            shutil.copy(rainf_extent,drought_extent_new.replace("rainfall_forecast", "rain_rp")) 
-            self.rasters_sent.append(rain_rp)
-            files = {"file": open(rain_rp, "rb")}
-            self.ibf_api_post_request( "admin-area-dynamic-data/raster/drought", files=files )
-
-        # send empty exposure data
-        if len(processed_pcodes) == 0:
-            logging.info(f"send empty exposure data")
-            for lead_time in set(lead_times_list):
-                for indicator in indicators:
-                    for adm_level in admin_levels:
-                        exposure_pcodes = []
-                        for pcode in forecast_data.get_pcodes(adm_level=adm_level):
-                            if pcode not in processed_pcodes:
-                                amount = None
-                                if indicator == "population_affected":
-                                    amount = 0
-                                elif indicator == "population_affected_percentage":
-                                    amount = 0.0
-                                elif indicator == "forecast_trigger":
-                                    amount = 0
-                                elif indicator == "forecast_severity":
-                                    amount = 0
-                                exposure_pcodes.append(
-                                    {"placeCode": pcode, "amount": amount}
-                                )
-                        body = {
-                            "countryCodeISO3": country,
-                            "leadTime": f"{lead_time}-month",#  "1-day",  # this is a specific check IBF uses to establish no-trigger
-                            "dynamicIndicator": indicator,
-                            "adminLevel": adm_level,
-                            "exposurePlaceCodes": exposure_pcodes,
-                            "disasterType": disasterType,
-                            "eventName": None,  # this is a specific check IBF uses to establish no-trigger
-                            "date": upload_time,
-                        }
-                        self.ibf_api_post_request("admin-area-dynamic-data/exposure", body=body)
-
-                        statsPath=drought_extent.replace(".tif", f"_null_{lead_time}-month_{country}_{adm_level}.json" )
-                        statsPath=statsPath.replace("rainfall_forecast", f"{indicator}")
-
-                        with open(statsPath, 'w') as fp:
-                            json.dump(body, fp)
+            uploads.wait()
 
         # send notification
         body = {
@@ -450,7 +624,7 @@ class Load:
                 f"Supported storages are {', '.join(COSMOS_DATA_TYPES)}"
             )
         ## check data types
-        if data_type == "seasonal-rainfall-forecast":
+        if data_type == "seasonal-rainfall-forecast" and not isinstance(dataset, ForecastDataSet):
             for data_unit in dataset.data_units:
                 if not isinstance(data_unit, ForecastDataUnit):
                     raise ValueError(
@@ -469,40 +643,65 @@ class Load:
                         f"Data unit {data_unit} is not of type ClimateregionDataUnit"
                     )
 
-        client_ = cosmos_client.CosmosClient(
-            self.secrets.get_secret("COSMOS_URL"),
-            {"masterKey": self.secrets.get_secret("COSMOS_KEY")},
-            user_agent="sml-api",
-            user_agent_overwrite=True,
-        )
-        cosmos_db = client_.get_database_client("drought-pipeline")
-        cosmos_container_client = cosmos_db.get_container_client(data_type)
+        cosmos_container_client = self.get_cosmos_container_client(data_type)
+
+        # New records, the last one per id as with sequential upserts
+        data_units = dataset.data_units
+        if isinstance(dataset, ForecastDataSet):
+            unit_records = dataset.to_records()
+        else:
+            unit_records = [dict(vars(data_unit)) for data_unit in data_units]
+        records = {}
+        for data_unit, record in zip(data_units, unit_records):
+            record["timestamp"] = dataset.timestamp.strftime("%Y-%m-%dT%H:%M:%S")
+            record["country"] = dataset.country
+            record["id"] = get_data_unit_id(data_unit, dataset)
+            records[record["id"]] = record
+        operations = [("upsert", (record,)) for record in records.values()]
 
-        # Check if data of the same month exists
+        # Delete records of the same month which are not overwritten
         start_date, end_date = self.__dates_for_month(
             current_year=dataset.timestamp.year,
             current_month=dataset.timestamp.month,
             )
         if replace_country:
-            query = get_cosmos_query(
+            query, parameters = get_cosmos_query(
                 start_date=start_date,
                 end_date=end_date,
-                country=dataset.country
+                country=dataset.country,
+                fields=["id"],
             )
-            old_records = cosmos_container_client.query_items(query)
-            for old_record in old_records:
-                cosmos_container_client.delete_item(
-                    item=old_record.get("id"), partition_key=dataset.country
-                )
-        
-        # Upsert new records
-        for data_unit in dataset.data_units:
-            record = vars(data_unit)
-            record["timestamp"] = dataset.timestamp.strftime("%Y-%m-%dT%H:%M:%S")
-            record["country"] = dataset.country
-            record["id"] = get_data_unit_id(data_unit, dataset)
-            cosmos_container_client.upsert_item(body=record)
+            old_records = cosmos_container_client.query_items(
+                query=query, parameters=parameters, partition_key=dataset.country
+            )
+            operations = [
+                ("delete", (old_record["id"],))
+                for old_record in old_records
+                if old_record["id"] not in records
+            ] + operations
+
+        execute_cosmos_batches(
+            cosmos_container_client,
+            operations,
+            partition_key=dataset.country,
+            max_workers=self.get_cosmos_max_workers(),
+        )
 
+    def get_cosmos_container_client(self, data_type: str):
+        """Get Cosmos DB container of a data type, through the client shared by this process"""
+        client_ = get_cosmos_client(
+            self.secrets.get_secret("COSMOS_URL"),
+            self.secrets.get_secret("COSMOS_KEY"),
+        )
+        cosmos_db = client_.get_database_client("drought-pipeline")
+        return cosmos_db.get_container_client(data_type)
+
+    def get_cosmos_max_workers(self) -> int:
+        """Number of Cosmos DB batches written in parallel"""
+        try:
+            return max(int(self.settings.get_setting("cosmos_max_workers")), 1)
+        except (AttributeError, ValueError):
+            return 1
 
     def get_pipeline_data(
         self,
@@ -520,106 +719,62 @@ class Load:
                 f"Data type {data_type} is not supported."
                 f"Supported storages are {', '.join(COSMOS_DATA_TYPES)}"
             )
-        client_ = cosmos_client.CosmosClient(
-            self.secrets.get_secret("COSMOS_URL"),
-            {"masterKey": self.secrets.get_secret("COSMOS_KEY")},
-            user_agent="ibf-flood-pipeline",
-            user_agent_overwrite=True,
-        )
-        cosmos_db = client_.get_database_client("drought-pipeline")
-        cosmos_container_client = cosmos_db.get_container_client(data_type)
-        query = get_cosmos_query(
-            start_date, end_date, country, adm_level, pcode, lead_time
+        cosmos_container_client = self.get_cosmos_container_client(data_type)
+        query, parameters = get_cosmos_query(
+            start_date=start_date,
+            end_date=end_date,
+            country=country,
+            adm_level=adm_level,
+            pcode=pcode,
+            lead_time=lead_time,
         )
         records_query = cosmos_container_client.query_items(
             query=query,
+            parameters=parameters,
             enable_cross_partition_query=(
                 True if country is None else None
             ),  # country must be the partition key
         )
-        records = []
+
+        # group records by country and timestamp in a single pass,
+        # keeping only the data units of the latest timestamp
+        latest_key, data_units, no_datasets = None, [], 0
+        seen_keys = set()
         for record in records_query:
-            records.append(copy.deepcopy(record))
-        datasets = []
-        countries = list(set([record["country"] for record in records]))
-        timestamps = list(set([record["timestamp"] for record in records]))
-        for country in countries:
-            for timestamp in timestamps:
-                data_units = []
-                for record in records:
-                    if (
-                        record["country"] == country
-                        and record["timestamp"] == timestamp
-                    ):
-                        if data_type in ["seasonal-rainfall-forecast", "seasonal-rainfall-forecast-climate-region"]:
-                            data_unit = ForecastDataUnit(
-                                adm_level=record["adm_level"],
-                                pcode=record["pcode"],
-                                climate_region_code=record["climate_region_code"],
-                                lead_time=record["lead_time"],
-                                triggered=record["triggered"],
-                                tercile_upper=record["tercile_upper"],
-                                tercile_lower=record["tercile_lower"],
-                                likelihood=record["likelihood"],
-                                pop_affected=record["pop_affected"],
-                                pop_affected_perc=record["pop_affected_perc"],
-                                alert_class=record["alert_class"],
-                            )
-                        # elif data_type == "seasonal-rainfall-forecast-climate-region": # TODO:refine
-                        #     data_unit = ForecastDataUnit(
-                        #         adm_level=record["adm_level"],
-                        #         pcode=record["pcode"],
-                        #         lead_time=record["lead_time"],
-                        #         triggered=record["triggered"],
-                        #         tercile_upper=record["tercile_upper"],
-                        #         tercile_lower=record["tercile_lower"],
-                        #         likelihood=record["likelihood"],
-                        #         pop_affected=record["pop_affected"],
-                        #         pop_affected_perc=record["pop_affected_perc"],
-                        #         alert_class=record["alert_class"],
-                        #     )
-                        elif data_type == "climate-region":
-                            data_unit = ClimateRegionDataUnit(
-                                adm_level=record["adm_level"],
-                                climate_region_code=record["climate_region_code"],
-                                climate_region_name=record["climate_region_name"],
-                                pcodes=record["pcodes"],
-                            )
-            
-                        else:
-                            raise ValueError(f"Invalid data type {data_type}")
-                        data_units.append(data_unit)
-                if (
-                    data_type in [ "seasonal-rainfall-forecast"]#, "seasonal-rainfall-forecast-climate-region"]
-                ):
-                    adm_levels = list( 
-                        set([data_unit.adm_level for data_unit in data_units])
-                    )
-                    dataset = AdminDataSet(
-                        country=country,
-                        timestamp=timestamp,
-                        adm_levels=adm_levels,
-                        data_units=data_units,
-                    )
-                    datasets.append(dataset)
-                else:
-                    dataset = ClimateRegionDataSet(
-                        country=country,
-                        timestamp=timestamp,
-                        data_units=data_units,
-                    )
-                    datasets.append(dataset)
-        if len(datasets) == 0:
+            key = (record["timestamp"], record["country"])
+            if key not in seen_keys:
+                seen_keys.add(key)
+                no_datasets += 1
+            if latest_key is not None and key < latest_key:
+                continue
+            if key != latest_key:
+                latest_key, data_units = key, []
+            data_units.append(get_data_unit_from_record(data_type, record))
+
+        if latest_key is None:
             raise KeyError(
                 f"No datasets of type '{data_type}' found for country {country} in date range "
                 f"{start_date} - {end_date}."
             )
-        elif len(datasets) > 1:
+        timestamp, country = latest_key
+        if no_datasets > 1:
             logging.warning(
                 f"Multiple datasets of type '{data_type}' found for country {country} in date range "
-                f"{start_date} - {end_date}; returning the latest (timestamp {datasets[-1].timestamp}). "
+                f"{start_date} - {end_date}; returning the latest (timestamp {timestamp}). "
+            )
+        if data_type in ["seasonal-rainfall-forecast"]:
+            adm_levels = list(set([data_unit.adm_level for data_unit in data_units]))
+            return ForecastDataSet(
+                country=country,
+                timestamp=timestamp,
+                adm_levels=adm_levels,
+                data_units=data_units,
             )
-        return datasets[-1]
+        return ClimateRegionDataSet(
+            country=country,
+            timestamp=timestamp,
+            data_units=data_units,
+        )
 
     def __get_blob_service_client(self, blob_path: str):
         """Get service client for Azure Blob Storage"""
@@ -673,83 +828,228 @@ class Load:
                 )
 
 
-    def download_ecmwf_forecast(self, country, data_dir, current_year, current_month):
-        """Download ECMWF seasonal hindcast data for historical period
+    def get_cds_client(self, wait_until_complete: bool = False):
+        """Get client for the Copernicus Climate Data Store (CDS)"""
+        return cdsapi.Client(
+            url=CDS_API_URL,
+            key=os.getenv('CDSAPI_KEY'),
+            wait_until_complete=wait_until_complete,
+            delete=False,
+        )
+
+    def download_ecmwf_forecast(
+            self,
+            country,
+            data_dir,
+            current_year,
+            current_month,
+            asynchronous: bool = False,
+            client=None,
+        ):
+        """Download ECMWF seasonal forecast and hindcast data for historical period
         Args:
             country (str): Country name
             data_dir (str): Directory to save data
             current_year (int): Current year
             current_month (int): Current month
+            asynchronous (bool): submit forecast and hindcast requests at once
+                and download each as soon as it is ready
+            client: CDS client, defaults to cdsapi.Client
         """   
+        area = self.get_ecmwf_area(country)
+
+        if client is None:
+            client = self.get_cds_client()
+
+        # Forecast and hindcast data requests
+        forecast_target = f'{data_dir}/ecmwf_seas5_forecast_monthly_tp.grib'
+        hindcast_target = f'{data_dir}/ecmwf_seas5_hindcast_monthly_tp.grib'
+        forecast_request = get_ecmwf_seasonal_request(
+            years=[current_year],
+            month=current_month,
+            area=area,
+        )
+        hindcast_request = get_ecmwf_hindcast_request(area)
+        for target in [forecast_target, hindcast_target]:
+            for path in [get_seas5_domain_link_path(target), get_seas5_domain_file_path(target)]:
+                if os.path.exists(path):
+                    os.remove(path)
+        cds_requests = {}
+
+        # the forecast may be cached, on its own or as part of a domain prefetched for several countries
+        forecast_cache = self.get_forecast_cache()
+        if not self.link_seas5_domain(forecast_cache, forecast_request, forecast_target):
+            cds_requests[forecast_target] = forecast_request
+
+        # the hindcast never changes for a given request, skip CDS if it is cached
+        hindcast_cache = self.get_hindcast_cache()
+        hindcast_key = HindcastCache.get_key_from_request(hindcast_request)
+        if not self.link_seas5_domain(hindcast_cache, hindcast_request, hindcast_target):
+            cds_requests[hindcast_target] = hindcast_request
+
+        if asynchronous:
+            self.retrieve_cds_requests(client, CDS_SEASONAL_DATASET, cds_requests)
+        else:
+            for i, (target, request) in enumerate(cds_requests.items()):
+                if i > 0:
+                    sleep = 30
+                    time.sleep(sleep)
+                client.retrieve(CDS_SEASONAL_DATASET, request, target)
+
+        if forecast_target in cds_requests and os.path.exists(forecast_target):
+            forecast_cache.put(
+                ForecastCache.get_key_from_request(forecast_request), forecast_target, metadata=forecast_request
+            )
+        if hindcast_target in cds_requests and os.path.exists(hindcast_target):
+            hindcast_cache.put(hindcast_key, hindcast_target, metadata=hindcast_request)
+
+    def link_seas5_domain(self, cache, request: dict, target: str) -> bool:
+        """
+        Link target to a cached SEAS5 file covering the area of the request, to be
+        sliced to that area when it is read. The cached file is hard-linked (or copied)
+        into the run input directory, so that it stays there if it is evicted from the
+        cache during the run. Return False if there is none.
+        """
+        key = cache.find(lambda cached_request: covers_request(cached_request, request))
+        if key is None:
+            return False
+        cache_path = cache.get(key)
+        if cache_path is None:
+            return False
+        if os.path.exists(target):
+            os.remove(target)
+        domain_path = get_seas5_domain_file_path(target)
+        try:
+            os.link(cache_path, domain_path)
+        except FileNotFoundError:  # evicted in the meantime
+            return False
+        except OSError:  # e.g. cache on another file system
+            shutil.copyfile(cache_path, domain_path)
+        with open(get_seas5_domain_link_path(target), "w") as file:
+            json.dump({"path": os.path.abspath(domain_path), "area": request["area"]}, file)
+        logging.info(f"using {os.path.basename(target)} from {cache.cache_dir}, sliced to area {request['area']}")
+        return True
+
+    def prefetch_ecmwf_forecast(self, countries: list, current_year, current_month, client=None) -> list:
+        """
+        Download ECMWF seasonal forecast and hindcast data for several countries at once:
+        their areas are merged into as few CDS domains as possible, each downloaded once
+        into the cache, from which the country runs slice their own area
+        Args:
+            countries (list): country ISO3 codes
+            current_year (int): Current year
+            current_month (int): Current month
+            client: CDS client, defaults to cdsapi.Client
+        Returns:
+            list: CDS domains, as (area, countries)
+        """
+        areas = {}
+        for country in countries:
+            try:
+                areas[country] = self.get_ecmwf_area(country)
+            except Exception as e:  # the country run downloads its own area
+                logging.warning(f"could not get ECMWF area of {country}: {e}")
+        domains = get_ecmwf_domains(areas, slack=self.get_cds_domain_merge_slack())
+
+        forecast_cache, hindcast_cache = self.get_forecast_cache(), self.get_hindcast_cache()
+        staging_dir = tempfile.mkdtemp(dir=get_cache_dir(self.settings))
+        try:
+            cds_requests, cache_keys = {}, {}
+            for i, (area, domain_countries) in enumerate(domains):
+                logging.info(f"CDS domain {area} for {', '.join(domain_countries)}")
+                for name, request, cache in [
+                    ("forecast", get_ecmwf_seasonal_request([current_year], current_month, area), forecast_cache),
+                    ("hindcast", get_ecmwf_hindcast_request(area), hindcast_cache),
+                ]:
+                    if cache.find(lambda cached_request: covers_request(cached_request, request)) is not None:
+                        continue
+                    target = os.path.join(staging_dir, f"{name}_{i}.grib")
+                    cds_requests[target] = request
+                    cache_keys[target] = (cache, type(cache).get_key_from_request(request))
+            if cds_requests:
+                if client is None:
+                    client = self.get_cds_client()
+                self.retrieve_cds_requests(client, CDS_SEASONAL_DATASET, cds_requests)
+                for target, request in cds_requests.items():
+                    cache, key = cache_keys[target]
+                    cache.put(key, target, metadata=request)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return domains
+
+    def get_cds_domain_merge_slack(self) -> float:
+        """Extra area allowed when merging CDS domains of several countries, as a fraction"""
+        try:
+            return float(self.settings.get_setting("cds_domain_merge_slack"))
+        except ValueError:
+            return 0.5
+
+    def get_ecmwf_area(self, country) -> list:
+        """Get area of ECMWF requests for a country: its bounding box plus 1 degree"""
         gdf=self.get_adm_boundaries(country,1)
 
         min_x, min_y, max_x, max_y = gdf.total_bounds
-        
-        KEY = os.getenv('CDSAPI_KEY')
-        URL = 'https://cds.climate.copernicus.eu/api'
-
-        c = cdsapi.Client(url=URL, 
-                          key=KEY, 
-                          wait_until_complete=False, 
-                          delete=False)
-
-        # Forecast data request
-        dataset = 'seasonal-monthly-single-levels'
-        request = {
-            "originating_centre": "ecmwf",
-            "system": "51",
-            "variable": ["total_precipitation"],
-            "product_type": ["monthly_mean"],
-            "year": [current_year],
-            "month": [current_month],
-            "leadtime_month": [
-                "1",
-                "2",
-                "3",
-                "4",
-                "5",
-                "6"
-            ],
-            "data_format": "grib",
-            "area": [int(x) for x in [max_y+1 , min_x-1, min_y-1, max_x+1]] # North, West, South, East
-        }
-        target = f'{data_dir}/ecmwf_seas5_forecast_monthly_tp.grib'
-        c.retrieve(dataset, request, target)
+        return [int(x) for x in [max_y+1 , min_x-1, min_y-1, max_x+1]] # North, West, South, East
 
-        sleep = 30
-        time.sleep(sleep)
-        
-        request = {
-            "originating_centre": "ecmwf",
-            "system": "51",
-            "variable": ["total_precipitation"],
-            "product_type": ["monthly_mean"],
-            "year": [
-                "1991", "1992","1993", 
-                "1994", "1995","1996", 
-                "1997", "1998","1999", 
-                "2000", "2001","2002", 
-                "2003", "2004","2005", 
-                "2006", "2007","2008", 
-                "2009", "2010","2011", 
-                "2012", "2013","2014", 
-                "2015", "2016","2017", 
-                "2018", "2019","2020"
-            ],
-            "month": ["03"],
-            "leadtime_month": [
-                "1",
-                "2",
-                "3",
-                "4",
-                "5",
-                "6"
-            ],
-            "data_format": "grib",
-            "area": [int(x) for x in [max_y+1 , min_x-1, min_y-1, max_x+1]] # North, West, South, East
-        }
-        target = f'{data_dir}/ecmwf_seas5_hindcast_monthly_tp.grib'
-        c.retrieve(dataset, request, target)
+    def get_hindcast_cache(self) -> HindcastCache:
+        """Get persistent cache of ECMWF hindcast files"""
+        if self.hindcast_cache is None:
+            self.hindcast_cache = HindcastCache(
+                get_cache_dir(self.settings),
+                max_size=get_cache_max_size(self.settings, "hindcast_cache_max_size_gb"),
+            )
+        return self.hindcast_cache
+
+    def get_forecast_cache(self) -> ForecastCache:
+        """Get persistent cache of ECMWF forecast files (a few MB per month and area)"""
+        if self.forecast_cache is None:
+            self.forecast_cache = ForecastCache(
+                get_cache_dir(self.settings),
+                max_size=get_cache_max_size(self.settings, "forecast_cache_max_size_gb"),
+            )
+        return self.forecast_cache
+
+    def retrieve_cds_requests(
+            self,
+            client,
+            dataset: str,
+            cds_requests: dict,
+            poll_interval: float = 10.0,
+            max_poll_interval: float = 60.0,
+            timeout: float = None,
+        ):
+        """Submit all CDS requests at once, poll their status and download
+        each result as soon as it is ready
+        Args:
+            client: CDS client created with wait_until_complete=False
+            dataset (str): CDS dataset name
+            cds_requests (dict): target file path -> CDS request
+            poll_interval (float): initial seconds between status checks
+            max_poll_interval (float): maximum seconds between status checks
+            timeout (float): give up after this many seconds, wait forever if None
+        """
+        jobs = {}
+        for target, request in cds_requests.items():
+            logging.info(f"submitting CDS request for {os.path.basename(target)}")
+            jobs[target] = client.retrieve(dataset, request)
+
+        start = time.monotonic()
+        sleep = poll_interval
+        while jobs:
+            for target in list(jobs.keys()):
+                if is_cds_job_ready(jobs[target]):
+                    logging.info(f"CDS request ready, downloading {os.path.basename(target)}")
+                    jobs.pop(target).download(target)
+                    sleep = poll_interval
+            if not jobs:
+                break
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError(
+                    f"CDS requests for {', '.join(os.path.basename(t) for t in jobs)}"
+                    f" not completed after {timeout} seconds"
+                )
+            time.sleep(sleep)
+            sleep = min(sleep * 1.5, max_poll_interval)
 
 
     def __look_up_dates(
@@ -5,6 +5,9 @@ from droughtpipeline.load import Load
 from droughtpipeline.secrets import Secrets
 from droughtpipeline.settings import Settings
 from droughtpipeline.data import PipelineDataSets
+from droughtpipeline.context import RunContext
+from droughtpipeline.utils import get_year_months
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 import logging
 import json
@@ -20,23 +23,38 @@ logging.getLogger("requests_oauthlib").setLevel(logging.WARNING)
 class Pipeline:
     """Base class for flood data pipeline"""
 
-    def __init__(self, settings: Settings, secrets: Secrets, country: str):
+    def __init__(
+        self,
+        settings: Settings,
+        secrets: Secrets,
+        country: str,
+        context: RunContext = None,
+        threshold_climateregion: ClimateRegionDataSet = None,
+    ):
         self.settings = settings
+        self.secrets = secrets
         if country not in [c["name"] for c in self.settings.get_setting("countries")]:
             raise ValueError(f"No config found for country {country}")
         self.country = country
-        self.load = Load(settings=settings, secrets=secrets)
+        # working directories of this run, shared by all stages
+        self.context = context if context is not None else RunContext.legacy()
+        self.context.makedirs()
+        self.load = Load(settings=settings, secrets=secrets, context=self.context)
         self.data = PipelineDataSets(country=country, settings=settings)
-        self.data.threshold_climateregion = self.load.get_pipeline_data(data_type="climate-region", country=self.country )
+        if threshold_climateregion is None:
+            threshold_climateregion = self.load.get_pipeline_data(data_type="climate-region", country=self.country )
+        self.data.threshold_climateregion = threshold_climateregion
         self.extract = Extract(
             settings=settings,
             secrets=secrets,
             data=self.data,
+            context=self.context,
         )
         self.forecast = Forecast(
             settings=settings,
             secrets=secrets,
             data=self.data,
+            context=self.context,
         )
 
     def run_pipeline(
@@ -47,14 +65,34 @@ class Pipeline:
         send: bool = True,
         save: bool = False,
         debug: bool = False,  # debug mode with specific datestart of data
+        backtest: bool = False,
         datestart: datetime = date.today(),
+        dateend: datetime = None,
+        max_workers: int = None,
     ):
-        """Run the drought data pipeline"""
+        """Run the drought data pipeline; with dateend, backfill all months from datestart to dateend"""
+        if dateend is not None:
+            return self.run_backfill(
+                datestart,
+                dateend,
+                max_workers=max_workers,
+                prepare=prepare,
+                extract=extract,
+                forecast=forecast,
+                send=send,
+                save=save,
+                debug=debug,
+                backtest=backtest,
+            )
 
         if prepare:
             logging.info("prepare ecmwf data")
             self.extract.prepare_ecmwf_data(country=self.country, debug=debug, datestart=datestart)
 
+        if backtest:
+            logging.info("backtest trigger model on the hindcast")
+            self.extract.backtest_ecmwf_data(country=self.country, datestart=datestart)
+
         if extract:
             logging.info(f"extract ecmwf data")
             self.extract.extract_ecmwf_data(country=self.country, debug=debug, datestart=datestart)
@@ -62,6 +100,7 @@ class Pipeline:
         if forecast:
             logging.info("forecast drought")
             self.forecast.compute_forecast(debug=debug, datestart=datestart)
+            self.write_rasters()
             if save:
                 logging.info("save drought forecasts to storage")
                 self.load.save_pipeline_data(
@@ -101,4 +140,71 @@ class Pipeline:
                 forecast_climateregion=self.data.forecast_climateregion,
                 drought_extent=self.forecast.drought_extent_raster,
                 upload_time=datestart,
+                rasters=self.data.rasters,
             )
+
+        self.write_rasters()
+
+    def get_backfill_max_workers(self) -> int:
+        """Number of months of a backfill run in parallel"""
+        try:
+            return max(int(self.settings.get_setting("backfill_max_workers")), 1)
+        except ValueError:
+            return 1
+
+    def get_month_pipeline(self, datestart: datetime) -> "Pipeline":
+        """
+        Pipeline of one month of a backfill, in its own working directory; it shares
+        the climate region thresholds and, through the process-wide memos, the
+        admin boundaries, zonal weights, climatologies and population sums
+        """
+        context = self.context
+        if context.yearmonth is None:  # shared directories, give each month its own
+            context = RunContext(country=self.country, yearmonth=datestart.strftime("%Y-%m"), run_id=context.run_id)
+        else:
+            context = context.for_month(self.country, datestart.strftime("%Y-%m"))
+        return Pipeline(
+            settings=self.settings,
+            secrets=self.secrets,
+            country=self.country,
+            context=context,
+            threshold_climateregion=self.data.threshold_climateregion,
+        )
+
+    def run_backfill(self, datestart: datetime, dateend: datetime, max_workers: int = None, **options) -> list:
+        """
+        Run the pipeline for all months from datestart to dateend in this process,
+        max_workers months at a time. Returns the year-months run; raises RuntimeError
+        if any of them failed, after all months have run.
+        """
+        months = get_year_months(datestart, dateend)
+        if not months:
+            raise ValueError(f"No months from {datestart} to {dateend}")
+        if max_workers is None:
+            max_workers = self.get_backfill_max_workers()
+        logging.info(
+            f"backfill {self.country} from {months[0].strftime('%Y-%m')} to {months[-1].strftime('%Y-%m')},"
+            f" {max_workers} months at a time"
+        )
+
+        def run_month(month):
+            try:
+                self.get_month_pipeline(month).run_pipeline(datestart=month, **options)
+            except Exception as e:
+                logging.error(f"backfill of {self.country} {month.strftime('%Y-%m')} failed: {e}")
+                return str(e)
+            return None
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backfill") as executor:
+            errors = dict(zip((month.strftime("%Y-%m") for month in months), executor.map(run_month, months)))
+        failed = [month for month, error in errors.items() if error is not None]
+        logging.info(f"backfill of {self.country}: {len(months) - len(failed)}/{len(months)} months succeeded")
+        if failed:
+            raise RuntimeError(f"backfill of {self.country} failed for {', '.join(failed)}")
+        return list(errors)
+
+    def write_rasters(self):
+        """Write rasters of this run to the output directory"""
+        paths = self.data.rasters.write(self.forecast.output_data_path)
+        if paths:
+            logging.info(f"written {len(paths)} rasters to {self.forecast.output_data_path}")
@@ -0,0 +1,343 @@
+import os
+import math
+import hashlib
+import logging
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import shapely
+import rasterio
+from affine import Affine
+from rasterio.shutil import copy as copy_dataset
+from rasterio.warp import reproject, Resampling
+from rasterio.windows import Window
+from droughtpipeline.raster import Raster
+from droughtpipeline.cache import FileCache, get_cache_key
+from droughtpipeline.zonal import AdminHierarchy, get_zonal_weights, rasterize_zones, zone_sum
+
+POPULATION_RESOLUTIONS = ["worldpop", "forecast_grid"]
+PYRAMID_FACTORS = (1, 2, 5, 10)  # pyramid levels, in cells of the drought extent grid
+
+# population per pcode already loaded in this process
+_population_memo = {}
+_population_lock = threading.Lock()
+
+
+def resample_to_grid(
+    raster: Raster, transform, shape: tuple, crs, resampling=Resampling.nearest
+) -> np.ndarray:
+    """Resample the first band of a raster onto another grid, NaN where there is no data"""
+    destination = np.full(shape, np.nan, dtype=np.float32)
+    reproject(
+        source=raster.read(1).astype(np.float32),
+        destination=destination,
+        src_transform=raster.transform,
+        src_crs=raster.crs,
+        src_nodata=raster.nodata,
+        dst_transform=transform,
+        dst_crs=crs,
+        dst_nodata=np.nan,
+        resampling=resampling,
+    )
+    return destination
+
+
+def get_extent_window(extent: np.ndarray, extent_transform, src) -> Window:
+    """Window of a raster dataset covering the cells where extent is true, None if they do not overlap"""
+    rows, cols = np.nonzero(extent)
+    west, north = extent_transform * (cols.min(), rows.min())
+    east, south = extent_transform * (cols.max() + 1, rows.max() + 1)
+    col_start, row_start = ~src.transform * (min(west, east), max(north, south))
+    col_stop, row_stop = ~src.transform * (max(west, east), min(north, south))
+    col_start, row_start = max(math.floor(col_start), 0), max(math.floor(row_start), 0)
+    col_stop, row_stop = min(math.ceil(col_stop), src.width), min(math.ceil(row_stop), src.height)
+    if col_stop <= col_start or row_stop <= row_start:
+        return None
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+
+def get_affected_population(
+    population_path: str, drought_extent: Raster, threshold: float = 0.5
+) -> Raster:
+    """
+    Population in drought extent: the extent is resampled (nearest) onto the
+    population grid and multiplied with it. Only the part of the population raster
+    covering the extent is read; cells outside the extent are nodata.
+    Returns None if no cell is in drought extent.
+    """
+    in_drought = np.nan_to_num(drought_extent.read(1).astype(np.float32)) >= threshold
+    if not in_drought.any():
+        return None
+    with rasterio.open(population_path) as src:
+        window = get_extent_window(in_drought, drought_extent.transform, src)
+        if window is None:
+            return None
+        population = src.read(1, window=window)
+        transform = src.window_transform(window)
+        crs, nodata = src.crs, src.nodata
+    extent_on_population_grid = resample_to_grid(
+        Raster(in_drought.astype(np.float32), drought_extent.transform, crs=drought_extent.crs),
+        transform,
+        population.shape,
+        crs,
+    )
+    affected_population = np.where(
+        extent_on_population_grid == 1, population, nodata if nodata is not None else 0
+    ).astype(population.dtype)
+    return Raster(affected_population, transform, crs=crs, nodata=nodata)
+
+
+def get_boundaries_version(gdf_adm, pcode_column: str) -> str:
+    """Hash of the pcodes and geometries of admin areas"""
+    checksum = hashlib.sha256()
+    checksum.update("|".join(str(pcode) for pcode in gdf_adm[pcode_column]).encode("utf-8"))
+    for wkb in shapely.to_wkb(gdf_adm.geometry.values):
+        checksum.update(wkb if wkb is not None else b"")
+    return checksum.hexdigest()
+
+
+def get_total_population(population_path: str, geometries, block_rows: int = 1024) -> np.ndarray:
+    """
+    Population per geometry: sum over the cells whose center is in the geometry,
+    negative (nodata) values counted as zero. The raster is read and the geometries
+    rasterized in blocks of rows.
+    """
+    sums = np.zeros(len(geometries))
+    with rasterio.open(population_path) as src:
+        for row_off in range(0, src.height, block_rows):
+            window = Window(0, row_off, src.width, min(block_rows, src.height - row_off))
+            data = src.read(1, window=window)
+            if src.nodata is not None:
+                data = np.where(data == src.nodata, 0.0, data)
+            zones = rasterize_zones(geometries, src.window_transform(window), data.shape)
+            sums += zone_sum(zones, data, len(geometries))
+    return sums
+
+
+class PopulationStore(FileCache):
+    """Persistent store of total population per pcode (CSV files)"""
+
+    def __init__(self, cache_dir: str):
+        super().__init__(os.path.join(cache_dir, "population"), suffix=".csv")
+
+    @staticmethod
+    def get_key(country: str, adm_level: int, population_version: str, boundaries_version: str) -> str:
+        """Cache key of population per pcode: country, admin level, WorldPop file and (finest level) boundaries"""
+        return get_cache_key(
+            country=country.upper(),
+            adm_level=int(adm_level),
+            population=population_version,
+            boundaries=boundaries_version,
+        )
+
+    def load(self, key: str) -> pd.Series:
+        """Load population per pcode, return None if not in the store"""
+        with _population_lock:
+            if self.get_path(key) in _population_memo:
+                return _population_memo[self.get_path(key)]
+        path = self.get(key)
+        if path is None:
+            return None
+        population = pd.read_csv(path, index_col="pcode", dtype={"pcode": str})["sum"]
+        with _population_lock:
+            _population_memo[self.get_path(key)] = population
+        return population
+
+    def save(self, key: str, population: pd.Series):
+        """Save population per pcode to the store"""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".csv")
+        os.close(fd)
+        try:
+            population.rename("sum").rename_axis("pcode").to_csv(temp_path)
+            self.put(key, temp_path)
+        finally:
+            os.remove(temp_path)
+        logging.info(f"saved population per pcode {key} to {self.cache_dir}")
+
+
+def get_north_up_lattice(transform: Affine) -> Affine:
+    """Transform of a north-up grid with the same cell edges, e.g. of a south-up grid built from ascending latitudes"""
+    return Affine(transform.a, 0.0, transform.c, 0.0, -abs(transform.e), transform.f)
+
+
+def get_grid_lattice(transform: Affine) -> tuple:
+    """Cell size and origin (modulo cell size) of a grid: grids with the same lattice share cell edges"""
+    transform = get_north_up_lattice(transform)
+
+    def offset(origin, size):
+        size = abs(size)
+        remainder = math.fmod(origin, size) % size
+        if math.isclose(remainder, size, abs_tol=1e-9) or math.isclose(remainder, 0.0, abs_tol=1e-9):
+            remainder = 0.0
+        return round(remainder, 9)
+
+    return (
+        round(transform.a, 9),
+        round(transform.e, 9),
+        offset(transform.c, transform.a),
+        offset(transform.f, transform.e),
+    )
+
+
+def aggregate_population(population_path: str, transform: Affine, block_rows: int = 512) -> Raster:
+    """
+    Sum population onto the cells of a coarser north-up grid, on the lattice of transform,
+    covering the population raster. Each population cell is assigned to the cell its center
+    falls in; negative (nodata) values are counted as zero. The raster is read in blocks of rows.
+    """
+    transform = get_north_up_lattice(transform)
+    with rasterio.open(population_path) as src:
+        inverse = ~transform
+        left, bottom, right, top = src.bounds
+        col_min, row_min = inverse * (left, top)
+        col_max, row_max = inverse * (right, bottom)
+        col_start, row_start = math.floor(col_min + 1e-6), math.floor(row_min + 1e-6)
+        width = math.ceil(col_max - 1e-6) - col_start
+        height = math.ceil(row_max - 1e-6) - row_start
+        grid_transform = transform * Affine.translation(col_start, row_start)
+
+        # grid cell of the center of each population column and row, both non-decreasing
+        x = src.transform.c + (np.arange(src.width) + 0.5) * src.transform.a
+        y = src.transform.f + (np.arange(src.height) + 0.5) * src.transform.e
+        cols = np.clip(np.floor((x - grid_transform.c) / grid_transform.a).astype(np.int64), 0, width - 1)
+        rows = np.clip(np.floor((y - grid_transform.f) / grid_transform.e).astype(np.int64), 0, height - 1)
+        col_starts = np.flatnonzero(np.r_[True, np.diff(cols) != 0])
+
+        sums = np.zeros((height, width), dtype=np.float64)
+        for row_off in range(0, src.height, block_rows):
+            window = Window(0, row_off, src.width, min(block_rows, src.height - row_off))
+            data = src.read(1, window=window).astype(np.float64)
+            invalid = ~np.isfinite(data) | (data < 0.0)
+            if src.nodata is not None:
+                invalid |= data == src.nodata
+            data[invalid] = 0.0
+            block_rows_index = rows[row_off : row_off + data.shape[0]]
+            row_starts = np.flatnonzero(np.r_[True, np.diff(block_rows_index) != 0])
+            partial = np.add.reduceat(np.add.reduceat(data, col_starts, axis=1), row_starts, axis=0)
+            sums[np.ix_(block_rows_index[row_starts], cols[col_starts])] += partial
+        crs = src.crs
+    return Raster(sums.astype(np.float32), grid_transform, crs=crs, nodata=None)
+
+
+def coarsen_population(population: Raster, factor: int, anchor: Affine) -> Raster:
+    """Sum population over blocks of factor x factor cells, aligned with the origin of the anchor grid"""
+    if factor == 1:
+        return population
+    anchor = get_north_up_lattice(anchor)
+    # cell of the population grid origin relative to the anchor grid
+    col, row = (round(v) for v in ~anchor * (population.transform.c, population.transform.f))
+    pad_left, pad_top = col % factor, row % factor
+    data = population.read(1)
+    height = math.ceil((data.shape[0] + pad_top) / factor) * factor
+    width = math.ceil((data.shape[1] + pad_left) / factor) * factor
+    padded = np.zeros((height, width), dtype=np.float64)
+    padded[pad_top : pad_top + data.shape[0], pad_left : pad_left + data.shape[1]] = data
+    coarse = padded.reshape(height // factor, factor, width // factor, factor).sum(axis=(1, 3))
+    transform = population.transform * Affine.translation(-pad_left, -pad_top) * Affine.scale(factor)
+    return Raster(coarse.astype(np.float32), transform, crs=population.crs, nodata=None)
+
+
+def get_population_window(population: Raster, transform: Affine, shape: tuple) -> np.ndarray:
+    """
+    Population on a grid of the same lattice (e.g. the drought extent), zero outside the population raster.
+    The grid may be south-up: the window is then read on the north-up grid and flipped.
+    """
+    if transform.e > 0:
+        north_up = transform * Affine.translation(0, shape[0]) * Affine.scale(1, -1)
+        return get_population_window(population, north_up, shape)[::-1].copy()
+    col, row = (round(v) for v in ~population.transform * (transform.c, transform.f))
+    data = population.read(1)
+    window = np.zeros(shape, dtype=np.float32)
+    src_rows = slice(max(row, 0), min(row + shape[0], data.shape[0]))
+    src_cols = slice(max(col, 0), min(col + shape[1], data.shape[1]))
+    if src_rows.stop > src_rows.start and src_cols.stop > src_cols.start:
+        window[
+            src_rows.start - row : src_rows.stop - row, src_cols.start - col : src_cols.stop - col
+        ] = data[src_rows, src_cols]
+    return window
+
+
+def get_affected_population_on_grid(
+    population: Raster, drought_extent: Raster, threshold: float = 0.5
+) -> Raster:
+    """
+    Population in drought extent on the grid of the drought extent, from population
+    summed on that grid. Returns None if no cell is in drought extent.
+    """
+    in_drought = np.nan_to_num(drought_extent.read(1).astype(np.float32)) >= threshold
+    if not in_drought.any():
+        return None
+    window = get_population_window(population, drought_extent.transform, in_drought.shape)
+    return Raster(
+        np.where(in_drought, window, 0.0).astype(np.float32),
+        drought_extent.transform,
+        crs=population.crs,
+        nodata=None,
+    )
+
+
+def get_zonal_population(populations: list, country: str, hierarchy: AdminHierarchy) -> np.ndarray:
+    """
+    Population per finest admin area on a coarse grid, for several rasters on the same grid
+    (e.g. one per lead time) at once: cell sums weighted by the fraction of each cell covered
+    by the admin area, i.e. population spread evenly within a cell.
+    Returns an array (raster, admin area).
+    """
+    transform = populations[0].transform
+    data = np.stack([population.read(1) for population in populations])
+    latitudes = transform.f + (np.arange(data.shape[1]) + 0.5) * transform.e
+    longitudes = transform.c + (np.arange(data.shape[2]) + 0.5) * transform.a
+    weights = get_zonal_weights(
+        (country, hierarchy.adm_level), hierarchy.geometries, latitudes, longitudes, method="coverage"
+    )
+    return weights.sum(data)
+
+
+def write_cog(raster: Raster, path: str):
+    """Write a raster as cloud-optimized GeoTIFF (tiled, compressed)"""
+    with raster.open() as memfile:
+        with memfile.open() as src:
+            # the coarser pyramid levels are stored as separate files: resampled overviews would not be sums
+            copy_dataset(src, path, driver="COG", compress="DEFLATE", blocksize=256, overviews="NONE")
+
+
+class PopulationPyramid(FileCache):
+    """
+    Persistent store of population summed onto the drought extent grid and coarser
+    grids (cloud-optimized GeoTIFFs), so that affected population is computed from
+    a few kilobytes instead of the full-resolution WorldPop raster
+    """
+
+    def __init__(self, cache_dir: str, factors: tuple = PYRAMID_FACTORS):
+        super().__init__(os.path.join(cache_dir, "population_pyramid"), suffix=".tif")
+        self.factors = factors
+
+    @staticmethod
+    def get_key(population_version: str, transform: Affine) -> str:
+        """Cache key of a pyramid level: WorldPop file and grid lattice"""
+        return get_cache_key(population=population_version, lattice=get_grid_lattice(transform))
+
+    def build(self, population_path: str, population_version: str, transform: Affine):
+        """Aggregate population onto the grid of transform and its coarser levels, and store them"""
+        logging.info(f"building population pyramid of {population_path}")
+        base = aggregate_population(population_path, transform)
+        for factor in self.factors:
+            level = coarsen_population(base, factor, transform)
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tif")
+            os.close(fd)
+            try:
+                write_cog(level, temp_path)
+                self.put(self.get_key(population_version, level.transform), temp_path)
+            finally:
+                os.remove(temp_path)
+        logging.info(f"saved population pyramid levels {self.factors} to {self.cache_dir}")
+
+    def get_level(self, population_path: str, population_version: str, transform: Affine) -> Raster:
+        """Population summed onto the grid of transform; build the pyramid if missing"""
+        key = self.get_key(population_version, transform)
+        path = self.get(key)
+        if path is None:
+            self.build(population_path, population_version, transform)
+            path = self.get(key)
+        return Raster.from_file(path)
@@ -0,0 +1,125 @@
+import os
+import threading
+import numpy as np
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.mask import mask
+from affine import Affine
+
+
+class Raster:
+    """In-memory raster: array (bands, height, width) with its transform and CRS"""
+
+    def __init__(self, data: np.ndarray, transform: Affine, crs="EPSG:4326", nodata=None):
+        data = np.asarray(data)
+        if data.ndim == 2:
+            data = data[np.newaxis, :, :]
+        self.data = data
+        self.transform = transform
+        self.crs = crs
+        self.nodata = nodata
+
+    @property
+    def meta(self) -> dict:
+        """Metadata, as in rasterio dataset.meta"""
+        return {
+            "driver": "GTiff",
+            "height": self.data.shape[1],
+            "width": self.data.shape[2],
+            "count": self.data.shape[0],
+            "dtype": self.data.dtype,
+            "crs": self.crs,
+            "transform": self.transform,
+            "nodata": self.nodata,
+        }
+
+    def read(self, band: int = 1) -> np.ndarray:
+        """Read one band (1-based), as in rasterio dataset.read"""
+        return self.data[band - 1]
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "Raster":
+        """Read raster from file"""
+        with rasterio.open(file_path) as src:
+            return cls(src.read(), src.transform, crs=src.crs, nodata=src.nodata)
+
+    def open(self) -> MemoryFile:
+        """Open as an in-memory rasterio dataset, to be used as a context manager"""
+        memfile = MemoryFile()
+        with memfile.open(**self.meta) as dst:
+            dst.write(self.data)
+        return memfile
+
+    def mask(self, shapes, crop: bool = True, **kwargs) -> "Raster":
+        """Mask with a list of geometries, as in rasterio.mask.mask"""
+        with self.open() as memfile:
+            with memfile.open() as src:
+                data, transform = mask(src, shapes, crop=crop, **kwargs)
+        return Raster(data, transform, crs=self.crs, nodata=self.nodata)
+
+    def to_bytes(self, **profile) -> bytes:
+        """Encode as GeoTIFF"""
+        with MemoryFile() as memfile:
+            with memfile.open(**{**self.meta, **profile}) as dst:
+                dst.write(self.data)
+            return memfile.read()
+
+    def to_file(self, file_path: str, **profile):
+        """Write to GeoTIFF file"""
+        with rasterio.open(file_path, "w", **{**self.meta, **profile}) as dst:
+            dst.write(self.data)
+
+
+class RasterStore:
+    """
+    Named in-memory rasters handed over between pipeline stages;
+    written to disk once, at the end of the run
+    """
+
+    def __init__(self):
+        self.rasters = {}
+        self.written = set()
+        self.lock = threading.Lock()
+
+    def put(self, name: str, raster: Raster):
+        with self.lock:
+            self.rasters[name] = raster
+            self.written.discard(name)
+
+    def get(self, name: str, fallback_dir: str = None) -> Raster:
+        """Get raster by (file) name; if not in memory, read it from fallback_dir"""
+        with self.lock:
+            if name in self.rasters:
+                return self.rasters[name]
+        if fallback_dir is not None and os.path.exists(os.path.join(fallback_dir, name)):
+            raster = Raster.from_file(os.path.join(fallback_dir, name))
+            with self.lock:
+                self.rasters[name] = raster
+                self.written.add(name)  # already on disk
+            return raster
+        raise KeyError(f"Raster {name} not found")
+
+    def exists(self, name: str, fallback_dir: str = None) -> bool:
+        with self.lock:
+            if name in self.rasters:
+                return True
+        return fallback_dir is not None and os.path.exists(os.path.join(fallback_dir, name))
+
+    def names(self) -> list:
+        with self.lock:
+            return list(self.rasters.keys())
+
+    def write(self, output_dir: str, names: list = None) -> list:
+        """Write rasters not written yet to GeoTIFF files in output_dir, return their paths"""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for name in names if names is not None else self.names():
+            with self.lock:
+                if name in self.written:
+                    continue
+            path = os.path.join(output_dir, name)
+            self.get(name).to_file(path, compress="lzw")
+            with self.lock:
+                self.written.add(name)
+            paths.append(path)
+        return paths
@@ -11,4 +11,15 @@ def replace_year_month(dt: datetime, new_year: int, new_month: int):
     except ValueError:
         # Fallback to the last valid day in the new month
         last_day = monthrange(new_year, new_month)[1]
-        return dt.replace(year=new_year, month=new_month, day=last_day)
\ No newline at end of file
+        return dt.replace(year=new_year, month=new_month, day=last_day)
+
+
+def get_year_months(datestart: datetime, dateend: datetime) -> list:
+    '''Dates of all months from datestart to dateend (inclusive), on the day of datestart.
+    '''
+    months = []
+    year, month = datestart.year, datestart.month
+    while (year, month) <= (dateend.year, dateend.month):
+        months.append(replace_year_month(datestart, year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
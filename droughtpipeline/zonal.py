@@ -0,0 +1,379 @@
+import threading
+import numpy as np
+import pandas as pd
+import shapely
+from affine import Affine
+from rasterio.features import geometry_mask, rasterize
+
+ZONAL_METHODS = ["coverage", "all_touched"]
+
+# zonal weights already computed in this process, per admin level and grid
+_zonal_weights_memo = {}
+_zonal_weights_lock = threading.Lock()
+
+
+def get_cell_size(coordinates: np.ndarray) -> float:
+    """Size of the grid cells along a coordinate of cell centers"""
+    if coordinates.size < 2:
+        raise ValueError("Grid must have at least two cells along each axis")
+    return float(abs(coordinates[1] - coordinates[0]))
+
+
+class CoverageWeights:
+    """
+    Sparse coverage of grid cells by polygons: for each (polygon, cell) pair,
+    the fraction of the cell area covered by the polygon
+    """
+
+    def __init__(self, polygon: np.ndarray, cell: np.ndarray, fraction: np.ndarray, n_polygons: int, shape: tuple):
+        self.polygon = polygon
+        self.cell = cell
+        self.fraction = fraction
+        self.n_polygons = n_polygons
+        self.shape = shape
+
+    def _values(self, values: np.ndarray) -> np.ndarray:
+        """Values of the covered cells, for one or more stacked grids (..., lat, lon)"""
+        values = np.asarray(values)
+        if values.shape[-2:] != self.shape:
+            raise ValueError(f"Grid of shape {values.shape[-2:]} does not match weights of shape {self.shape}")
+        return values.reshape(values.shape[:-2] + (-1,))[..., self.cell]
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        """Coverage-weighted sum of the values per polygon, NaN counted as zero"""
+        weighted = np.nan_to_num(self._values(values)) * self.fraction
+        return _group_sum(weighted, self.polygon, self.n_polygons)
+
+    def mean(self, values: np.ndarray) -> np.ndarray:
+        """Coverage-weighted mean of the values per polygon, ignoring NaN"""
+        cell_values = self._values(values)
+        valid = ~np.isnan(cell_values)
+        weights = np.where(valid, self.fraction, 0.0)
+        total = _group_sum(np.where(valid, cell_values, 0.0) * weights, self.polygon, self.n_polygons)
+        weight = _group_sum(weights, self.polygon, self.n_polygons)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(weight > 0, total / weight, np.nan)
+
+    def share(self, mask: np.ndarray) -> np.ndarray:
+        """Fraction of the (valid) polygon area where mask is true"""
+        mask = np.asarray(mask, dtype=float)
+        return self.mean(mask)
+
+    def group(self, groups: np.ndarray, n_groups: int) -> "CoverageWeights":
+        """
+        Weights of groups of polygons (e.g. the admin areas of a climate region):
+        fractions of the polygons of a group are summed per cell, up to 1.
+        Polygons with group -1 are left out.
+        """
+        group = np.asarray(groups, dtype=np.int64)[self.polygon]
+        keep = group >= 0
+        key = group[keep] * (self.cell.max(initial=0) + 1) + self.cell[keep]
+        unique_key, inverse = np.unique(key, return_inverse=True)
+        first = np.zeros(unique_key.size, dtype=np.int64)
+        first[inverse] = np.arange(inverse.size)
+        fraction = np.minimum(np.bincount(inverse, weights=self.fraction[keep]), 1.0)
+        return CoverageWeights(
+            polygon=group[keep][first],
+            cell=self.cell[keep][first],
+            fraction=fraction,
+            n_polygons=n_groups,
+            shape=self.shape,
+        )
+
+    def median(self, values: np.ndarray) -> np.ndarray:
+        """
+        Coverage-weighted median of the values per polygon, ignoring NaN: the value where
+        the cumulative weight reaches half of the total weight, or the mean of the two values
+        around it if it is reached exactly. With equal weights (e.g. 'all_touched'),
+        this is np.nanmedian of the cell values.
+        """
+        cell_values = self._values(values)
+        lead_shape = cell_values.shape[:-1]
+        cell_values = cell_values.reshape((-1, cell_values.shape[-1]))
+        medians = np.full((cell_values.shape[0], self.n_polygons), np.nan)
+        for i, row in enumerate(cell_values):
+            valid = ~np.isnan(row)
+            polygon, value, weight = self.polygon[valid], row[valid], self.fraction[valid]
+            if value.size == 0:
+                continue
+            # sort by polygon, then by value, and find where the cumulative weight
+            # of each polygon reaches half of its total weight
+            order = np.lexsort((value, polygon))
+            polygon, value, weight = polygon[order], value[order], weight[order]
+            cumulative = np.cumsum(weight)
+            total = _group_sum(weight, polygon, self.n_polygons)
+            start = np.searchsorted(polygon, np.arange(self.n_polygons))
+            half = np.concatenate([[0.0], cumulative])[start] + total / 2.0
+            median_index = np.minimum(np.searchsorted(cumulative, half), cumulative.size - 1)
+            # half of the weight reached exactly at a value: mean with the next value of the polygon
+            next_index = np.minimum(median_index + 1, cumulative.size - 1)
+            at_half = np.isclose(cumulative[median_index], half, rtol=1e-9, atol=1e-12) & (
+                polygon[next_index] == polygon[median_index]
+            ) & (next_index > median_index)
+            median = np.where(at_half, (value[median_index] + value[next_index]) / 2.0, value[median_index])
+            has_cells = total > 0
+            medians[i, has_cells] = median[has_cells]
+        return medians.reshape(lead_shape + (self.n_polygons,)) if lead_shape else medians[0]
+
+
+def _group_sum(values: np.ndarray, group: np.ndarray, n_groups: int) -> np.ndarray:
+    """Sum values (..., n) per group of the last axis"""
+    if values.ndim == 1:
+        return np.bincount(group, weights=values, minlength=n_groups)
+    flat = values.reshape((-1, values.shape[-1]))
+    sums = np.stack([np.bincount(group, weights=row, minlength=n_groups) for row in flat])
+    return sums.reshape(values.shape[:-1] + (n_groups,))
+
+
+def coverage_fractions(geometries, latitudes, longitudes) -> CoverageWeights:
+    """
+    Compute the fraction of each grid cell covered by each polygon.
+    Parameters:
+        geometries: sequence of shapely polygons, in the grid CRS
+        latitudes (np.ndarray): latitude of the cell centers
+        longitudes (np.ndarray): longitude of the cell centers
+    Returns:
+        CoverageWeights: sparse (polygon, cell, fraction) weights
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    dlat, dlon = get_cell_size(latitudes), get_cell_size(longitudes)
+    polygons, cells, fractions = [], [], []
+    geometries = list(geometries)
+    for i, geometry in enumerate(geometries):
+        if geometry is None or geometry.is_empty:
+            continue
+        min_x, min_y, max_x, max_y = geometry.bounds
+        rows = np.nonzero((latitudes + dlat / 2 > min_y) & (latitudes - dlat / 2 < max_y))[0]
+        cols = np.nonzero((longitudes + dlon / 2 > min_x) & (longitudes - dlon / 2 < max_x))[0]
+        if rows.size == 0 or cols.size == 0:
+            continue
+        row, col = np.meshgrid(rows, cols, indexing="ij")
+        row, col = row.ravel(), col.ravel()
+        boxes = shapely.box(
+            longitudes[col] - dlon / 2,
+            latitudes[row] - dlat / 2,
+            longitudes[col] + dlon / 2,
+            latitudes[row] + dlat / 2,
+        )
+        fraction = shapely.area(shapely.intersection(boxes, geometry)) / (dlat * dlon)
+        covered = fraction > 0
+        polygons.append(np.full(covered.sum(), i))
+        cells.append(row[covered] * longitudes.size + col[covered])
+        fractions.append(np.minimum(fraction[covered], 1.0))
+    if polygons:
+        polygon, cell, fraction = np.concatenate(polygons), np.concatenate(cells), np.concatenate(fractions)
+    else:
+        polygon, cell, fraction = np.array([], dtype=int), np.array([], dtype=int), np.array([])
+    return CoverageWeights(
+        polygon=polygon.astype(np.int64),
+        cell=cell.astype(np.int64),
+        fraction=fraction,
+        n_polygons=len(geometries),
+        shape=(latitudes.size, longitudes.size),
+    )
+
+
+def all_touched_weights(geometries, latitudes, longitudes) -> CoverageWeights:
+    """
+    Rasterize each polygon on the grid with all_touched semantics:
+    every cell touched by a polygon gets weight 1 for that polygon.
+    Parameters:
+        geometries: sequence of shapely polygons, in the grid CRS
+        latitudes (np.ndarray): latitude of the cell centers
+        longitudes (np.ndarray): longitude of the cell centers
+    Returns:
+        CoverageWeights: sparse (polygon, cell, 1) weights
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    dlat, dlon = get_cell_size(latitudes), get_cell_size(longitudes)
+    # rasterize on a north-up grid, then map rows back to the order of latitudes
+    north_up = np.argsort(-latitudes, kind="stable")
+    transform = Affine.translation(longitudes.min() - dlon / 2, latitudes.max() + dlat / 2) * Affine.scale(dlon, -dlat)
+    polygons, cells = [], []
+    geometries = list(geometries)
+    for i, geometry in enumerate(geometries):
+        if geometry is None or geometry.is_empty:
+            continue
+        touched = geometry_mask(
+            [geometry],
+            out_shape=(latitudes.size, longitudes.size),
+            transform=transform,
+            all_touched=True,
+            invert=True,
+        )
+        row, col = np.nonzero(touched)
+        polygons.append(np.full(row.size, i))
+        cells.append(north_up[row] * longitudes.size + col)
+    if polygons:
+        polygon, cell = np.concatenate(polygons), np.concatenate(cells)
+    else:
+        polygon, cell = np.array([], dtype=int), np.array([], dtype=int)
+    return CoverageWeights(
+        polygon=polygon.astype(np.int64),
+        cell=cell.astype(np.int64),
+        fraction=np.ones(polygon.size),
+        n_polygons=len(geometries),
+        shape=(latitudes.size, longitudes.size),
+    )
+
+
+def get_zonal_weights(key, geometries, latitudes, longitudes, method: str = "coverage") -> CoverageWeights:
+    """
+    Zonal weights of polygons on a grid, computed once per key (e.g. country and
+    admin level), method and grid, and reused for all lead times and pcodes
+    Parameters:
+        key: identifier of the set of polygons
+        geometries: sequence of shapely polygons, in the grid CRS
+        latitudes (np.ndarray): latitude of the cell centers
+        longitudes (np.ndarray): longitude of the cell centers
+        method (str): 'coverage' (fraction of each cell covered) or 'all_touched'
+    """
+    if method not in ZONAL_METHODS:
+        raise ValueError(f"Zonal method {method} is not supported, use one of {', '.join(ZONAL_METHODS)}")
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    grid = (latitudes.size, latitudes[0], latitudes[-1], longitudes.size, longitudes[0], longitudes[-1])
+    memo_key = (key, method, grid)
+    with _zonal_weights_lock:
+        if memo_key in _zonal_weights_memo:
+            return _zonal_weights_memo[memo_key]
+    if method == "coverage":
+        weights = coverage_fractions(geometries, latitudes, longitudes)
+    else:
+        weights = all_touched_weights(geometries, latitudes, longitudes)
+    with _zonal_weights_lock:
+        _zonal_weights_memo[memo_key] = weights
+    return weights
+
+
+class AdminZonalIndex:
+    """Zonal weights of all admin areas of an admin level on a grid, by pcode"""
+
+    def __init__(self, pcodes: list, weights: CoverageWeights):
+        self.pcodes = list(pcodes)
+        self.weights = weights
+        self.position = {pcode: i for i, pcode in enumerate(self.pcodes)}
+
+    def get_positions(self, pcodes: list) -> np.ndarray:
+        """Position of each pcode in the index, -1 if not found"""
+        return np.array([self.position.get(pcode, -1) for pcode in pcodes], dtype=np.int64)
+
+    def union(self, pcodes: list) -> CoverageWeights:
+        """Weights of the union of the given admin areas, as a single polygon"""
+        groups = np.full(len(self.pcodes), -1, dtype=np.int64)
+        positions = self.get_positions(pcodes)
+        groups[positions[positions >= 0]] = 0
+        return self.weights.group(groups, 1)
+
+
+def get_admin_zonal_index(
+    country: str, adm_level: int, admin_boundary, latitudes, longitudes, method: str = "coverage"
+) -> AdminZonalIndex:
+    """
+    Zonal index of the admin areas of a country and admin level on a grid,
+    computed once per process and reused for all climate regions and lead times
+    Parameters:
+        country (str): country ISO3
+        adm_level (int): admin level
+        admin_boundary (geopandas.GeoDataFrame): admin areas, with column adm{adm_level}_pcode
+        latitudes (np.ndarray): latitude of the cell centers
+        longitudes (np.ndarray): longitude of the cell centers
+        method (str): 'coverage' or 'all_touched'
+    """
+    admin_boundary = admin_boundary.drop_duplicates(f"adm{adm_level}_pcode")
+    weights = get_zonal_weights(
+        (country, adm_level), admin_boundary.geometry.values, latitudes, longitudes, method=method
+    )
+    return AdminZonalIndex(admin_boundary[f"adm{adm_level}_pcode"].values, weights)
+
+
+class AdminHierarchy:
+    """
+    Admin areas of the finest admin level, with the position of their parent areas
+    at coarser levels (from the adm{level}_pcode columns), to roll up zonal sums
+    instead of computing them again for each admin level
+    """
+
+    def __init__(self, admin_boundary, adm_level: int, adm_levels: list):
+        """
+        Args:
+            admin_boundary (geopandas.GeoDataFrame): admin areas of the finest level
+            adm_level (int): finest admin level
+            adm_levels (list): admin levels to roll up to
+        """
+        admin_boundary = admin_boundary.drop_duplicates(f"adm{adm_level}_pcode")
+        self.adm_level = adm_level
+        self.geometries = admin_boundary.geometry.values
+        self.pcodes = {adm_level: admin_boundary[f"adm{adm_level}_pcode"].values}
+        self.parents = {}
+        for level in adm_levels:
+            column = f"adm{level}_pcode"
+            if level >= adm_level or column not in admin_boundary:
+                continue
+            parent, pcodes = pd.factorize(admin_boundary[column])
+            self.parents[level] = parent.astype(np.int64)  # -1 if no parent
+            self.pcodes[level] = pcodes.values
+
+    @property
+    def n_zones(self) -> int:
+        return len(self.pcodes[self.adm_level])
+
+    def has_level(self, adm_level: int) -> bool:
+        """Check if sums can be given for an admin level"""
+        return adm_level in self.pcodes
+
+    def rollup(self, sums: np.ndarray, adm_level: int) -> pd.Series:
+        """Sums per admin area of a level from sums per finest admin area (last axis)"""
+        if adm_level == self.adm_level:
+            return pd.Series(sums, index=pd.Index(self.pcodes[adm_level], name="pcode"), name="sum")
+        parent = self.parents[adm_level]
+        has_parent = parent >= 0
+        parent_sums = np.bincount(parent[has_parent], weights=sums[has_parent], minlength=len(self.pcodes[adm_level]))
+        return pd.Series(parent_sums, index=pd.Index(self.pcodes[adm_level], name="pcode"), name="sum")
+
+
+def rasterize_zones(geometries, transform: Affine, shape: tuple) -> np.ndarray:
+    """Zone (geometry position) of each cell whose center is in a geometry, -1 elsewhere"""
+    shapes = [(geometry, i) for i, geometry in enumerate(geometries) if geometry is not None and not geometry.is_empty]
+    if not shapes:
+        return np.full(shape, -1, dtype=np.int32)
+    return rasterize(shapes, out_shape=shape, transform=transform, fill=-1, dtype=np.int32)
+
+
+def zone_sum(zones: np.ndarray, values: np.ndarray, n_zones: int) -> np.ndarray:
+    """Sum of the values per zone, NaN and negative (nodata) values counted as zero"""
+    inside = zones >= 0
+    values = values[inside].astype(np.float64)
+    values[~np.isfinite(values) | (values < 0.0)] = 0.0
+    return np.bincount(zones[inside], weights=values, minlength=n_zones)
+
+
+def get_zone_sums(geometries, rasters: list) -> np.ndarray:
+    """
+    Sums of several rasters (e.g. one per lead time) per geometry, over the cells whose
+    center is in the geometry. The rasters may cover different windows of one grid:
+    the geometries are rasterized once, on the union of the windows.
+    Returns an array (raster, geometry).
+    """
+    n_zones = len(geometries)
+    if not rasters:
+        return np.zeros((0, n_zones))
+    reference = rasters[0].transform
+    offsets = [tuple(round(v) for v in ~reference * (raster.transform.c, raster.transform.f)) for raster in rasters]
+    col_start = min(col for col, _ in offsets)
+    row_start = min(row for _, row in offsets)
+    col_stop = max(col + raster.data.shape[2] for (col, _), raster in zip(offsets, rasters))
+    row_stop = max(row + raster.data.shape[1] for (_, row), raster in zip(offsets, rasters))
+    zones = rasterize_zones(
+        geometries,
+        reference * Affine.translation(col_start, row_start),
+        (row_stop - row_start, col_stop - col_start),
+    )
+    sums = np.zeros((len(rasters), n_zones))
+    for i, ((col, row), raster) in enumerate(zip(offsets, rasters)):
+        height, width = raster.data.shape[1:]
+        window = zones[row - row_start : row - row_start + height, col - col_start : col - col_start + width]
+        sums[i] = zone_sum(window, raster.read(1), n_zones)
+    return sums
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+from droughtpipeline.backtest import (
+    BACKTEST_OUTCOMES,
+    classify_outcome,
+    get_backtest_scores,
+    leave_one_out_quantile,
+)
+
+
+def brute_force_quantile(values, q):
+    return np.stack([
+        np.quantile(np.delete(values, year, axis=0).reshape((-1,) + values.shape[2:]), q, axis=0)
+        for year in range(values.shape[0])
+    ])
+
+
+@pytest.mark.parametrize("q", [0.0, 0.33, 1 / 3, 0.5, 1.0])
+def test_leave_one_out_quantile_matches_brute_force(q):
+    rng = np.random.default_rng(0)
+    values = rng.gamma(2, 30, (30, 25, 3, 4))
+    values[:, :, 0, 0] = 5.0  # all tied
+    values[:, :, 1, 1] = rng.integers(0, 3, (30, 25))  # many ties
+    np.testing.assert_allclose(leave_one_out_quantile(values, q), brute_force_quantile(values, q), atol=1e-9)
+
+
+def test_leave_one_out_quantile_single_member():
+    values = np.random.default_rng(1).normal(size=(10, 1, 5))
+    np.testing.assert_allclose(leave_one_out_quantile(values, 0.33), brute_force_quantile(values, 0.33))
+
+
+def test_leave_one_out_quantile_nan_columns():
+    values = np.random.default_rng(2).normal(size=(6, 4, 3))
+    values[2, 1, 1] = np.nan
+    quantile = leave_one_out_quantile(values, 0.33)
+    assert np.isnan(quantile[:, 1]).all()
+    np.testing.assert_allclose(quantile[:, [0, 2]], brute_force_quantile(values[:, :, [0, 2]], 0.33))
+
+
+def test_leave_one_out_quantile_needs_two_years():
+    with pytest.raises(ValueError):
+        leave_one_out_quantile(np.ones((1, 5, 2)), 0.33)
+
+
+def test_classify_outcome():
+    outcome = classify_outcome([True, True, False, False], [True, False, True, False])
+    assert list(outcome) == BACKTEST_OUTCOMES
+
+
+def test_backtest_scores_denominators():
+    def outcomes(code, triggered, drought):
+        return pd.DataFrame({
+            "climate_region_code": code,
+            "climate_region_name": f"region {code}",
+            "lead_time": 0,
+            "outcome": classify_outcome(triggered, drought),
+        })
+
+    scores = get_backtest_scores(pd.concat([
+        outcomes(1, [True, True, False, False], [True, False, True, False]),
+        outcomes(2, [False, False], [False, False]),  # no triggers, no droughts
+        outcomes(3, [True, True], [False, False]),  # only false alarms
+    ])).set_index("climate_region_code")
+
+    assert scores.loc[1, BACKTEST_OUTCOMES].tolist() == [1, 1, 1, 1]
+    assert scores.loc[1, "hit_rate"] == 0.5
+    assert scores.loc[1, "false_alarm_ratio"] == 0.5
+    assert scores.loc[2, "correct_rejection"] == 2
+    assert np.isnan(scores.loc[2, "hit_rate"]) and np.isnan(scores.loc[2, "false_alarm_ratio"])
+    assert np.isnan(scores.loc[3, "hit_rate"])
+    assert scores.loc[3, "false_alarm_ratio"] == 1.0
+
+
+def test_backtest_trigger_model_dry_year_is_a_hit():
+    import shapely
+    import xarray as xr
+    from droughtpipeline.backtest import backtest_trigger_model, stack_weights
+    from droughtpipeline.zonal import coverage_fractions
+
+    rng = np.random.default_rng(3)
+    latitudes, longitudes = np.arange(-28.0, -31.0, -0.5), np.arange(27.0, 30.0, 0.5)
+    values = rng.gamma(20, 5, (25, 2, 30, latitudes.size, longitudes.size))
+    values[:, :, 7] *= 0.3  # a dry year everywhere
+    tprate = xr.DataArray(
+        values,
+        dims=("number", "forecastMonth", "time", "latitude", "longitude"),
+        coords={
+            "time": pd.date_range("1991-03-01", periods=30, freq="12MS"),
+            "forecastMonth": [1, 2],
+            "latitude": latitudes,
+            "longitude": longitudes,
+        },
+    )
+    regions = [coverage_fractions([shapely.box(27, -30, 29, -28)], latitudes, longitudes)]
+    backtest = backtest_trigger_model(tprate, stack_weights(regions), 0.33, 0.4, 0.4)
+
+    assert dict(backtest.sizes) == {"year": 30, "forecastMonth": 2, "climate_region": 1}
+    assert backtest.triggered.sel(year=1998).all() and backtest.drought.sel(year=1998).all()
+    assert backtest.likelihood.sel(year=1998).min() == 1.0
@@ -0,0 +1,97 @@
+import pytest
+from droughtpipeline import load as load_module
+from droughtpipeline.cache import ForecastCache, HindcastCache
+from droughtpipeline.load import Load, get_ecmwf_hindcast_request, get_ecmwf_seasonal_request
+from droughtpipeline.settings import Settings
+
+AREA = [-27, 26, -32, 31]
+
+
+class FakeJob:
+    """Submitted request of the legacy cdsapi client: state per poll, then download"""
+
+    def __init__(self, name, states, events):
+        self.name = name
+        self.states = list(states)
+        self.events = events
+        self.reply = {}
+
+    def update(self):
+        self.events.append(("poll", self.name))
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        self.reply = {"state": state, "error": {"message": "request too large"} if state == "failed" else None}
+
+    def download(self, target):
+        self.events.append(("download", self.name))
+        with open(target, "wb") as file:
+            file.write(f"GRIB {self.name}".encode())
+
+
+class FakeCDSClient:
+    """Local fake of cdsapi.Client(wait_until_complete=False)"""
+
+    def __init__(self, states):
+        self.states = states  # 'forecast' / 'hindcast' -> states returned by successive polls
+        self.events = []
+
+    def retrieve(self, dataset, request):
+        name = "hindcast" if len(request["year"]) > 1 else "forecast"
+        self.events.append(("submit", name))
+        return FakeJob(name, self.states[name], self.events)
+
+
+@pytest.fixture
+def load(tmp_path, monkeypatch):
+    monkeypatch.setenv("DROUGHT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(load_module.time, "sleep", lambda seconds: None)
+    load = Load(settings=Settings("config/config.yaml"))
+    monkeypatch.setattr(load, "get_ecmwf_area", lambda country: AREA)
+    return load
+
+
+def test_requests_are_submitted_at_once_and_downloaded_when_ready(load, tmp_path):
+    client = FakeCDSClient({
+        "forecast": ["queued", "running", "running", "completed"],
+        "hindcast": ["running", "completed"],
+    })
+    data_dir = tmp_path / "input"
+    data_dir.mkdir()
+    load.download_ecmwf_forecast("LSO", str(data_dir), "2024", "05", asynchronous=True, client=client)
+
+    first_poll = next(i for i, event in enumerate(client.events) if event[0] == "poll")
+    assert [event for event in client.events[:first_poll]] == [("submit", "forecast"), ("submit", "hindcast")]
+    downloads = [event[1] for event in client.events if event[0] == "download"]
+    assert downloads == ["hindcast", "forecast"]  # in order of readiness, not of submission
+
+    forecast_request = get_ecmwf_seasonal_request(["2024"], "05", AREA)
+    hindcast_request = get_ecmwf_hindcast_request(AREA)
+    forecast_path = load.get_forecast_cache().get(ForecastCache.get_key_from_request(forecast_request))
+    hindcast_path = load.get_hindcast_cache().get(HindcastCache.get_key_from_request(hindcast_request))
+    assert open(forecast_path, "rb").read() == b"GRIB forecast"
+    assert open(hindcast_path, "rb").read() == b"GRIB hindcast"
+
+    # a second run is served from the caches, without CDS requests
+    other_dir = tmp_path / "input_2"
+    other_dir.mkdir()
+    cached_client = FakeCDSClient({})
+    load.download_ecmwf_forecast("LSO", str(other_dir), "2024", "05", asynchronous=True, client=cached_client)
+    assert cached_client.events == []
+    assert (other_dir / "ecmwf_seas5_hindcast_monthly_tp_domain.grib").read_bytes() == b"GRIB hindcast"
+
+
+def test_failed_request_raises(load, tmp_path):
+    client = FakeCDSClient({"forecast": ["running", "failed"], "hindcast": ["running"]})
+    with pytest.raises(RuntimeError, match="failed"):
+        load.download_ecmwf_forecast("LSO", str(tmp_path), "2024", "05", asynchronous=True, client=client)
+    assert not any(event[0] == "download" for event in client.events)
+    assert load.get_hindcast_cache().get(
+        HindcastCache.get_key_from_request(get_ecmwf_hindcast_request(AREA))
+    ) is None
+
+
+def test_timeout_raises(load, tmp_path):
+    client = FakeCDSClient({"forecast": ["running"], "hindcast": ["running"]})
+    with pytest.raises(TimeoutError, match="not completed"):
+        load.retrieve_cds_requests(
+            client, "dataset", {str(tmp_path / "f.grib"): {"year": ["2024"]}}, timeout=-1
+        )
@@ -0,0 +1,15 @@
+from droughtpipeline.context import DEFAULT_RUN_ID, RunContext
+
+
+def test_default_run_id_is_shared_by_the_stages_of_a_run(tmp_path):
+    prepare = RunContext(country="ken", yearmonth="2024-05", base_dir=str(tmp_path))
+    extract = RunContext(country="KEN", yearmonth="2024-05", base_dir=str(tmp_path))
+    assert prepare.run_id == DEFAULT_RUN_ID
+    assert prepare.work_dir == extract.work_dir == str(tmp_path / "KEN" / "2024-05" / DEFAULT_RUN_ID)
+
+
+def test_month_context_keeps_run_id(tmp_path):
+    context = RunContext(country="KEN", yearmonth="2024-05", run_id="backfill", base_dir=str(tmp_path))
+    month = context.for_month("KEN", "2024-06")
+    assert month.run_id == "backfill"
+    assert month.input_dir == str(tmp_path / "KEN" / "2024-06" / "backfill" / "input")
@@ -0,0 +1,83 @@
+import threading
+from datetime import datetime
+import pytest
+from droughtpipeline.clients import COSMOS_MAX_BATCH_SIZE, execute_cosmos_batches
+from droughtpipeline.data import ForecastDataSet, ForecastDataUnit
+from droughtpipeline.load import Load
+from droughtpipeline.settings import Settings
+
+
+class FakeContainer:
+    """Cosmos DB container recording the transactional batches it executes"""
+
+    def __init__(self, existing_ids=()):
+        self.existing_ids = list(existing_ids)
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def query_items(self, query, parameters, partition_key):
+        return [{"id": id_} for id_ in self.existing_ids]
+
+    def execute_item_batch(self, batch_operations, partition_key):
+        with self.lock:
+            self.batches.append((list(batch_operations), partition_key))
+
+
+def test_batches_are_split_at_the_maximum_size():
+    container = FakeContainer()
+    operations = [("upsert", ({"id": str(i)},)) for i in range(2 * COSMOS_MAX_BATCH_SIZE + 1)]
+    execute_cosmos_batches(container, operations, partition_key="LSO", max_workers=3)
+    assert sorted(len(batch) for batch, _ in container.batches) == [1, COSMOS_MAX_BATCH_SIZE, COSMOS_MAX_BATCH_SIZE]
+    assert {partition_key for _, partition_key in container.batches} == {"LSO"}
+    executed = sorted(operation[1][0]["id"] for batch, _ in container.batches for operation in batch)
+    assert executed == sorted(str(i) for i in range(len(operations)))
+
+
+@pytest.fixture
+def load(monkeypatch):
+    load = Load(settings=Settings("config/config.yaml"))
+    monkeypatch.setattr(load, "get_cosmos_max_workers", lambda: 1)
+    return load
+
+
+def test_save_deletes_only_records_not_overwritten(load, monkeypatch):
+    timestamp = datetime(2024, 5, 1)
+    dataset = ForecastDataSet(
+        country="LSO",
+        timestamp=timestamp,
+        data_units=[
+            ForecastDataUnit(adm_level=1, pcode=f"LS{i:03}", lead_time=lead_time, climate_region_code=1)
+            for i in range(70)
+            for lead_time in range(3)
+        ],
+    )
+    stamp = timestamp.strftime("%Y-%m-%dT%H:%M:%S")
+    overwritten = [f"LS000_{stamp}_0", f"LS069_{stamp}_2"]
+    stale = [f"LS999_{stamp}_0", "LS000_2024-05-02T00:00:00_0"]
+    container = FakeContainer(existing_ids=overwritten + stale)
+    monkeypatch.setattr(load, "get_cosmos_container_client", lambda data_type: container)
+
+    load.save_pipeline_data("seasonal-rainfall-forecast", dataset, replace_country=True)
+
+    operations = [operation for batch, _ in container.batches for operation in batch]
+    deletes = [args[0] for kind, args in operations if kind == "delete"]
+    upserts = [args[0] for kind, args in operations if kind == "upsert"]
+    assert deletes == stale
+    assert operations[: len(stale)] == [("delete", (id_,)) for id_ in stale]  # before the upserts
+    assert len(upserts) == len({record["id"] for record in upserts}) == 210
+    assert {record["country"] for record in upserts} == {"LSO"}
+    assert all(len(batch) <= COSMOS_MAX_BATCH_SIZE for batch, _ in container.batches)
+    assert [len(batch) for batch, _ in container.batches] == [100, 100, 12]
+    assert {partition_key for _, partition_key in container.batches} == {"LSO"}
+
+
+def test_save_without_replace_does_not_delete(load, monkeypatch):
+    dataset = ForecastDataSet(
+        country="LSO",
+        timestamp=datetime(2024, 5, 1),
+        data_units=[ForecastDataUnit(adm_level=1, pcode="LS001", lead_time=0)],
+    )
+    container = FakeContainer(existing_ids=["other"])
+    monkeypatch.setattr(load, "get_cosmos_container_client", lambda data_type: container)
+    load.save_pipeline_data("seasonal-rainfall-forecast", dataset)
+    assert [kind for batch, _ in container.batches for kind, _ in batch] == ["upsert"]
@@ -0,0 +1,100 @@
+from datetime import datetime
+import numpy as np
+from droughtpipeline.data import (
+    AdminDataSet,
+    DataUnitIndex,
+    ForecastDataSet,
+    ForecastDataUnit,
+    RainfallDataUnit,
+)
+
+
+def forecast_unit(pcode, lead_time, adm_level=1, **kwargs):
+    return ForecastDataUnit(
+        adm_level=adm_level,
+        pcode=pcode,
+        lead_time=lead_time,
+        climate_region_code=kwargs.pop("climate_region_code", 1),
+        climate_region_name="National",
+        **kwargs,
+    )
+
+
+def forecast_dataset(units):
+    return ForecastDataSet(country="LSO", timestamp=datetime(2024, 5, 1), adm_levels=[1, 2], data_units=units)
+
+
+def test_upsert_replaces_existing_key():
+    dataset = forecast_dataset([forecast_unit("LS01", 0), forecast_unit("LS01", 1), forecast_unit("LS0101", 0, 2)])
+    dataset.upsert_data_unit(forecast_unit("LS01", 1, pop_affected=120, triggered=1))
+    assert len(dataset) == 3
+    row = dataset.get_data_unit("LS01", 1)
+    assert (row.pop_affected, row.triggered, row.adm_level) == (120, 1, 1)
+    assert dataset.get_data_unit("LS01", 0).pop_affected == 0
+
+    dataset.upsert_data_unit(forecast_unit("LS02", 1))
+    assert len(dataset) == 4
+    assert dataset.get_data_unit("LS02", 1).position == 3
+
+
+def test_vectorized_upsert_replaces_and_appends():
+    dataset = forecast_dataset([forecast_unit("LS01", 0), forecast_unit("LS02", 0)])
+    dataset.upsert(pcode=["LS02", "LS03", "LS03"], lead_time=0, adm_level=1, pop_affected=[5, 6, 7])
+    assert len(dataset) == 3
+    assert dataset.get_data_unit("LS02", 0).pop_affected == 5
+    assert dataset.get_data_unit("LS03", 0).pop_affected == 7  # last row of a key wins
+    assert sorted(dataset.get_pcodes()) == ["LS01", "LS02", "LS03"]
+
+
+def test_update_of_index_column_keeps_lookups():
+    dataset = forecast_dataset([forecast_unit("LS01", 0), forecast_unit("LS02", 0), forecast_unit("LS0101", 0, 2)])
+    dataset.update(dataset.filter(pcode="LS02"), lead_time=3)
+    assert dataset.get_data_unit("LS02", 3).position == 1
+    assert [row.pcode for row in dataset.get_data_units(lead_time=0)] == ["LS01", "LS0101"]
+    dataset.get_data_unit("LS0101", 0).adm_level = 1  # row view setter
+    assert sorted(row.pcode for row in dataset.get_data_units(adm_level=1)) == ["LS01", "LS0101", "LS02"]
+    dataset.update([0], pcode="LS09")
+    assert dataset.get_data_unit("LS09", 0).position == 0
+    try:
+        dataset.get_data_unit("LS01", 0)
+        assert False, "old pcode still indexed"
+    except ValueError:
+        pass
+
+
+def test_to_records_matches_data_unit_vars():
+    units = [
+        forecast_unit("LS01", 0, pop_affected=10, pop_affected_perc=1.5, triggered=1, likelihood=0.45,
+                      tercile_lower=-12.5, tercile_upper=8.0, forecast=[1.0, 2.0], season="OND"),
+        forecast_unit("LS0101", 2, 2, climate_region_code=2),  # defaults and missing values
+    ]
+    expected = [dict(vars(unit)) for unit in units]
+    records = forecast_dataset(units).to_records()
+    assert records == expected
+    assert [list(record) for record in records] == [list(record) for record in expected]
+    assert records[1]["triggered"] is None and records[1]["likelihood"] is None
+    assert isinstance(records[0]["pop_affected"], int) and isinstance(records[0]["likelihood"], float)
+
+
+def test_data_unit_index_of_admin_dataset():
+    units = [RainfallDataUnit(adm_level=1, pcode="LS01", lead_time=lead_time) for lead_time in range(3)]
+    dataset = AdminDataSet(country="LSO", data_units=units)
+    assert dataset.get_data_unit("LS01", 2) is units[2]
+    assert dataset.get_data_unit("LS01") is units[0]  # first unit per key
+
+    replacement = RainfallDataUnit(adm_level=2, pcode="LS01", lead_time=1)
+    dataset.upsert_data_unit(replacement)
+    assert len(dataset.data_units) == 3
+    assert dataset.get_data_unit("LS01", 1) is replacement
+    assert dataset.get_data_units(adm_level=2) == [replacement]
+
+
+def test_data_unit_index_positions():
+    index = DataUnitIndex(keys=("pcode",))
+    units = [RainfallDataUnit(adm_level=level, pcode=f"P{i}", lead_time=i % 2) for i, level in enumerate([1, 1, 2, 2])]
+    index.rebuild(units)
+    assert index.get_positions(lead_time=0) == [0, 2]
+    assert index.get_positions(lead_time=1, adm_level=2) == [3]
+    assert index.get_position("pcode", "P2", 0) == 2
+    assert index.get_position("pcode", "P2", 1) is None
+    assert np.array_equal(index.get_positions(adm_level=1), [0, 1])
@@ -0,0 +1,127 @@
+import json
+import pytest
+import requests
+from droughtpipeline import clients
+from droughtpipeline.clients import fetch_file
+
+URL = "https://data.example.org/population.tif"
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i : i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}")
+
+
+class FakeServer:
+    """Stub of requests.get serving one file with an ETag, conditional and range requests"""
+
+    def __init__(self, body, etag='"v1"'):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+        self.available = True
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        headers = headers or {}
+        self.requests.append(headers)
+        if not self.available:
+            raise requests.exceptions.ConnectionError("offline")
+        if url != URL:
+            return FakeResponse(404)
+        if headers.get("If-None-Match") == self.etag:
+            return FakeResponse(304)
+        validators = {"ETag": self.etag, "Last-Modified": "Wed, 01 May 2024 00:00:00 GMT"}
+        if "Range" in headers and headers.get("If-Range") == self.etag:
+            start = int(headers["Range"].split("=")[1].rstrip("-"))
+            if start >= len(self.body):
+                return FakeResponse(416)
+            return FakeResponse(206, self.body[start:], validators)
+        return FakeResponse(200, self.body, validators)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer(b"0123456789" * 100)
+    monkeypatch.setattr(clients.requests, "get", server.get)
+    return server
+
+
+def read_metadata(path):
+    with open(str(path) + ".json") as file:
+        return json.load(file)
+
+
+def test_unchanged_file_is_not_downloaded_again(server, tmp_path):
+    path = tmp_path / "population.tif"
+    fetch_file(URL, str(path), chunk_size=64)
+    assert path.read_bytes() == server.body
+    assert read_metadata(path)["complete"] and read_metadata(path)["etag"] == '"v1"'
+
+    fetch_file(URL, str(path), chunk_size=64)
+    assert server.requests[-1]["If-None-Match"] == '"v1"'
+    assert path.read_bytes() == server.body
+
+
+def test_changed_file_is_downloaded_again(server, tmp_path):
+    path = tmp_path / "population.tif"
+    fetch_file(URL, str(path))
+    server.body, server.etag = b"new population", '"v2"'
+    fetch_file(URL, str(path))
+    assert path.read_bytes() == b"new population"
+    assert read_metadata(path)["etag"] == '"v2"'
+
+
+def test_interrupted_download_is_resumed(server, tmp_path):
+    path = tmp_path / "population.tif"
+    (tmp_path / "population.tif.part").write_bytes(server.body[:300])
+    (tmp_path / "population.tif.json").write_text(json.dumps({"url": URL, "etag": '"v1"', "complete": False}))
+    fetch_file(URL, str(path))
+    assert server.requests[-1]["Range"] == "bytes=300-"
+    assert path.read_bytes() == server.body
+    assert not (tmp_path / "population.tif.part").exists()
+
+
+def test_partial_download_of_changed_file_starts_again(server, tmp_path):
+    path = tmp_path / "population.tif"
+    (tmp_path / "population.tif.part").write_bytes(b"old bytes")
+    (tmp_path / "population.tif.json").write_text(json.dumps({"url": URL, "etag": '"v0"', "complete": False}))
+    fetch_file(URL, str(path))
+    assert server.requests[-1]["If-Range"] == '"v0"'
+    assert path.read_bytes() == server.body
+
+
+def test_invalid_partial_download_starts_again(server, tmp_path):
+    path = tmp_path / "population.tif"
+    (tmp_path / "population.tif.part").write_bytes(server.body + b"extra")
+    (tmp_path / "population.tif.json").write_text(json.dumps({"url": URL, "etag": '"v1"', "complete": False}))
+    fetch_file(URL, str(path))
+    assert "Range" in server.requests[0] and "Range" not in server.requests[1]
+    assert path.read_bytes() == server.body
+
+
+def test_missing_file_and_offline_server(server, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        fetch_file(URL + ".missing", str(tmp_path / "missing.tif"))
+
+    path = tmp_path / "population.tif"
+    fetch_file(URL, str(path))
+    server.available = False
+    assert fetch_file(URL, str(path)) == str(path)  # complete file is used
+    with pytest.raises(requests.exceptions.ConnectionError):
+        fetch_file(URL, str(tmp_path / "other.tif"))
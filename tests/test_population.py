@@ -0,0 +1,66 @@
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from droughtpipeline.population import (
+    PopulationPyramid,
+    aggregate_population,
+    get_affected_population_on_grid,
+    get_population_window,
+)
+from droughtpipeline.raster import Raster
+
+
+def write_population(path, data, transform):
+    profile = dict(driver="GTiff", height=data.shape[0], width=data.shape[1], count=1,
+                   dtype="float32", crs="EPSG:4326", transform=transform, nodata=-99999.0)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data.astype(np.float32), 1)
+
+
+def extent_transform(latitudes, longitudes):
+    """Transform of the drought extent rasters, as in Extract.save_lower_tercile_rasters (south-up)"""
+    return from_origin(
+        longitudes[0], latitudes[0], longitudes[1] - longitudes[0], latitudes[0] - latitudes[1]
+    )
+
+
+def brute_force_sums(data, transform, grid_transform, shape):
+    """Population per grid cell, assigning each population cell by its center"""
+    sums = np.zeros(shape)
+    rows, cols = np.indices(data.shape)
+    x, y = transform * (cols + 0.5, rows + 0.5)
+    grid_cols, grid_rows = ~grid_transform * (x, y)
+    grid_cols, grid_rows = np.floor(grid_cols).astype(int), np.floor(grid_rows).astype(int)
+    inside = (grid_rows >= 0) & (grid_rows < shape[0]) & (grid_cols >= 0) & (grid_cols < shape[1])
+    np.add.at(sums, (grid_rows[inside], grid_cols[inside]), data[inside])
+    return sums
+
+
+def test_population_on_south_up_extent_grid(tmp_path):
+    rng = np.random.default_rng(0)
+    population = rng.uniform(0, 10, (200, 240))
+    population_transform = from_origin(27.0, -28.0, 0.01, 0.01)
+    population_path = str(tmp_path / "population.tif")
+    write_population(population_path, population, population_transform)
+
+    # ascending latitudes, as produced by upsample_lower_tercile_probability
+    latitudes = np.linspace(-29.95, -28.05, 20)
+    longitudes = np.linspace(27.05, 29.35, 24)
+    transform = extent_transform(latitudes, longitudes)
+    assert transform.e > 0
+    shape = (latitudes.size, longitudes.size)
+
+    level = PopulationPyramid(str(tmp_path / "cache")).get_level(population_path, "v1", transform)
+    window = get_population_window(level, transform, shape)
+    expected = brute_force_sums(population, population_transform, transform, shape)
+    np.testing.assert_allclose(window, expected, rtol=1e-5)
+
+    # the pyramid is also found with the north-up transform of the same grid
+    north_up = aggregate_population(population_path, transform)
+    assert north_up.transform.e < 0
+    assert np.isclose(north_up.read(1).sum(), population.sum(), rtol=1e-5)
+
+    extent = np.zeros(shape, dtype=np.float32)
+    extent[:5] = 1  # southernmost rows of the south-up grid
+    affected = get_affected_population_on_grid(level, Raster(extent, transform, crs="EPSG:4326"))
+    np.testing.assert_allclose(affected.read(1), np.where(extent == 1, expected, 0), rtol=1e-5)
@@ -0,0 +1,99 @@
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from droughtpipeline.clients import UploadPool
+from droughtpipeline.load import IBF_API_RASTER_ENDPOINT, Load
+
+
+class RecordingPost:
+    """Fake IBF API POST recording when each request starts and finishes"""
+
+    def __init__(self, fail_path=None, delay=0.02):
+        self.fail_path = fail_path
+        self.delay = delay
+        self.events = []
+        self.lock = threading.Lock()
+
+    def record(self, *event):
+        with self.lock:
+            self.events.append(event)
+
+    def __call__(self, path, body=None, files=None):
+        self.record("start", path)
+        time.sleep(self.delay)
+        if path == self.fail_path:
+            self.record("failed", path)
+            raise ValueError(f"Error in IBF API POST request: 500, {path}")
+        self.record("done", path)
+
+
+def test_wait_returns_after_all_uploads():
+    post = RecordingPost()
+    with UploadPool(post, max_workers=4) as uploads:
+        for i in range(8):
+            uploads.submit(f"upload/{i}")
+        uploads.wait()
+        assert sum(event == "done" for event, _ in post.events) == 8
+
+
+def test_wait_raises_failed_upload():
+    post = RecordingPost(fail_path="upload/3")
+    with pytest.raises(ValueError, match="upload/3"):
+        with UploadPool(post, max_workers=4) as uploads:
+            for i in range(8):
+                uploads.submit(f"upload/{i}")
+            uploads.wait()
+
+
+class FakeSettings:
+    def get_country_setting(self, country, setting):
+        return {"admin-levels": [1], "pipeline-will-trigger-portal": "trigger"}[setting]
+
+    def get_leadtime_for_climate_region_code(self, country, climate_region_code, month):
+        return []
+
+    def get_climate_region_name_by_code(self, country, climate_region_code):
+        return "National"
+
+
+class FakeRasterStore:
+    def get(self, name, fallback_dir=None):
+        return SimpleNamespace(to_bytes=lambda: b"GTiff")
+
+    def put(self, name, raster):
+        pass
+
+
+def send_to_ibf_api(post, monkeypatch):
+    load = Load()
+    load.settings = FakeSettings()
+    monkeypatch.setattr(load, "get_upload_pool", lambda: UploadPool(post, max_workers=4))
+    monkeypatch.setattr(load, "ibf_api_post_request", post)
+    monkeypatch.setattr(load, "_Load__list_events_from_climateregion", lambda *args: {})
+    forecast_climateregion = SimpleNamespace(get_climate_region_codes=lambda: [1])
+    threshold_climateregion = SimpleNamespace(
+        get_data_unit=lambda climate_region_code: SimpleNamespace(pcodes={"1": []})
+    )
+    load.send_to_ibf_api(
+        forecast_data=SimpleNamespace(country="LSO"),
+        threshold_climateregion=threshold_climateregion,
+        forecast_climateregion=forecast_climateregion,
+        drought_extent="/tmp/rainfall_forecast.tif",
+        rasters=FakeRasterStore(),
+    )
+
+
+def test_events_process_is_sent_after_all_uploads(monkeypatch):
+    post = RecordingPost()
+    send_to_ibf_api(post, monkeypatch)
+    assert post.events[-2:] == [("start", "events/process"), ("done", "events/process")]
+    uploads = post.events[:-2]
+    assert uploads.count(("done", IBF_API_RASTER_ENDPOINT)) == 4
+
+
+def test_failed_upload_prevents_events_process(monkeypatch):
+    post = RecordingPost(fail_path=IBF_API_RASTER_ENDPOINT)
+    with pytest.raises(ValueError):
+        send_to_ibf_api(post, monkeypatch)
+    assert ("start", "events/process") not in post.events
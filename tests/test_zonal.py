@@ -0,0 +1,98 @@
+import numpy as np
+import geopandas as gpd
+import pytest
+import shapely
+from affine import Affine
+from rasterio.features import geometry_mask
+from droughtpipeline.zonal import (
+    all_touched_weights,
+    coverage_fractions,
+    get_admin_zonal_index,
+)
+
+# 1-degree grid of cell centers, latitudes descending as in SEAS5
+LATITUDES = np.arange(-27.5, -33.0, -1.0)
+LONGITUDES = np.arange(26.5, 32.0, 1.0)
+SHAPE = (LATITUDES.size, LONGITUDES.size)
+
+POLYGONS = [
+    shapely.Polygon([(27.2, -28.1), (29.7, -28.4), (29.1, -30.9), (27.6, -30.2)]),
+    shapely.box(29.3, -32.6, 31.8, -30.4),
+    shapely.Point(28.0, -31.8).buffer(0.4),  # within one cell
+]
+
+
+def dense(weights):
+    """Weights as a dense array (polygon, lat, lon)"""
+    array = np.zeros((weights.n_polygons, SHAPE[0] * SHAPE[1]))
+    np.add.at(array, (weights.polygon, weights.cell), weights.fraction)
+    return array.reshape((weights.n_polygons,) + SHAPE)
+
+
+def weighted_median(values, weights):
+    """Brute force: half of the total weight reached exactly -> mean of the values around it"""
+    valid = ~np.isnan(values) & (weights > 0)
+    values, weights = values[valid], weights[valid]
+    order = np.argsort(values, kind="stable")
+    values, cumulative = values[order], np.cumsum(weights[order])
+    half = cumulative[-1] / 2
+    i = int(np.searchsorted(cumulative, half))
+    if np.isclose(cumulative[i], half) and i + 1 < values.size:
+        return (values[i] + values[i + 1]) / 2
+    return values[i]
+
+
+def test_coverage_fractions_sum_to_polygon_area():
+    weights = coverage_fractions(POLYGONS, LATITUDES, LONGITUDES)
+    assert weights.fraction.max() <= 1.0
+    cell_area = 1.0  # square degrees
+    np.testing.assert_allclose(dense(weights).sum(axis=(1, 2)) * cell_area, [p.area for p in POLYGONS])
+
+
+def test_all_touched_weights_match_geometry_mask():
+    weights = all_touched_weights(POLYGONS, LATITUDES, LONGITUDES)
+    transform = Affine.translation(26.0, -27.0) * Affine.scale(1.0, -1.0)
+    for polygon, polygon_weights in zip(POLYGONS, dense(weights)):
+        touched = geometry_mask([polygon], out_shape=SHAPE, transform=transform, all_touched=True, invert=True)
+        np.testing.assert_array_equal(polygon_weights, touched.astype(float))
+
+
+@pytest.mark.parametrize("weights_function", [coverage_fractions, all_touched_weights])
+def test_median_and_share_match_brute_force(weights_function):
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 1, (3,) + SHAPE).round(1)  # ties
+    values[0, 1, 2] = np.nan
+    weights = weights_function(POLYGONS, LATITUDES, LONGITUDES)
+    polygon_weights = dense(weights)
+
+    medians = weights.median(values)
+    shares = weights.share(np.where(np.isnan(values), np.nan, values > 0.5))
+    assert medians.shape == shares.shape == (3, len(POLYGONS))
+    for lead in range(3):
+        for i, w in enumerate(polygon_weights):
+            assert medians[lead, i] == pytest.approx(weighted_median(values[lead].ravel(), w.ravel()))
+            valid = ~np.isnan(values[lead]) & (w > 0)
+            expected_share = (w * (values[lead] > 0.5))[valid].sum() / w[valid].sum()
+            assert shares[lead, i] == pytest.approx(expected_share)
+
+
+def test_median_with_equal_weights_is_nanmedian():
+    values = np.random.default_rng(1).uniform(0, 1, SHAPE)
+    values[0, 0] = np.nan
+    weights = all_touched_weights(POLYGONS, LATITUDES, LONGITUDES)
+    for i, w in enumerate(dense(weights)):
+        assert weights.median(values)[i] == pytest.approx(np.nanmedian(values[w > 0]))
+
+
+def test_admin_zonal_index_union_of_pcodes():
+    boundaries = gpd.GeoDataFrame(
+        {"adm1_pcode": ["A", "B", "C"]},
+        geometry=[shapely.box(27, -30, 28.5, -28), shapely.box(28.5, -30, 30, -28), shapely.box(27, -32, 30, -30)],
+        crs="EPSG:4326",
+    )
+    index = get_admin_zonal_index("TST", 1, boundaries, LATITUDES, LONGITUDES)
+    assert index.pcodes == ["A", "B", "C"]
+    union = index.union(["A", "B", "missing"])
+    expected = coverage_fractions([shapely.box(27, -30, 30, -28)], LATITUDES, LONGITUDES)
+    np.testing.assert_allclose(dense(union), dense(expected))
+    assert index.get_positions(["C", "missing"]).tolist() == [2, -1]